@@ -1,19 +1,30 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import secrets
 import hashlib
 
-from app.database import SessionLocal
+from app.database import open_session
+from app.keys import key_ring
 from app.models import User
 from app.schemas import TokenData
 
-# JWT Configuration
-SECRET_KEY = secrets.token_urlsafe(32)
+# JWT Configuration (signing keys live in app.keys so every worker shares them)
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# bcrypt releases the GIL, so a small dedicated pool keeps hashing off the event
+# loop without letting a login burst take over the default threadpool
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+password_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+
 # Try to use bcrypt, fallback to SHA256 if it fails
 try:
     from passlib.context import CryptContext
@@ -52,6 +63,16 @@ def get_password_hash(password):
     password_hash = hashlib.sha256(password.encode()).hexdigest()
     return f"sha256${password_hash}"
 
+async def verify_password_async(plain_password, hashed_password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        password_executor, verify_password, plain_password, hashed_password
+    )
+
+async def get_password_hash_async(password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -59,48 +80,55 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    kid, key = key_ring.signing_key
+    encoded_jwt = jwt.encode(to_encode, key, algorithm=ALGORITHM, headers={"kid": kid})
     return encoded_jwt
 
-async def get_user(db: Session, username: str):
-    return db.query(User).filter(User.username == username).first()
+async def get_user(db: AsyncSession, username: str):
+    return await db.scalar(select(User).where(User.username == username))
 
-async def authenticate_user(db: Session, username: str, password: str):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
     user = await get_user(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return False
     return user
 
 def verify_token(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        key = key_ring.get(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            return None
+        payload = jwt.decode(token, key, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             return None
-        token_data = TokenData(username=username)
+        expires_at = payload.get("exp")
+        if expires_at is not None:
+            expires_at = datetime.utcfromtimestamp(expires_at)
+        token_data = TokenData(username=username, expires_at=expires_at)
     except JWTError:
         return None
     return token_data
 
 async def create_default_admin():
-    db = SessionLocal()
+    db = open_session()
     try:
         admin_user = await get_user(db, "admin")
         if not admin_user:
-            hashed_password = get_password_hash("admin123")
+            hashed_password = await get_password_hash_async("admin123")
             admin_user = User(
                 username="admin",
                 hashed_password=hashed_password,
                 is_active=True
             )
             db.add(admin_user)
-            db.commit()
+            await db.commit()
             print("✓ Default admin user created: username='admin', password='admin123'")
         else:
             print("✓ Admin user already exists")
     except Exception as e:
         print(f"✗ Error creating admin user: {e}")
     finally:
-        db.close()
\ No newline at end of file
+        await db.close()
\ No newline at end of file
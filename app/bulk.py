@@ -0,0 +1,91 @@
+"""Batch writes for the bulk endpoints.
+
+A batch is validated as a whole by FastAPI, existing rows are looked up with
+one ``IN`` query per batch, and everything that passes is written through the
+ORM in a single flush and commit. The flush batches the INSERTs (and UPDATEs
+touching the same columns) into executemany calls, and unlike Core inserts it
+runs the flush listeners that keep tags, stored file references, excerpts,
+skill statistics and table versions in step.
+
+Items that can't be written (an unknown id, a taken name) are reported in the
+result and skipped; with ``atomic=true`` any such item fails the whole batch
+with 409 and nothing is written.
+"""
+import os
+from typing import Dict, Iterable
+
+from fastapi import HTTPException, status
+from sqlalchemy import select
+
+from app.cache import response_cache
+
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", 1000))  # items per request
+
+DUPLICATE_ITEM = "Appears more than once in the batch"
+
+
+async def load_by(db, column, keys: Iterable) -> Dict:
+    """Rows of ``column``'s model whose ``column`` is one of ``keys``, keyed by it"""
+    keys = {key for key in keys if key is not None}
+    if not keys:
+        return {}
+    rows = await db.scalars(select(column.class_).where(column.in_(keys)))
+    return {getattr(row, column.key): row for row in rows.all()}
+
+
+class BulkReport:
+    """Per-item outcome of a batch, in request order"""
+
+    def __init__(self, size: int):
+        self._results = [None] * size
+        self._written = []  # (index, status, instance); ids are read after the flush
+
+    def failed(self, index: int, detail: str, id: int = None):
+        self._results[index] = {"index": index, "status": "error", "id": id, "detail": detail}
+
+    def created(self, index: int, instance):
+        self._written.append((index, "created", instance))
+
+    def updated(self, index: int, instance):
+        self._written.append((index, "updated", instance))
+
+    def deleted(self, index: int, instance):
+        self._written.append((index, "deleted", instance))
+
+    def summary(self) -> dict:
+        results = [result for result in self._results if result is not None]
+        counts = {name: 0 for name in ("created", "updated", "deleted", "failed")}
+        for result in results:
+            counts["failed" if result["status"] == "error" else result["status"]] += 1
+        return {"results": results, **counts}
+
+    async def commit(self, db, namespace: str, atomic: bool = False) -> dict:
+        """Write the batch in one transaction and invalidate ``namespace``"""
+        if atomic and any(result is not None for result in self._results):
+            await db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=self.summary())
+        if self._written:
+            await db.flush()
+            for index, outcome, instance in self._written:
+                self._results[index] = {"index": index, "status": outcome, "id": instance.id, "detail": None}
+            await db.commit()
+            await response_cache.invalidate(namespace)
+        return self.summary()
+
+
+async def bulk_delete(db, model, ids, namespace: str, atomic: bool = False) -> dict:
+    """Delete rows of ``model`` by id; the ORM delete runs the same listeners
+    as a single delete"""
+    existing = await load_by(db, model.id, ids)
+    report = BulkReport(len(ids))
+    seen = set()
+    for index, row_id in enumerate(ids):
+        if row_id not in existing:
+            report.failed(index, f"{model.__name__} not found", row_id)
+        elif row_id in seen:
+            report.failed(index, DUPLICATE_ITEM, row_id)
+        else:
+            seen.add(row_id)
+            await db.delete(existing[row_id])
+            report.deleted(index, existing[row_id])
+    return await report.commit(db, namespace, atomic)
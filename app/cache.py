@@ -0,0 +1,238 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+
+from app.conditional import (
+    collection_validators, is_not_modified, not_modified_response, validator_headers
+)
+from app.metrics import record_serialization
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries also expire after a deadline"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (monotonic deadline, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                deadline, value = entry
+                if deadline > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl: float = None):
+        """Store ``value``; ``ttl`` may only shorten the cache-wide lifetime"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def discard_where(self, predicate):
+        """Drop every entry whose value matches ``predicate``; returns the count"""
+        with self._lock:
+            stale = [key for key, (_, value) in self._data.items() if predicate(value)]
+            for key in stale:
+                del self._data[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class MemoryBackend:
+    """In-process store; every worker keeps (and invalidates) its own copy"""
+
+    def __init__(self, maxsize: int = 512, ttl: float = 300):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generations = {}
+
+    async def get(self, key):
+        return self._entries.get(key)
+
+    async def set(self, key, value: bytes):
+        self._entries.set(key, value)
+
+    async def generations(self, namespaces):
+        return [self._generations.get(ns, 0) for ns in namespaces]
+
+    async def bump(self, namespace):
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        return self._generations[namespace]
+
+    def stats(self):
+        return self._entries.stats()
+
+
+class RedisBackend:
+    """Store shared by all workers; generations are Redis counters, so an
+    invalidation in one worker is seen by every other one"""
+
+    def __init__(self, url: str, ttl: float = 300, prefix: str = "portfolio:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("A redis:// RESPONSE_CACHE_BACKEND requires the 'redis' package")
+        self._redis = redis.from_url(url)
+        self.ttl = int(ttl)
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key):
+        value = await self._redis.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key, value: bytes):
+        await self._redis.set(self.prefix + key, value, ex=self.ttl)
+
+    async def generations(self, namespaces):
+        values = await self._redis.mget([f"{self.prefix}gen:{ns}" for ns in namespaces])
+        return [int(value or 0) for value in values]
+
+    async def bump(self, namespace):
+        return await self._redis.incr(f"{self.prefix}gen:{namespace}")
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def _pack(etag, last_modified, headers, body):
+    head = json.dumps(headers or {}, separators=(",", ":"))
+    return b"%s\n%s\n%s\n%s" % (etag.encode(), (last_modified or "").encode(), head.encode(), body)
+
+
+def _unpack(entry):
+    etag, last_modified, head, body = entry.split(b"\n", 3)
+    return etag.decode(), last_modified.decode() or None, json.loads(head), body
+
+
+class CachedResponse:
+    """Outcome of a cache lookup; ``response`` is None on a miss"""
+
+    def __init__(self, cache, key, etag, last_modified, response=None):
+        self._cache = cache
+        self.key = key
+        self.etag = etag
+        self.last_modified = last_modified
+        self.response = response
+
+    async def store(self, content, adapter: TypeAdapter = None, headers: dict = None):
+        """Serialize ``content``, remember it (and any extra ``headers``) under
+        this lookup's key and return it"""
+        start = time.perf_counter()
+        if adapter is not None:
+            body = adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+        else:
+            body = to_json(content)
+        record_serialization(time.perf_counter() - start)
+        await self._cache.backend.set(self.key, _pack(self.etag, self.last_modified, headers, body))
+        response_headers = validator_headers(self.etag, self.last_modified)
+        response_headers.update(headers or {})
+        response_headers["X-Cache"] = "MISS"
+        return Response(body, media_type="application/json", headers=response_headers)
+
+
+class ResponseCache:
+    """Serialized responses keyed by route, query string and the generation of
+    each namespace they were built from. Bumping a namespace's generation makes
+    every key built on it unreachable, which is how writes invalidate.
+
+    Namespaces are table names: on a miss their table_versions rows provide the
+    ETag/Last-Modified, which are then cached with the body, so conditional
+    requests are answered with a 304 before any rows are read or serialized."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def lookup(self, request: Request, db, *namespaces) -> CachedResponse:
+        # Generations are read before the data, so a write racing with the read
+        # can only leave the stale body under a key that is already retired
+        generations = await self.backend.generations(namespaces)
+        params = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        versions = ",".join(f"{ns}:{gen}" for ns, gen in zip(namespaces, generations))
+        key = f"{request.url.path}?{params}#{versions}"
+        entry = await self.backend.get(key)
+        if entry is not None:
+            etag, last_modified, extra_headers, body = _unpack(entry)
+            if is_not_modified(request, etag, last_modified):
+                response = not_modified_response(etag, last_modified)
+            else:
+                headers = validator_headers(etag, last_modified)
+                headers.update(extra_headers)
+                headers["X-Cache"] = "HIT"
+                response = Response(body, media_type="application/json", headers=headers)
+            return CachedResponse(self, key, etag, last_modified, response)
+
+        etag, last_modified = await collection_validators(db, request, namespaces)
+        if is_not_modified(request, etag, last_modified):
+            return CachedResponse(self, key, etag, last_modified, not_modified_response(etag, last_modified))
+        return CachedResponse(self, key, etag, last_modified)
+
+    async def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            await self.backend.bump(namespace)
+
+    def stats(self):
+        return self.backend.stats()
+
+
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 300))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 512))
+
+
+def _make_backend(spec):
+    if spec == "memory":
+        return MemoryBackend(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(spec, ttl=RESPONSE_CACHE_TTL)
+    raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {spec!r}")
+
+
+response_cache = ResponseCache(_make_backend(RESPONSE_CACHE_BACKEND))
@@ -0,0 +1,154 @@
+"""Compression of API responses negotiated from ``Accept-Encoding``.
+
+Brotli is preferred when the ``brotli`` package is installed and the client
+accepts it, then gzip. Only textual types are compressed, and only bodies of
+at least ``COMPRESSION_MINIMUM_SIZE`` bytes, below which the framing overhead
+outweighs the saving. Streamed responses are compressed chunk by chunk and
+flushed after each one, so clients still receive rows as they are produced.
+
+Responses that already carry a ``Content-Encoding`` (the precompressed static
+siblings served by ``app.media``) and partial responses pass through untouched.
+A compressed response gets a weak ETag: it is no longer byte-identical to the
+representation the strong tag was computed for, while ``If-None-Match`` uses
+the weak comparison, so revalidation keeps working.
+"""
+import os
+import zlib
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.media import BROTLI_AVAILABLE, accepted_encodings
+
+if BROTLI_AVAILABLE:
+    import brotli
+
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", 1024))  # bytes
+# Level 6 costs about twice the time of 5 on a post page for ~7% fewer bytes
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 5))
+# 4-5 is the usual trade-off for on-the-fly brotli; 11 is meant for static files
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+# zlib and brotli release the GIL; bodies this large are compressed on the
+# threadpool instead of holding up the event loop
+OFFLOAD_SIZE = 64 * 1024
+
+
+def negotiate_encoding(header: str):
+    accepted = accepted_encodings(header)
+    if BROTLI_AVAILABLE and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._brotli = None
+            # wbits=31: zlib stream with a gzip header and trailer
+            self._zlib = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        if self._brotli is not None:
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if last else self._brotli.flush())
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    return _Compressor(encoding).compress(data, last=True)
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+            if encoding is not None:
+                responder = _CompressingResponder(send, encoding, self.minimum_size)
+                await self.app(scope, receive, responder)
+                return
+        await self.app(scope, receive, send)
+
+
+class _CompressingResponder:
+    """Wraps ``send``: holds back the response start until the first body
+    chunk shows whether, and how, the response is compressed"""
+
+    def __init__(self, send: Send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Message = None
+        self.compressor: _Compressor = None
+        self.passthrough = False
+
+    def _compressible(self, headers: MutableHeaders) -> bool:
+        if self.start["status"] in (204, 206, 304) or "content-encoding" in headers:
+            return False
+        media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        return media_type.startswith(COMPRESSIBLE_TYPES)
+
+    def _encode_headers(self, headers: MutableHeaders):
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = "W/" + etag
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if self.passthrough or self.compressor is not None:
+            if self.compressor is not None and message["type"] == "http.response.body":
+                more_body = message.get("more_body", False)
+                body = self.compressor.compress(message.get("body", b""), last=not more_body)
+                message = {"type": "http.response.body", "body": body, "more_body": more_body}
+            await self.send(message)
+            return
+
+        # First message after the start: decide
+        headers = MutableHeaders(raw=self.start["headers"])
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if (
+            message["type"] != "http.response.body"
+            or not self._compressible(headers)
+            or (not more_body and len(body) < self.minimum_size)
+        ):
+            self.passthrough = True
+            await self.send(self.start)
+            await self.send(message)
+            return
+
+        self.compressor = _Compressor(self.encoding)
+        self._encode_headers(headers)
+        if more_body:
+            # Streamed: the final length isn't known up front
+            del headers["Content-Length"]
+            body = self.compressor.compress(body, last=False)
+        elif len(body) >= OFFLOAD_SIZE:
+            body = await run_in_threadpool(self.compressor.compress, body, True)
+        else:
+            body = self.compressor.compress(body, last=True)
+        if not more_body:
+            headers["Content-Length"] = str(len(body))
+        await self.send(self.start)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
@@ -0,0 +1,117 @@
+import hashlib
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from app.models import TableVersion
+
+# Tables whose writes bump a row in table_versions; collection validators are
+# derived from those rows, so they change with every create/update/delete
+VERSIONED_TABLES = ("posts", "certificates", "skills")
+# Version rows bumped by something other than a table write: post view counts,
+# written in batches by app/view_counts.py. Responses that show or sort by the
+# counts are built on this one as well as "posts"; the rest are left alone.
+POST_VIEWS = "post_views"
+
+
+def bump_table_version(connection, table_name: str):
+    result = connection.execute(
+        update(TableVersion)
+        .where(TableVersion.table_name == table_name)
+        .values(version=TableVersion.version + 1, updated_at=func.now())
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(TableVersion).values(table_name=table_name, version=1))
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_versions_on_flush(session, flush_context, instances):
+    touched = {obj.__table__.name for obj in session.new}
+    touched.update(obj.__table__.name for obj in session.deleted)
+    touched.update(obj.__table__.name for obj in session.dirty if session.is_modified(obj))
+    for table_name in sorted(touched.intersection(VERSIONED_TABLES)):
+        bump_table_version(session.connection(), table_name)
+
+
+def ensure_table_versions(connection):
+    """Create missing version rows up front so writers only ever UPDATE them"""
+    existing = set(connection.execute(select(TableVersion.table_name)).scalars())
+    for table_name in VERSIONED_TABLES + (POST_VIEWS,):
+        if table_name not in existing:
+            connection.execute(insert(TableVersion).values(table_name=table_name, version=0))
+
+
+def http_date(value) -> Optional[str]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        # SQLite hands back naive UTC timestamps
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _etag(*parts) -> str:
+    return '"%s"' % hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[str]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence and uses the weak comparison
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        tags.update(tag[2:] for tag in list(tags) if tag.startswith("W/"))
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def validator_headers(etag: str, last_modified: Optional[str]) -> dict:
+    # no-cache: clients may store the body but must revalidate, which is cheap
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    return headers
+
+
+def not_modified_response(etag: str, last_modified: Optional[str]) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+async def collection_validators(db, request: Request, tables):
+    """Strong ETag and Last-Modified for a collection built from ``tables``"""
+    result = await db.execute(
+        select(TableVersion.table_name, TableVersion.version, TableVersion.updated_at)
+        .where(TableVersion.table_name.in_(tables))
+        .order_by(TableVersion.table_name)
+    )
+    rows = result.all()
+    query = sorted(request.query_params.multi_items())
+    etag = _etag(request.url.path, query, [tuple(row) for row in rows])
+    last_modified = max((row.updated_at for row in rows if row.updated_at), default=None)
+    return etag, http_date(last_modified)
+
+
+def check_item(request: Request, response: Response, instance) -> Optional[Response]:
+    """Set validators for a single row on ``response``; returns a 304 response
+    when the client's copy is current, otherwise None"""
+    mapper = instance.__mapper__
+    values = [getattr(instance, attr.key) for attr in mapper.column_attrs]
+    etag = _etag(instance.__table__.name, values)
+    # Rows without updated_at can change without a newer timestamp, so they only get an ETag
+    last_modified = None
+    if "updated_at" in mapper.columns:
+        last_modified = http_date(instance.updated_at or instance.created_at)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    response.headers.update(validator_headers(etag, last_modified))
+    return None
@@ -1,20 +1,235 @@
-from sqlalchemy import create_engine
+import asyncio
+import os
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./portfolio.db"
+# Async drivers used when ASYNC_DATABASE_URL is not given explicitly
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+
+def _async_url(url):
+    url = make_url(url)
+    drivername = ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./portfolio.db")
+ASYNC_SQLALCHEMY_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(SQLALCHEMY_DATABASE_URL))
+IS_SQLITE = make_url(SQLALCHEMY_DATABASE_URL).get_backend_name() == "sqlite"
+
+# Serve requests through the aiosqlite-backed AsyncSession. Set DATABASE_ASYNC=false
+# to fall back to the blocking Session, which is then driven from the threadpool.
+DATABASE_ASYNC = os.getenv("DATABASE_ASYNC", "true").lower() in ("1", "true", "yes")
+
+# Engine profile: pool sizing applies to every backend, pragmas only to SQLite
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", 5))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", 10))
+DATABASE_POOL_TIMEOUT = int(os.getenv("DATABASE_POOL_TIMEOUT", 30))
+DATABASE_POOL_RECYCLE = int(os.getenv("DATABASE_POOL_RECYCLE", 1800))
+
+# WAL lets readers keep going while an admin write is in progress
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000)),  # milliseconds
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 268435456)),  # 256MB
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", -65536)),  # negative = KiB, i.e. 64MB
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+    "foreign_keys": os.getenv("SQLITE_FOREIGN_KEYS", "ON"),
+}
+
+
+def _engine_options(url, is_async=False):
+    url = make_url(url)
+    options = {}
+    if IS_SQLITE:
+        options["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            # In-memory databases live on a single connection; there is no pool to size
+            return options
+        # aiosqlite would otherwise default to NullPool and reconnect (and re-run
+        # the pragmas) on every checkout
+        options["poolclass"] = AsyncAdaptedQueuePool if is_async else QueuePool
+    else:
+        options["pool_pre_ping"] = True
+    options.update(
+        pool_size=DATABASE_POOL_SIZE,
+        max_overflow=DATABASE_MAX_OVERFLOW,
+        pool_timeout=DATABASE_POOL_TIMEOUT,
+        pool_recycle=DATABASE_POOL_RECYCLE,
+    )
+    return options
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Work session listeners hand over to run once the transaction has ended
+_DEFERRED = "run_after_transaction"
+
+
+def run_after_transaction(session, fn, *args):
+    """For session event listeners with blocking work (file IO, queries on
+    other connections): run ``fn(*args)`` now when the listener is already on
+    a worker thread, or, when an AsyncSession fired it on the event loop, on
+    the threadpool after the commit, rollback or close that ended the
+    transaction returns"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        fn(*args)
+        return
+    session.info.setdefault(_DEFERRED, []).append((fn, args))
+
+
+def _run_all(work):
+    for fn, args in work:
+        fn(*args)
+
+
+class AppAsyncSession(AsyncSession):
+    """AsyncSession that runs work deferred by ``run_after_transaction`` on the
+    threadpool once a commit, rollback or close returns"""
+
+    async def _run_deferred(self):
+        work = self.sync_session.info.pop(_DEFERRED, None)
+        if work:
+            await run_in_threadpool(_run_all, work)
+
+    async def commit(self):
+        try:
+            await super().commit()
+        finally:
+            await self._run_deferred()
+
+    async def rollback(self):
+        try:
+            await super().rollback()
+        finally:
+            await self._run_deferred()
+
+    async def close(self):
+        try:
+            await super().close()
+        finally:
+            await self._run_deferred()
+
+
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL, **_engine_options(ASYNC_SQLALCHEMY_DATABASE_URL, is_async=True)
+)
+# Objects stay loaded after commit so handlers never trigger implicit IO
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AppAsyncSession, autoflush=False, expire_on_commit=False
+)
+ThreadedSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+
 Base = declarative_base()
 
+
+def _buffered(result):
+    # Fetch rows on the worker thread so the caller never touches the cursor
+    if getattr(result, "returns_rows", True):
+        return result.freeze()()
+    return result
+
+
+class ThreadedSession:
+    """AsyncSession-compatible wrapper running a blocking Session on the threadpool"""
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, *args, **kwargs):
+        return await run_in_threadpool(
+            lambda: _buffered(self.sync_session.execute(statement, *args, **kwargs))
+        )
+
+    async def scalars(self, statement, *args, **kwargs):
+        result = await self.execute(statement, *args, **kwargs)
+        return result.scalars()
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, *args, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self, objects=None):
+        await run_in_threadpool(self.sync_session.flush, objects)
+
+    async def refresh(self, instance, attribute_names=None):
+        await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+
+def open_session():
+    """Return a session for the configured mode, to be used with ``async with``"""
+    if DATABASE_ASYNC:
+        return AsyncSessionLocal()
+    return ThreadedSession(ThreadedSessionLocal())
+
+
+async def begin_read_snapshot(db):
+    """Make every following read in ``db`` see the same committed state.
+
+    pysqlite only opens a transaction before a write, so each SELECT would
+    otherwise see the latest commit; under WAL an explicit BEGIN pins one
+    snapshot without blocking writers. Other backends need REPEATABLE READ."""
+    if IS_SQLITE:
+        await db.execute(text("BEGIN"))
+    else:
+        await db.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ"))
+
+
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with open_session() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
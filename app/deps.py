@@ -1,18 +1,46 @@
+import os
+from datetime import datetime
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.cache import TTLCache
 from app.database import get_db
 from app.auth import verify_token
 from app.models import User
+from app.schemas import User as UserSchema
 
 security = HTTPBearer()
 
+# Authenticated principals keyed by bearer token. Entries never outlive their
+# token and are dropped when the user row changes in this process; other worker
+# processes pick the change up within PRINCIPAL_CACHE_TTL seconds.
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 1024))
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", 60))
+
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+
+def invalidate_user(user_id: int):
+    return principal_cache.discard_where(lambda entry: entry[1].id == user_id)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target):
+    invalidate_user(target.id)
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     token = credentials.credentials
+    cached = principal_cache.get(token)
+    if cached is not None:
+        return cached[1]
+
     token_data = verify_token(token)
     if token_data is None:
         raise HTTPException(
@@ -21,7 +49,7 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = db.query(User).filter(User.username == token_data.username).first()
+    user = await db.scalar(select(User).where(User.username == token_data.username))
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -29,9 +57,15 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    return user
+    # Detached snapshot, so cached principals never reach back into a closed session
+    principal = UserSchema.model_validate(user)
+    ttl = None
+    if token_data.expires_at is not None:
+        ttl = (token_data.expires_at - datetime.utcnow()).total_seconds()
+    principal_cache.set(token, (token_data, principal), ttl=ttl)
+    return principal
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user
\ No newline at end of file
+    return current_user
@@ -0,0 +1,55 @@
+import os
+import re
+from typing import Optional
+
+from sqlalchemy import bindparam, event, inspect, select, update
+from sqlalchemy.orm import Session
+
+from app.models import Post
+
+POST_EXCERPT_LENGTH = int(os.getenv("POST_EXCERPT_LENGTH", 280))  # characters
+
+# Markdown that shouldn't show up in plain-text previews
+_IMAGE = re.compile(r"!\[([^\]]*)\]\([^)]*\)")
+_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_MARKUP = re.compile(r"^\s{0,3}(#{1,6}|>|[-*+]|\d+\.)\s+|[*`~]+", re.MULTILINE)
+
+
+def make_excerpt(content: Optional[str], length: int = POST_EXCERPT_LENGTH) -> Optional[str]:
+    """Plain-text start of ``content``, cut at a word boundary with an ellipsis"""
+    if content is None:
+        return None
+    text = _LINK.sub(r"\1", _IMAGE.sub(r"\1", content))
+    text = " ".join(_MARKUP.sub("", text).split())
+    if len(text) <= length:
+        return text
+    cut = text[:length + 1]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut[:length].rstrip(" ,.;:-") + "…"
+
+
+@event.listens_for(Session, "before_flush")
+def _write_excerpts(session, flush_context, instances):
+    # Kept in step with the content, so list pages never need to read it
+    for obj in session.new:
+        if isinstance(obj, Post):
+            obj.excerpt = make_excerpt(obj.content)
+    for obj in session.dirty:
+        if isinstance(obj, Post) and inspect(obj).attrs.content.history.has_changes():
+            obj.excerpt = make_excerpt(obj.content)
+
+
+def backfill_post_excerpts(connection):
+    """Excerpts for posts written before the column existed"""
+    rows = connection.execute(select(Post.id, Post.content).where(Post.excerpt.is_(None))).all()
+    if not rows:
+        return
+    posts = Post.__table__
+    connection.execute(
+        update(posts)
+        .where(posts.c.id == bindparam("post_id"))
+        # An explicit value keeps the onupdate from touching updated_at
+        .values(excerpt=bindparam("excerpt"), updated_at=posts.c.updated_at),
+        [{"post_id": post_id, "excerpt": make_excerpt(content)} for post_id, content in rows],
+    )
@@ -0,0 +1,36 @@
+"""Sparse fieldsets for list endpoints.
+
+``?fields=title,category`` returns only those attributes (plus ``id``). The
+selection becomes a ``load_only`` on the query, so columns nobody asked for,
+a post's full ``content`` in particular, are never read from the database
+rather than read and then dropped before serialization. The endpoints
+declare their rows as the full schema or its ``...Fields`` counterpart in
+app/schemas.py, where everything but ``id`` is optional.
+"""
+from typing import Iterable, List, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy.orm import load_only
+
+
+def select_fields(fields: Optional[str], allowed: Sequence[str], default: Optional[Sequence[str]] = None):
+    """``id`` and the names listed in ``fields`` (comma-separated), or
+    ``default`` when it's empty; None stands for every field"""
+    if not fields:
+        return default
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return ["id"] + [name for name in allowed if name in names and name != "id"]
+
+
+def load_fields(query, model, names: Optional[Sequence[str]]):
+    """Restrict the columns ``query`` loads for ``model`` to ``names``"""
+    if names is None:
+        return query
+    return query.options(load_only(*(getattr(model, name) for name in names)))
+
+
+def field_rows(objects: Iterable, names: Sequence[str]) -> List[dict]:
+    return [{name: getattr(obj, name) for name in names} for obj in objects]
@@ -0,0 +1,163 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from app.cache import response_cache
+from app.database import open_session
+from app.media import precompress
+
+# Pillow drives the whole pipeline; without it uploads are served as-is
+try:
+    from PIL import Image, ImageOps, features
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# PyMuPDF renders the first page of PDF certificates; without it PDFs get no preview
+try:
+    import pymupdf
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    try:
+        import fitz as pymupdf
+        PYMUPDF_AVAILABLE = True
+    except ImportError:
+        PYMUPDF_AVAILABLE = False
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+# Longest edge in pixels for each variant; images are never upscaled
+IMAGE_VARIANT_SIZES = {"thumbnail": 320, "medium": 960, "full": 1920}
+IMAGE_VARIANT_FORMATS = [fmt.strip() for fmt in os.getenv("IMAGE_VARIANT_FORMATS", "webp").split(",") if fmt.strip()]
+IMAGE_QUALITY = {"webp": 80, "avif": 60}
+PDF_PREVIEW_DPI = 150
+
+UPLOAD_ROOT = "app/uploads"  # Mounted at /static
+VARIANTS_DIRNAME = "variants"
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _supported_formats():
+    supported = []
+    for fmt in IMAGE_VARIANT_FORMATS:
+        try:
+            if features.check(fmt):
+                supported.append(fmt)
+        except ValueError:
+            pass
+    return supported
+
+
+def _open_source(source: Path):
+    if source.suffix.lower() == ".pdf":
+        if not PYMUPDF_AVAILABLE:
+            return None
+        with pymupdf.open(source) as document:
+            pixmap = document[0].get_pixmap(dpi=PDF_PREVIEW_DPI)
+            return Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+    image = Image.open(source)
+    # Bake the EXIF orientation in, since re-encoding drops the EXIF block
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "P") else "RGB")
+    return image
+
+
+def generate_variants(source_path: str, output_dir: str, url_prefix: str):
+    """Resize and re-encode ``source_path`` into every configured size/format.
+
+    Runs in a worker process. Re-encoding writes pixels only, so EXIF, GPS and
+    other metadata never reach the variants. Returns a list of variant dicts
+    (name, format, width, height, url), empty if the source can't be decoded."""
+    if not PIL_AVAILABLE:
+        return []
+    source = Path(source_path)
+    image = _open_source(source)
+    if image is None:
+        return []
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    variants = []
+    with image:
+        for name, edge in IMAGE_VARIANT_SIZES.items():
+            resized = image.copy()
+            resized.thumbnail((edge, edge), Image.LANCZOS)
+            for fmt in _supported_formats():
+                filename = f"{source.stem}-{name}.{fmt}"
+                # Stored files are named by content hash, so an existing variant is already right
+                if not (output / filename).exists():
+                    partial = output / f".{filename}.tmp"
+                    resized.save(partial, format=fmt.upper(), quality=IMAGE_QUALITY.get(fmt, 80))
+                    os.replace(partial, output / filename)
+                variants.append({
+                    "name": name,
+                    "format": fmt,
+                    "width": resized.width,
+                    "height": resized.height,
+                    "url": f"{url_prefix}/{filename}",
+                })
+            resized.close()
+    return variants
+
+
+def variant_location(file_location: str):
+    """Directory and URL prefix for the variants of an upload saved at
+    ``file_location`` (e.g. app/uploads/posts/x.png)"""
+    path = Path(file_location)
+    return str(path.parent / VARIANTS_DIRNAME), f"/static/{path.parent.name}/{VARIANTS_DIRNAME}"
+
+
+def remove_variants(variants):
+    for variant in variants or []:
+        path = UPLOAD_ROOT + variant["url"].removeprefix("/static")
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Warning: Could not delete image variant: {str(e)}")
+
+
+async def process_upload(model, object_id: int, file_location: str, image_url: str, namespace: str):
+    """Background task: build variants for a saved upload and attach them to
+    the row, unless the row has since been deleted or given another file"""
+    output_dir, url_prefix = variant_location(file_location)
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(get_executor(), precompress, file_location)
+    except Exception as e:
+        print(f"✗ Error precompressing upload {file_location}: {e}")
+    try:
+        variants = await loop.run_in_executor(
+            get_executor(), generate_variants, file_location, output_dir, url_prefix
+        )
+    except Exception as e:
+        print(f"✗ Error processing upload {file_location}: {e}")
+        return
+    if not variants:
+        return
+
+    async with open_session() as db:
+        obj = await db.get(model, object_id)
+        if obj is None or obj.image_url != image_url:
+            # Other rows may share the file; only clean up if it is gone for good
+            if not os.path.exists(file_location):
+                remove_variants(variants)
+            return
+        obj.variants = variants
+        await db.commit()
+    await response_cache.invalidate(namespace)
@@ -0,0 +1,132 @@
+"""JWT signing keys shared by every worker process.
+
+Keys come from, in order of precedence:
+
+- ``JWT_KEYS`` - ``kid:secret`` pairs separated by commas; the first pair (or
+  ``JWT_CURRENT_KID``) signs new tokens, the rest only verify
+- ``SECRET_KEY`` - a single signing key, with optional ``SECRET_KEY_PREVIOUS``
+  still accepted for verification
+- ``JWT_KEY_FILE`` (default ``./jwt_keys.json``) - created on first start by
+  whichever worker gets there first and read by all others
+
+Rotate file-based keys with ``python -m app.keys rotate``; running workers notice
+the new file (one ``stat`` per lookup) and switch to it.
+"""
+import json
+import os
+import secrets
+import sys
+import tempfile
+from typing import Dict, Optional
+
+JWT_KEY_FILE = os.getenv("JWT_KEY_FILE", "./jwt_keys.json")
+# Rotated-out keys kept for verification, enough to outlive issued tokens
+JWT_KEEP_PREVIOUS = int(os.getenv("JWT_KEEP_PREVIOUS", 1))
+
+
+def _new_kid():
+    return secrets.token_hex(4)
+
+
+def _write_atomic(path, payload, replace=True):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".jwt_keys.")
+    try:
+        with os.fdopen(fd, "w") as fh:
+            json.dump(payload, fh)
+        os.chmod(tmp_path, 0o600)
+        if replace:
+            os.replace(tmp_path, path)
+        else:
+            # link() refuses to clobber, so concurrent workers agree on one ring
+            os.link(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class KeyRing:
+    def __init__(self, keys: Dict[str, str], current_kid: str, path: Optional[str] = None):
+        if current_kid not in keys:
+            raise ValueError(f"Current key id {current_kid!r} is not in the key ring")
+        self.keys = keys
+        self.current_kid = current_kid
+        self.path = path
+        self._mtime = self._file_mtime()
+
+    @classmethod
+    def from_env(cls):
+        if os.getenv("JWT_KEYS"):
+            keys = {}
+            for pair in os.environ["JWT_KEYS"].split(","):
+                kid, _, secret = pair.strip().partition(":")
+                if not kid or not secret:
+                    raise ValueError("JWT_KEYS must be comma-separated kid:secret pairs")
+                keys[kid] = secret
+            return cls(keys, os.getenv("JWT_CURRENT_KID", next(iter(keys))))
+        if os.getenv("SECRET_KEY"):
+            keys = {"current": os.environ["SECRET_KEY"]}
+            if os.getenv("SECRET_KEY_PREVIOUS"):
+                keys["previous"] = os.environ["SECRET_KEY_PREVIOUS"]
+            return cls(keys, "current")
+        return cls.from_file(JWT_KEY_FILE)
+
+    @classmethod
+    def from_file(cls, path):
+        if not os.path.exists(path):
+            kid = _new_kid()
+            try:
+                _write_atomic(path, {"current": kid, "keys": {kid: secrets.token_urlsafe(32)}}, replace=False)
+            except FileExistsError:
+                pass
+        with open(path) as fh:
+            data = json.load(fh)
+        return cls(data["keys"], data["current"], path=path)
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns if self.path else None
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        """Re-read the key file if another process rotated it"""
+        if self.path is None or self._file_mtime() == self._mtime:
+            return False
+        fresh = KeyRing.from_file(self.path)
+        self.keys, self.current_kid, self._mtime = fresh.keys, fresh.current_kid, fresh._mtime
+        return True
+
+    @property
+    def signing_key(self):
+        self.reload()
+        return self.current_kid, self.keys[self.current_kid]
+
+    def get(self, kid: Optional[str]) -> Optional[str]:
+        self.reload()
+        if kid is None:
+            # Tokens issued before key ids were introduced
+            return self.keys[self.current_kid]
+        return self.keys.get(kid)
+
+    def rotate(self, keep_previous: int = JWT_KEEP_PREVIOUS):
+        if self.path is None:
+            raise RuntimeError("Keys configured through the environment must be rotated there")
+        kid = _new_kid()
+        previous = [k for k in self.keys if k != self.current_kid][:max(keep_previous - 1, 0)]
+        keys = {kid: secrets.token_urlsafe(32), self.current_kid: self.keys[self.current_kid]}
+        keys.update({k: self.keys[k] for k in previous})
+        if keep_previous <= 0:
+            del keys[self.current_kid]
+        _write_atomic(self.path, {"current": kid, "keys": keys})
+        self.keys, self.current_kid, self._mtime = keys, kid, self._file_mtime()
+        return kid
+
+
+key_ring = KeyRing.from_env()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rotate"]:
+        sys.exit("usage: python -m app.keys rotate")
+    print(f"✓ New signing key: {key_ring.rotate()}")
@@ -1,21 +1,49 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse
 import os
+import secrets
 
-from app.database import engine, Base
-from app.routers import auth, posts, certificates, skills
-from app.auth import create_default_admin
+from app.database import engine, async_engine
+from app.routers import auth, posts, certificates, skills, uploads, portfolio, transfer
+from app.auth import create_default_admin, password_executor
+from app.compression import CompressionMiddleware
+from app.images import PYMUPDF_AVAILABLE, UPLOAD_ROOT, shutdown_executor
+from app.media import MediaFiles
+from app.metrics import MetricsMiddleware, instrument_engine, render_metrics
+from app.migrations import run_migrations
+from app.pagination import NEXT_CURSOR_HEADER
+from app.responses import FastJSONResponse
+from app.storage import UploadLimitMiddleware
+from app.view_counts import view_counter
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Create database tables and indexes
+run_migrations(engine)
+
+# Statement counts, timings and the slow-query log (see app/metrics.py)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+# Set to require "Authorization: Bearer <token>" on /api/metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
 # Create upload directories if they don't exist
 os.makedirs("app/uploads/posts", exist_ok=True)
 os.makedirs("app/uploads/certificates", exist_ok=True)
 os.makedirs("app/uploads/skills", exist_ok=True)  # Add skills directory
 
-app = FastAPI(title="Pithak Chhorn Portfolio API", version="1.0.0")
+# Rendered with orjson when installed (see app/responses.py)
+app = FastAPI(
+    title="Pithak Chhorn Portfolio API",
+    version="1.0.0",
+    default_response_class=FastJSONResponse,
+)
+
+# Multipart bodies past the largest upload are refused while they arrive (see app/storage.py)
+app.add_middleware(UploadLimitMiddleware)
+
+# br/gzip for JSON and other text bodies past a size threshold (see app/compression.py)
+app.add_middleware(CompressionMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -24,16 +52,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="app/uploads"), name="static")
+# Outermost, so latencies cover everything above including compression
+app.add_middleware(MetricsMiddleware)
+
+# Mount static files: long-lived caching for content-hashed names, ranges and
+# precompressed siblings (see app/media.py)
+app.mount("/static", MediaFiles(directory=UPLOAD_ROOT), name="static")
 
 # Include routers
 app.include_router(auth.router, prefix="/api", tags=["auth"])
 app.include_router(posts.router, prefix="/api", tags=["posts"])
 app.include_router(certificates.router, prefix="/api", tags=["certificates"])
 app.include_router(skills.router, prefix="/api", tags=["skills"])
+app.include_router(uploads.router, prefix="/api", tags=["uploads"])
+app.include_router(portfolio.router, prefix="/api", tags=["portfolio"])
+app.include_router(transfer.router, prefix="/api", tags=["transfer"])
 
 @app.on_event("startup")
 async def startup_event():
@@ -41,6 +77,20 @@ async def startup_event():
     await create_default_admin()
     # Seed initial skills
     await seed_initial_skills()
+    if not PYMUPDF_AVAILABLE:
+        print("✗ PyMuPDF is not installed; PDF certificates get no preview images (pip install pymupdf)")
+    # Write buffered post view counts every VIEW_FLUSH_INTERVAL seconds
+    view_counter.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Last flush of buffered view counts, while the engine is still open
+    await view_counter.stop()
+    # Close pooled connections so the aiosqlite worker threads exit
+    await async_engine.dispose()
+    engine.dispose()
+    password_executor.shutdown(wait=False)
+    shutdown_executor()
 
 @app.get("/")
 async def root():
@@ -50,14 +100,24 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    """Request latency, SQL and serialization metrics in the Prometheus text format"""
+    if METRICS_TOKEN:
+        authorization = request.headers.get("authorization", "")
+        if not secrets.compare_digest(authorization, f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 async def seed_initial_skills():
     """Seed database with initial skills if empty"""
-    from app.database import SessionLocal
+    from sqlalchemy import func, select
+    from app.database import open_session
     from app.models import Skill
     
-    db = SessionLocal()
+    db = open_session()
     try:
-        skill_count = db.query(Skill).count()
+        skill_count = await db.scalar(select(func.count(Skill.id)))
         if skill_count == 0:
             initial_skills = [
                 Skill(name="Python", category="Programming", proficiency=90, color="#3776AB", order=1, is_featured=True),
@@ -72,11 +132,11 @@ async def seed_initial_skills():
                 Skill(name="PostgreSQL", category="Database", proficiency=75, color="#4169E1", order=10),
             ]
             db.add_all(initial_skills)
-            db.commit()
+            await db.commit()
             print("✓ Initial skills seeded successfully")
         else:
             print(f"✓ Database already has {skill_count} skills")
     except Exception as e:
         print(f"✗ Error seeding skills: {e}")
     finally:
-        db.close()
\ No newline at end of file
+        await db.close()
\ No newline at end of file
@@ -0,0 +1,244 @@
+"""Serving of uploaded files under ``/static``.
+
+On top of ``StaticFiles`` this adds:
+
+- ``Cache-Control: immutable`` with a one-year max-age for content-addressed
+  names (stored files and their variants), which never change under a URL
+- strong ETags (the content hash where there is one) and ``If-None-Match`` /
+  ``If-Modified-Since`` handling
+- single byte ranges (``Range`` / ``If-Range``), answered with ``206``
+- precompressed ``.br`` / ``.gz`` siblings of compressible files, chosen by
+  ``Accept-Encoding``; create them for existing files with
+  ``python -m app.media precompress``
+- zero-copy sends through the ASGI ``http.response.zerocopysend`` or
+  ``http.response.pathsend`` extensions when the server offers them
+"""
+import gzip
+import os
+import re
+import stat
+import sys
+from calendar import timegm
+from email.utils import formatdate, parsedate
+from mimetypes import guess_type
+from typing import Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Receive, Scope, Send
+
+# brotli is optional; without it only .gz siblings are written and served
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+STATIC_IMMUTABLE_MAX_AGE = int(os.getenv("STATIC_IMMUTABLE_MAX_AGE", 31536000))  # seconds
+# Types worth a precompressed sibling; images are already compressed
+PRECOMPRESS_SUFFIXES = (".svg", ".pdf")
+# Keep a sibling only if it is at most this fraction of the original
+PRECOMPRESS_MAX_RATIO = 0.9
+# Preference order when the client accepts several
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# <sha256><ext> for stored files, <sha256>-<variant>.<fmt> for image variants
+_HASHED_NAME = re.compile(r"^(?P<digest>[0-9a-f]{64})(-[\w-]+)?(\.\w+)?$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def accepted_encodings(header: str) -> set:
+    """Content codings an Accept-Encoding header allows (q=0 excludes one)"""
+    accepted = set()
+    for token in header.split(","):
+        coding, _, params = token.partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def precompress(path: str):
+    """Write .br/.gz siblings next to ``path`` if its type benefits"""
+    if not path.lower().endswith(PRECOMPRESS_SUFFIXES):
+        return []
+    with open(path, "rb") as fh:
+        data = fh.read()
+    written = []
+    for encoding, suffix in ENCODINGS:
+        if encoding == "br" and not BROTLI_AVAILABLE:
+            continue
+        compressed = _compress(data, encoding)
+        if len(compressed) > len(data) * PRECOMPRESS_MAX_RATIO:
+            continue
+        partial = f"{path}{suffix}.tmp"
+        with open(partial, "wb") as out:
+            out.write(compressed)
+        os.replace(partial, path + suffix)
+        written.append(path + suffix)
+    return written
+
+
+def _etag(path: str, stat_result: os.stat_result, encoding: Optional[str]) -> str:
+    name = os.path.basename(path)
+    if _HASHED_NAME.match(name):
+        # The name already identifies the bytes
+        tag = name.split(".")[0]
+    else:
+        tag = "%x-%x" % (stat_result.st_mtime_ns, stat_result.st_size)
+    return f'"{tag}-{encoding}"' if encoding else f'"{tag}"'
+
+
+def _byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """(start, end inclusive) for a single-range header; None to send the
+    whole file; raises 416 when the range can't be satisfied"""
+    match = _RANGE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        # Multiple or malformed ranges: the full response is always allowed
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+class MediaFileResponse(Response):
+    chunk_size = 64 * 1024
+
+    def __init__(self, path: str, headers: dict, status_code: int = 200,
+                 offset: int = 0, count: int = 0, send_body: bool = True):
+        self.path = path
+        self.status_code = status_code
+        self.offset = offset
+        self.count = count
+        self.send_body = send_body
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        extensions = scope.get("extensions") or {}
+        if not self.send_body or self.count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in extensions:
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file.fileno(),
+                    "offset": self.offset,
+                    "count": self.count,
+                })
+        elif "http.response.pathsend" in extensions and self.status_code == 200:
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(self.offset)
+                remaining = self.count
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class MediaFiles(StaticFiles):
+    def lookup_path(self, path: str):
+        # Temp files of in-flight writes and other dotfiles are never served
+        if any(part.startswith(".") for part in path.split("/") if part):
+            return "", None
+        return super().lookup_path(path)
+
+    def _select_encoding(self, full_path: str, request_headers: Headers):
+        if not full_path.lower().endswith(PRECOMPRESS_SUFFIXES):
+            return None, full_path, None
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted:
+                try:
+                    stat_result = os.stat(full_path + suffix)
+                except OSError:
+                    continue
+                if stat.S_ISREG(stat_result.st_mode):
+                    return encoding, full_path + suffix, stat_result
+        return None, full_path, None
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        media_type = guess_type(full_path)[0] or "application/octet-stream"
+        encoding, body_path, encoded_stat = self._select_encoding(full_path, request_headers)
+        body_stat = encoded_stat or stat_result
+
+        etag = _etag(full_path, stat_result, encoding)
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        headers = {
+            "content-type": media_type,
+            "etag": etag,
+            "last-modified": last_modified,
+            "accept-ranges": "bytes",
+        }
+        if _HASHED_NAME.match(os.path.basename(full_path)):
+            headers["cache-control"] = f"public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            headers["cache-control"] = "public, no-cache"
+        if full_path.lower().endswith(PRECOMPRESS_SUFFIXES):
+            headers["vary"] = "Accept-Encoding"
+        if encoding:
+            headers["content-encoding"] = encoding
+
+        if self._not_modified(request_headers, etag, stat_result):
+            headers.pop("content-type")
+            return Response(status_code=304, headers=headers)
+
+        size = body_stat.st_size
+        send_body = scope["method"] != "HEAD"
+        byte_range = None
+        range_header = request_headers.get("range")
+        if range_header and request_headers.get("if-range", etag) in (etag, last_modified):
+            byte_range = _byte_range(range_header, size)
+        if byte_range is None:
+            headers["content-length"] = str(size)
+            return MediaFileResponse(body_path, headers, status_code, 0, size, send_body)
+        start, end = byte_range
+        headers["content-range"] = f"bytes {start}-{end}/{size}"
+        headers["content-length"] = str(end - start + 1)
+        return MediaFileResponse(body_path, headers, 206, start, end - start + 1, send_body)
+
+    @staticmethod
+    def _not_modified(request_headers: Headers, etag: str, stat_result: os.stat_result) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in tags or etag in tags
+        if_modified_since = parsedate(request_headers.get("if-modified-since", ""))
+        if if_modified_since is not None:
+            return int(stat_result.st_mtime) <= timegm(if_modified_since)
+        return False
+
+
+if __name__ == "__main__":
+    from app.images import UPLOAD_ROOT
+
+    if sys.argv[1:] != ["precompress"]:
+        sys.exit("usage: python -m app.media precompress")
+    count = 0
+    for directory, _, filenames in os.walk(UPLOAD_ROOT):
+        for filename in filenames:
+            if not filename.startswith("."):
+                count += len(precompress(os.path.join(directory, filename)))
+    print(f"✓ Wrote {count} precompressed files")
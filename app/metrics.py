@@ -0,0 +1,271 @@
+"""Request and SQL instrumentation, exposed in the Prometheus text format.
+
+``MetricsMiddleware`` times every request and labels it with the route
+template (``/api/posts/{post_id}``, not the concrete path, so the number of
+series stays bounded). During the request a ``RequestStats`` sits in a
+context variable; the cursor hooks installed by ``instrument_engine`` add
+each statement's count and time to it, and the response cache and
+``FastJSONResponse`` add the time spent serializing. When the response is
+done these become per-route histograms.
+
+Statements slower than ``SLOW_QUERY_THRESHOLD_MS`` are printed with their
+``EXPLAIN QUERY PLAN`` (SQLite only; other backends get the statement alone).
+
+Series are kept per worker process: with several workers, scrape each one or
+aggregate them in Prometheus.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional, Sequence
+
+from sqlalchemy import event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", 100))
+# Statements explained per process at most, so a slow endpoint under load
+# doesn't double its own cost
+SLOW_QUERY_EXPLAIN_LIMIT = int(os.getenv("SLOW_QUERY_EXPLAIN_LIMIT", 100))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = (
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[position] += 1
+            series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        names = self.labelnames + ("le",)
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} {cumulative}"
+            label_text = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_text} {_format_value(series[-1])}"
+            yield f"{self.name}_count{label_text} {cumulative}"
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Time from receiving a request to the end of its response",
+    LATENCY_BUCKETS, ("method", "route"),
+)
+requests_total = Counter(
+    "http_requests_total", "Requests answered, by status code", ("method", "route", "status"),
+)
+request_queries = Histogram(
+    "http_request_sql_queries", "SQL statements executed per request", COUNT_BUCKETS, ("method", "route"),
+)
+request_query_duration = Histogram(
+    "http_request_sql_duration_seconds", "Time spent in SQL statements per request",
+    LATENCY_BUCKETS, ("method", "route"),
+)
+request_serialization = Histogram(
+    "http_request_serialization_seconds", "Time spent rendering response bodies per request",
+    LATENCY_BUCKETS, ("method", "route"),
+)
+query_duration = Histogram(
+    "db_query_duration_seconds", "Duration of single SQL statements", QUERY_BUCKETS, ("operation",),
+)
+slow_queries = Counter(
+    "db_slow_queries_total", f"SQL statements slower than {SLOW_QUERY_THRESHOLD_MS:g} ms", ("operation",),
+)
+
+METRICS = (
+    request_duration, requests_total, request_queries, request_query_duration,
+    request_serialization, query_duration, slow_queries,
+)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_time", "serialization_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.serialization_time = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def record_serialization(seconds: float):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.serialization_time += seconds
+
+
+def _route_label(scope: Scope, root_path: str) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    mounted = scope.get("root_path", "")
+    if mounted != root_path:
+        # Mounted apps (/static) count as one route
+        return mounted[len(root_path):] + "/{path}"
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        root_path = scope.get("root_path", "")
+        start = time.perf_counter()
+        status_code = 500
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            recorded = True
+            labels = (scope["method"], _route_label(scope, root_path))
+            request_duration.observe(time.perf_counter() - start, *labels)
+            requests_total.inc(*labels, str(status_code))
+            request_queries.observe(stats.queries, *labels)
+            request_query_duration.observe(stats.query_time, *labels)
+            request_serialization.observe(stats.serialization_time, *labels)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+            # Background tasks run after the last body message; they aren't
+            # part of the request's latency
+            if message["type"] != "http.response.start" and not message.get("more_body", False) and not recorded:
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not recorded:
+                record()
+            _request_stats.reset(token)
+
+
+_explained = 0
+
+
+def _explain(connection, statement, parameters) -> str:
+    if connection.dialect.name != "sqlite":
+        return ""
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        return "\n".join(f"    {row[-1]}" for row in cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    global _explained
+    elapsed = time.perf_counter() - connection.info["query_start"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    query_duration.observe(elapsed, operation)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_time += elapsed
+    if elapsed * 1000 < SLOW_QUERY_THRESHOLD_MS:
+        return
+    slow_queries.inc(operation)
+    plan = ""
+    if not executemany and operation in ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT") and _explained < SLOW_QUERY_EXPLAIN_LIMIT:
+        _explained += 1
+        try:
+            plan = _explain(connection, statement, parameters)
+        except Exception as e:
+            plan = f"    (no plan: {e})"
+    print(f"✗ Slow query ({elapsed * 1000:.1f} ms): {' '.join(statement.split())}" + (f"\n{plan}" if plan else ""))
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None:
+        starts = context.connection.info.get("query_start")
+        if starts:
+            starts.pop()
+
+
+def instrument_engine(sync_engine):
+    """Time every statement run through ``sync_engine`` (for an async engine,
+    pass its ``sync_engine``)"""
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
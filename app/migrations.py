@@ -0,0 +1,53 @@
+from sqlalchemy import inspect, update
+from sqlalchemy.schema import CreateColumn
+
+from app.conditional import ensure_table_versions
+from app.database import Base
+from app.models import Skill
+from app.excerpts import backfill_post_excerpts
+from app.search import ensure_search_index
+from app.skill_stats import backfill_skill_stats
+from app.tags import backfill_post_tags
+
+
+def run_migrations(engine):
+    """Bring an existing database up to the current models.
+
+    ``create_all`` only creates missing tables; nullable columns and indexes
+    added to tables that already exist are created here."""
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        add_missing_columns(connection)
+        backfill_skill_order(connection)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
+        ensure_table_versions(connection)
+        backfill_post_tags(connection)
+        backfill_post_excerpts(connection)
+        backfill_skill_stats(connection)
+        if engine.dialect.name == "sqlite":
+            ensure_search_index(connection)
+
+
+def add_missing_columns(connection):
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                table_name = connection.dialect.identifier_preparer.format_table(table)
+                connection.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {ddl}")
+
+
+def backfill_skill_order(connection):
+    """``skills.order`` is part of the keyset and so can't be NULL; tables
+    created before it was NOT NULL may still hold NULLs"""
+    skills = Skill.__table__
+    connection.execute(
+        update(skills)
+        .where(skills.c.order.is_(None))
+        # An explicit value keeps the onupdate from touching updated_at
+        .values(order=0, updated_at=skills.c.updated_at)
+    )
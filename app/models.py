@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, Boolean, ForeignKey, Index, JSON
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -17,11 +17,40 @@ class Post(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True, nullable=False)
     content = Column(Text, nullable=False)
+    excerpt = Column(String, nullable=True)  # Plain-text start of content, written with it
     tags = Column(String)  # Comma-separated tags
     category = Column(String, index=True)
     image_url = Column(String, nullable=True)
+    variants = Column(JSON, nullable=True)  # Resized copies of image_url, filled in after upload
+    view_count = Column(Integer, nullable=False, default=0, server_default="0")  # Written in batches, see app/view_counts.py
+    popularity = Column(Float, nullable=False, default=0.0, server_default="0")  # Log of the decayed view count
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    # Keyset pagination: newest first, optionally within one category, or most popular first
+    __table_args__ = (
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        Index("ix_posts_category_created_at_id", "category", "created_at", "id"),
+        Index("ix_posts_popularity_id", "popularity", "id"),
+    )
+
+class Tag(Base):
+    __tablename__ = "tags"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True, nullable=False)  # Lower-cased, trimmed
+    post_count = Column(Integer, nullable=False, default=0)  # Maintained on every post write
+
+class PostTag(Base):
+    __tablename__ = "post_tags"
+    
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True)
+    
+    # The primary key serves post -> tags; this serves tag -> posts filtering
+    __table_args__ = (
+        Index("ix_post_tags_tag_id_post_id", "tag_id", "post_id"),
+    )
 
 class Certificate(Base):
     __tablename__ = "certificates"
@@ -31,7 +60,12 @@ class Certificate(Base):
     issuer = Column(String, nullable=False)
     date = Column(String)  # Store as string for flexibility
     image_url = Column(String, nullable=False)
+    variants = Column(JSON, nullable=True)  # Resized copies (or PDF preview) of image_url
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_certificates_created_at_id", "created_at", "id"),
+    )
 
 class Skill(Base):
     __tablename__ = "skills"
@@ -42,7 +76,39 @@ class Skill(Base):
     proficiency = Column(Integer)  # 1-100 percentage
     icon_url = Column(String, nullable=True)  # URL to skill icon/image
     color = Column(String, nullable=True)  # Hex color for UI
-    order = Column(Integer, default=0)  # For sorting
+    order = Column(Integer, nullable=False, default=0, server_default="0")  # For sorting; part of the keyset
     is_featured = Column(Boolean, default=False)  # Highlight in portfolio
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    # Keyset pagination in display order, overall and for the featured list
+    __table_args__ = (
+        Index("ix_skills_order_name_id", "order", "name", "id"),
+        Index("ix_skills_is_featured_order_name_id", "is_featured", "order", "name", "id"),
+    )
+
+class StoredFile(Base):
+    __tablename__ = "stored_files"
+    
+    path = Column(String, primary_key=True)  # <kind>/<sha256><ext>, relative to the upload root
+    ref_count = Column(Integer, nullable=False, default=0)  # Posts/certificates pointing at the file
+    size = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class SkillStat(Base):
+    __tablename__ = "skill_stats"
+    
+    category = Column(String, primary_key=True)  # "" collects skills without a category
+    skill_count = Column(Integer, nullable=False, default=0)
+    rated_count = Column(Integer, nullable=False, default=0)  # Skills with a proficiency
+    proficiency_sum = Column(Integer, nullable=False, default=0)
+    min_proficiency = Column(Integer, nullable=True)
+    max_proficiency = Column(Integer, nullable=True)
+    histogram = Column(JSON, nullable=False)  # Rated skills per PROFICIENCY_BUCKETS range
+
+class TableVersion(Base):
+    __tablename__ = "table_versions"
+    
+    table_name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)  # Bumped on every write to the table
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,106 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import DateTime, String, literal, tuple_, type_coerce
+
+from app.database import IS_SQLITE
+
+# Response header carrying the opaque cursor of the page after this one
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values) -> str:
+    payload = json.dumps(
+        [value.isoformat() if isinstance(value, datetime) else value for value in values],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, binascii.Error):
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+class Keyset:
+    """Seek pagination over a composite sort key whose columns all sort in the
+    same direction and end in a unique column (normally the primary key).
+
+    Each page is ``WHERE (sort key) < / > (last row's key) ORDER BY ... LIMIT``,
+    which a matching composite index turns into a single index seek regardless
+    of how deep the page is."""
+
+    def __init__(self, *columns, descending: bool = False):
+        self.columns = columns
+        self.descending = descending
+
+    def _is_datetime(self, column):
+        return isinstance(column.type, DateTime)
+
+    def cursor_columns(self):
+        """Sort-key columns to select next to each row. On SQLite timestamps are
+        fetched as the stored text, so the cursor compares exactly against rows
+        written with or without fractional seconds."""
+        return [
+            (type_coerce(column, String) if IS_SQLITE and self._is_datetime(column) else column)
+            .label(f"cursor_{position}")
+            for position, column in enumerate(self.columns)
+        ]
+
+    def order_by(self):
+        return [column.desc() if self.descending else column.asc() for column in self.columns]
+
+    def _bind(self, column, value):
+        """A cursor value checked against the type of its key column, ready to
+        compare against it; anything else is a tampered cursor"""
+        if value is None and column.nullable:
+            return None
+        if self._is_datetime(column):
+            try:
+                parsed = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            return literal(value, String) if IS_SQLITE else parsed
+        python_type = column.type.python_type
+        if python_type is float:
+            valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+        elif python_type is int:
+            valid = isinstance(value, int) and not isinstance(value, bool) and -2**63 <= value < 2**63
+        else:
+            valid = isinstance(value, python_type)
+        if not valid:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return value
+
+    def after(self, cursor: str):
+        values = decode_cursor(cursor, len(self.columns))
+        bound = [self._bind(column, value) for column, value in zip(self.columns, values)]
+        key = tuple_(*self.columns)
+        return key < tuple_(*bound) if self.descending else key > tuple_(*bound)
+
+    def paginate(self, query, cursor=None):
+        """Add the cursor columns, seek condition and ordering to ``query``"""
+        query = query.add_columns(*self.cursor_columns())
+        if cursor:
+            query = query.where(self.after(cursor))
+        return query.order_by(*self.order_by())
+
+    def page(self, rows, limit: int):
+        """Split rows of a paginated query into entities and the next cursor
+        (None when this is the last page)"""
+        items = [row[0] for row in rows]
+        if not rows or len(rows) < limit:
+            return items, None
+        return items, encode_cursor(rows[-1][1:])
+
+
+def cursor_headers(next_cursor):
+    return {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
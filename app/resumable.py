@@ -0,0 +1,211 @@
+"""Resumable uploads for files too large to send reliably in one request.
+
+A client creates a session with the total size, PUTs the bytes in chunks at
+increasing offsets (after a dropped connection, ``GET`` the session to learn
+how much arrived and continue from there), then finalizes it. The finalized
+file is attached by passing its id as ``upload_id`` to the post/certificate
+endpoints, which move it into the content-addressed store.
+
+Sessions live in ``UPLOAD_SESSION_DIR`` as ``<id>/data`` plus ``<id>/meta.json``;
+the received offset is simply the size of ``data``. Sessions idle for longer
+than ``UPLOAD_SESSION_TTL`` are removed. All file work runs on the threadpool.
+
+Claiming a session copies its file into the store and leaves the session in
+place; the endpoint ends it once the row pointing at the file is committed,
+so an upload survives a failed commit and can be claimed again.
+"""
+import asyncio
+import json
+import os
+import re
+import secrets
+import shutil
+import tempfile
+import time
+from typing import AsyncIterator, Iterable, Optional, Tuple
+from weakref import WeakValueDictionary
+
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+
+from app.storage import DOCUMENT_TYPES, UPLOAD_CHUNK_SIZE, UPLOAD_TYPES, check_type, save_upload, store_file
+
+UPLOAD_SESSION_DIR = os.getenv("UPLOAD_SESSION_DIR", "./upload_sessions")
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", 86400))  # seconds since the last chunk
+
+_SESSION_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _write_meta(path, meta):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".meta.")
+    with os.fdopen(fd, "w") as fh:
+        json.dump(meta, fh)
+    os.replace(tmp_path, path)
+
+
+def _append(path, offset, chunks):
+    with open(path, "r+b") as out:
+        out.seek(offset)
+        for chunk in chunks:
+            out.write(chunk)
+        out.flush()
+        os.fsync(out.fileno())
+
+
+class UploadSessions:
+    def __init__(self, root: str, ttl: int):
+        self.root = root
+        self.ttl = ttl
+        # One writer per session at a time within this process
+        self._locks = WeakValueDictionary()
+
+    def _paths(self, upload_id: str):
+        if not _SESSION_ID.match(upload_id) or not os.path.isdir(os.path.join(self.root, upload_id)):
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        directory = os.path.join(self.root, upload_id)
+        return os.path.join(directory, "data"), os.path.join(directory, "meta.json")
+
+    def _status(self, upload_id: str, meta: dict, data_path: str):
+        offset = os.path.getsize(data_path)
+        return {
+            "id": upload_id,
+            "size": meta["size"],
+            "offset": offset,
+            "filename": meta.get("filename"),
+            "finalized": meta.get("finalized", False),
+            "expires_at": os.path.getmtime(data_path) + self.ttl,
+        }
+
+    def _create(self, size: int, filename: Optional[str]):
+        self._expire()
+        upload_id = secrets.token_hex(16)
+        directory = os.path.join(self.root, upload_id)
+        os.makedirs(directory)
+        open(os.path.join(directory, "data"), "wb").close()
+        meta = {"size": size, "filename": filename, "finalized": False}
+        _write_meta(os.path.join(directory, "meta.json"), meta)
+        return self._status(upload_id, meta, os.path.join(directory, "data"))
+
+    async def create(self, size: int, filename: Optional[str] = None):
+        limit = max(limit for _, limit in UPLOAD_TYPES.values())
+        if size > limit:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File too large. Maximum upload size is {limit // (1024 * 1024)} MB",
+            )
+        return await run_in_threadpool(self._create, size, filename)
+
+    def _get(self, upload_id: str):
+        data_path, meta_path = self._paths(upload_id)
+        with open(meta_path) as fh:
+            return self._status(upload_id, json.load(fh), data_path)
+
+    async def get(self, upload_id: str):
+        return await run_in_threadpool(self._get, upload_id)
+
+    async def append(self, upload_id: str, offset: int, stream: AsyncIterator[bytes]):
+        """Write the request body at ``offset``, which must equal the bytes
+        received so far (409 otherwise, with the current offset)"""
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            current = await self.get(upload_id)
+            if current["finalized"]:
+                raise HTTPException(status_code=409, detail="Upload session is already finalized")
+            if offset != current["offset"]:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Offset mismatch: {current['offset']} bytes received so far",
+                    headers={"Upload-Offset": str(current["offset"])},
+                )
+            data_path = os.path.join(self.root, upload_id, "data")
+            received = offset
+            pending = []
+            async for chunk in stream:
+                received += len(chunk)
+                if received > current["size"]:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail="Chunk runs past the declared upload size",
+                    )
+                pending.append(chunk)
+                if received - offset >= UPLOAD_CHUNK_SIZE:
+                    await run_in_threadpool(_append, data_path, offset, pending)
+                    offset, pending = received, []
+            await run_in_threadpool(_append, data_path, offset, pending)
+            return await self.get(upload_id)
+
+    def _finalize(self, upload_id: str, allowed_types: Iterable[str]):
+        data_path, meta_path = self._paths(upload_id)
+        current = self._get(upload_id)
+        if current["offset"] != current["size"]:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload incomplete: {current['offset']} of {current['size']} bytes received",
+                headers={"Upload-Offset": str(current["offset"])},
+            )
+        with open(data_path, "rb") as fh:
+            check_type(fh.read(16), allowed_types, current["size"])
+        with open(meta_path) as fh:
+            meta = json.load(fh)
+        meta["finalized"] = True
+        _write_meta(meta_path, meta)
+        return self._get(upload_id)
+
+    async def finalize(self, upload_id: str, allowed_types: Iterable[str] = DOCUMENT_TYPES):
+        return await run_in_threadpool(self._finalize, upload_id, allowed_types)
+
+    async def claim(self, upload_id: str, kind: str, allowed_types: Iterable[str], db=None) -> Tuple[str, str]:
+        """Copy a finalized upload into the store. The session is kept, so
+        the upload can be claimed again if the caller's commit fails; call
+        ``complete`` once it has succeeded."""
+        if not (await self.get(upload_id))["finalized"]:
+            raise HTTPException(status_code=409, detail="Upload session is not finalized")
+        return await store_file(os.path.join(self.root, upload_id, "data"), kind, allowed_types, db)
+
+    async def complete(self, upload_id: str):
+        """End a claimed session after the row referencing its file was committed"""
+        await run_in_threadpool(shutil.rmtree, os.path.join(self.root, upload_id), True)
+
+    def _discard(self, upload_id: str):
+        self._paths(upload_id)
+        shutil.rmtree(os.path.join(self.root, upload_id), ignore_errors=True)
+
+    async def discard(self, upload_id: str):
+        await run_in_threadpool(self._discard, upload_id)
+
+    def _expire(self):
+        """Remove sessions with no chunk received for ``ttl`` seconds"""
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root, exist_ok=True)
+            return
+        cutoff = time.time() - self.ttl
+        for upload_id in os.listdir(self.root):
+            data_path = os.path.join(self.root, upload_id, "data")
+            try:
+                if os.path.getmtime(data_path) < cutoff:
+                    shutil.rmtree(os.path.join(self.root, upload_id), ignore_errors=True)
+            except OSError:
+                pass
+
+
+upload_sessions = UploadSessions(UPLOAD_SESSION_DIR, UPLOAD_SESSION_TTL)
+
+
+async def receive_upload(
+    kind: str,
+    allowed_types: Iterable[str],
+    image: Optional[UploadFile] = None,
+    upload_id: Optional[str] = None,
+    db=None,
+) -> Optional[Tuple[str, str]]:
+    """Store a file sent either inline as ``image`` or earlier through an
+    upload session for the session ``db`` (see ``save_upload``); returns
+    ``(file_location, url)`` or None if neither was given. A claimed upload
+    session is ended with ``upload_sessions.complete`` after the commit."""
+    if image and upload_id:
+        raise HTTPException(status_code=400, detail="Send either an image or an upload_id, not both")
+    if upload_id:
+        return await upload_sessions.claim(upload_id, kind, allowed_types, db)
+    if image:
+        return await save_upload(image, kind, allowed_types, db)
+    return None
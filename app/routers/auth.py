@@ -1,29 +1,44 @@
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
 from app.auth import authenticate_user, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.cache import response_cache
+from app.deps import get_current_active_user, principal_cache
+from app.models import User
 from app.schemas import Token
+from app.throttle import login_throttle
 
 router = APIRouter()
 
 @router.post("/auth/login", response_model=Token)
 async def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    user = await authenticate_user(db, form_data.username, form_data.password)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect username or password",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    client_ip = request.client.host if request.client else None
+    with login_throttle.attempt(form_data.username, client_ip):
+        async with login_throttle.slot():
+            user = await authenticate_user(db, form_data.username, form_data.password)
+        if not user:
+            login_throttle.record_failure(form_data.username, client_ip)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Incorrect username or password",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
     
+    login_throttle.reset(form_data.username)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
     )
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    return {"access_token": access_token, "token_type": "bearer"}
+
+@router.get("/auth/cache-stats")
+async def read_principal_cache_stats(current_user: User = Depends(get_current_active_user)):
+    """Hit/miss counters of the principal and response caches (Admin only)"""
+    return {"principals": principal_cache.stats(), "responses": response_cache.stats()}
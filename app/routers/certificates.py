@@ -1,70 +1,151 @@
-import os
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from sqlalchemy.orm import Session
-import shutil
-import secrets
-from pathlib import Path
+from typing import List, Optional, Union
+from fastapi import APIRouter, BackgroundTasks, Body, Depends, HTTPException, Request, Response, status, UploadFile, File, Form
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.bulk import BULK_MAX_ITEMS, DUPLICATE_ITEM, BulkReport, bulk_delete, load_by
+from app.cache import response_cache
+from app.conditional import check_item
 from app.database import get_db
 from app.deps import get_current_active_user
+from app.fields import field_rows, load_fields, select_fields
+from app.images import process_upload
+from app.pagination import Keyset, cursor_headers
+from app.resumable import receive_upload, upload_sessions
 from app.models import User, Certificate
-from app.schemas import Certificate as CertificateSchema, CertificateCreate, CertificateUpdate
+from app.schemas import (
+    BulkResult, Certificate as CertificateSchema, CertificateCreate, CertificateFields, CertificateImport,
+    CertificateUpdate, CertificateUpsert,
+)
+from app.storage import DOCUMENT_TYPES
 
 router = APIRouter()
 
-@router.get("/certificates", response_model=List[CertificateSchema])
+certificate_list_adapter = TypeAdapter(List[CertificateSchema])
+CERTIFICATE_FIELDS = list(CertificateSchema.model_fields)
+certificate_keyset = Keyset(Certificate.created_at, Certificate.id, descending=True)
+
+@router.get("/certificates", response_model=List[Union[CertificateSchema, CertificateFields]])
 async def read_certificates(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    names = select_fields(fields, CERTIFICATE_FIELDS)
+    cached = await response_cache.lookup(request, db, "certificates")
+    if cached.response is not None:
+        return cached.response
+    
+    query = load_fields(select(Certificate), Certificate, names)
+    if cursor is None:
+        query = query.offset(skip)
+    result = await db.execute(certificate_keyset.paginate(query, cursor).limit(limit))
+    certificates, next_cursor = certificate_keyset.page(result.all(), limit)
+    if names is not None:
+        return await cached.store(field_rows(certificates, names), headers=cursor_headers(next_cursor))
+    return await cached.store(certificates, certificate_list_adapter, headers=cursor_headers(next_cursor))
+
+# Bulk writes, declared before /certificates/{certificate_id}, which would
+# otherwise claim "bulk". They take image_url of files already uploaded.
+
+@router.post("/certificates/bulk", response_model=BulkResult)
+async def bulk_create_certificates(
+    items: List[CertificateImport] = Body(..., min_length=1, max_length=BULK_MAX_ITEMS),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Create many certificates in one transaction (Admin only)"""
+    report = BulkReport(len(items))
+    for index, item in enumerate(items):
+        db_certificate = Certificate(**item.model_dump())
+        db.add(db_certificate)
+        report.created(index, db_certificate)
+    return await report.commit(db, "certificates")
+
+@router.put("/certificates/bulk", response_model=BulkResult)
+async def bulk_upsert_certificates(
+    items: List[CertificateUpsert] = Body(..., min_length=1, max_length=BULK_MAX_ITEMS),
+    atomic: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Update the certificates named by ``id`` and create those without one, in
+    one transaction (Admin only). Unknown ids are reported and skipped, or
+    fail the whole batch with ``atomic=true``.
+    """
+    existing = await load_by(db, Certificate.id, (item.id for item in items))
+    report = BulkReport(len(items))
+    seen = set()
+    for index, item in enumerate(items):
+        if item.id is None:
+            db_certificate = Certificate(**item.model_dump(exclude={"id"}))
+            db.add(db_certificate)
+            report.created(index, db_certificate)
+        elif item.id not in existing:
+            report.failed(index, "Certificate not found", item.id)
+        elif item.id in seen:
+            report.failed(index, DUPLICATE_ITEM, item.id)
+        else:
+            seen.add(item.id)
+            db_certificate = existing[item.id]
+            if item.image_url != db_certificate.image_url:
+                db_certificate.variants = None
+            for field, value in item.model_dump(exclude={"id"}).items():
+                setattr(db_certificate, field, value)
+            report.updated(index, db_certificate)
+    return await report.commit(db, "certificates", atomic)
+
+@router.post("/certificates/bulk/delete", response_model=BulkResult)
+async def bulk_delete_certificates(
+    ids: List[int] = Body(..., min_length=1, max_length=BULK_MAX_ITEMS),
+    atomic: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
 ):
-    certificates = db.query(Certificate).order_by(Certificate.created_at.desc()).offset(skip).limit(limit).all()
-    return certificates
+    """Delete certificates by id in one transaction (Admin only)"""
+    return await bulk_delete(db, Certificate, ids, "certificates", atomic)
 
 @router.get("/certificates/{certificate_id}", response_model=CertificateSchema)
 async def read_certificate(
     certificate_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db)
 ):
-    certificate = db.query(Certificate).filter(Certificate.id == certificate_id).first()
+    certificate = await db.get(Certificate, certificate_id)
     if certificate is None:
         raise HTTPException(status_code=404, detail="Certificate not found")
+    not_modified = check_item(request, response, certificate)
+    if not_modified is not None:
+        return not_modified
     return certificate
 
 @router.post("/certificates", response_model=CertificateSchema)
 async def create_certificate(
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     issuer: str = Form(...),
     date: str = Form(...),
-    image: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    image: Optional[UploadFile] = File(None),
+    upload_id: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    # Validate file type
-    allowed_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.pdf', '.webp')
-    if not image.filename.lower().endswith(allowed_extensions):
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Invalid file type. Allowed types: {', '.join(allowed_extensions)}"
-        )
-    
-    # Generate unique filename to avoid conflicts
-    file_extension = Path(image.filename).suffix
-    unique_filename = f"{secrets.token_hex(8)}_{title.replace(' ', '_')[:50]}{file_extension}"
-    
-    # Save uploaded image
-    upload_dir = "app/uploads/certificates"
-    os.makedirs(upload_dir, exist_ok=True)
-    file_location = f"{upload_dir}/{unique_filename}"
-    
+    # Save under the content hash; the type is checked from the file's own
+    # bytes and re-uploading the same file reuses it. Large files can arrive
+    # through a resumable upload session instead, identified by upload_id.
     try:
-        with open(file_location, "wb+") as file_object:
-            shutil.copyfileobj(image.file, file_object)
-    except Exception as e:
+        stored = await receive_upload("certificates", DOCUMENT_TYPES, image, upload_id, db)
+    except OSError as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
-    
-    image_url = f"/static/certificates/{unique_filename}"
+    if stored is None:
+        raise HTTPException(status_code=400, detail="An image or upload_id is required")
+    file_location, image_url = stored
     
     db_certificate = Certificate(
         title=title,
@@ -73,21 +154,31 @@ async def create_certificate(
         image_url=image_url
     )
     db.add(db_certificate)
-    db.commit()
-    db.refresh(db_certificate)
+    await db.commit()
+    if upload_id:
+        # Only now that the certificate is committed is the upload session done with
+        await upload_sessions.complete(upload_id)
+    await db.refresh(db_certificate)
+    await response_cache.invalidate("certificates")
+    # Resized copies (or a first-page preview for PDFs) follow in the background
+    background_tasks.add_task(
+        process_upload, Certificate, db_certificate.id, file_location, image_url, "certificates"
+    )
     return db_certificate
 
 @router.put("/certificates/{certificate_id}", response_model=CertificateSchema)
 async def update_certificate(
     certificate_id: int,
+    background_tasks: BackgroundTasks,
     title: Optional[str] = Form(None),
     issuer: Optional[str] = Form(None),
     date: Optional[str] = Form(None),
     image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db),
+    upload_id: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    db_certificate = db.query(Certificate).filter(Certificate.id == certificate_id).first()
+    db_certificate = await db.get(Certificate, certificate_id)
     if db_certificate is None:
         raise HTTPException(status_code=404, detail="Certificate not found")
     
@@ -99,54 +190,37 @@ async def update_certificate(
     if date is not None:
         db_certificate.date = date
     
-    # Handle image update if provided
-    if image:
-        # Validate file type
-        allowed_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.pdf', '.webp')
-        if not image.filename.lower().endswith(allowed_extensions):
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Invalid file type. Allowed types: {', '.join(allowed_extensions)}"
-            )
-        
-        # Generate unique filename
-        file_extension = Path(image.filename).suffix
-        unique_filename = f"{secrets.token_hex(8)}_{db_certificate.title.replace(' ', '_')[:50]}{file_extension}"
-        
-        # Delete old image if exists
-        if db_certificate.image_url:
-            old_image_path = f"app{db_certificate.image_url}"
-            if os.path.exists(old_image_path):
-                try:
-                    os.remove(old_image_path)
-                except Exception as e:
-                    print(f"Warning: Could not delete old image: {str(e)}")
-        
-        # Save new image
-        upload_dir = "app/uploads/certificates"
-        os.makedirs(upload_dir, exist_ok=True)
-        file_location = f"{upload_dir}/{unique_filename}"
-        
-        try:
-            with open(file_location, "wb+") as file_object:
-                shutil.copyfileobj(image.file, file_object)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
-        
-        db_certificate.image_url = f"/static/certificates/{unique_filename}"
+    # Handle image update if provided, inline or through an upload session;
+    # the old file goes once nothing references it
+    try:
+        stored = await receive_upload("certificates", DOCUMENT_TYPES, image, upload_id, db)
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+    if stored:
+        file_location, image_url = stored
+        if image_url != db_certificate.image_url:
+            db_certificate.image_url = image_url
+            db_certificate.variants = None
     
-    db.commit()
-    db.refresh(db_certificate)
+    await db.commit()
+    if upload_id:
+        await upload_sessions.complete(upload_id)
+    await db.refresh(db_certificate)
+    await response_cache.invalidate("certificates")
+    if stored:
+        background_tasks.add_task(
+            process_upload, Certificate, db_certificate.id, file_location, db_certificate.image_url, "certificates"
+        )
     return db_certificate
 
 @router.patch("/certificates/{certificate_id}", response_model=CertificateSchema)
 async def partial_update_certificate(
     certificate_id: int,
     certificate_update: CertificateUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    db_certificate = db.query(Certificate).filter(Certificate.id == certificate_id).first()
+    db_certificate = await db.get(Certificate, certificate_id)
     if db_certificate is None:
         raise HTTPException(status_code=404, detail="Certificate not found")
     
@@ -155,29 +229,23 @@ async def partial_update_certificate(
     for field, value in update_data.items():
         setattr(db_certificate, field, value)
     
-    db.commit()
-    db.refresh(db_certificate)
+    await db.commit()
+    await db.refresh(db_certificate)
+    await response_cache.invalidate("certificates")
     return db_certificate
 
 @router.delete("/certificates/{certificate_id}")
 async def delete_certificate(
     certificate_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    db_certificate = db.query(Certificate).filter(Certificate.id == certificate_id).first()
+    db_certificate = await db.get(Certificate, certificate_id)
     if db_certificate is None:
         raise HTTPException(status_code=404, detail="Certificate not found")
     
-    # Delete associated image file
-    if db_certificate.image_url:
-        image_path = f"app{db_certificate.image_url}"
-        if os.path.exists(image_path):
-            try:
-                os.remove(image_path)
-            except Exception as e:
-                print(f"Warning: Could not delete image file: {str(e)}")
-    
-    db.delete(db_certificate)
-    db.commit()
+    # The image file is removed with its last reference, after the commit
+    await db.delete(db_certificate)
+    await db.commit()
+    await response_cache.invalidate("certificates")
     return {"message": "Certificate deleted successfully"}
\ No newline at end of file
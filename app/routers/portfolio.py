@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, Request
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import response_cache
+from app.conditional import POST_VIEWS
+from app.database import begin_read_snapshot, get_db
+from app.models import Certificate, Post, Skill
+from app.routers.certificates import certificate_keyset
+from app.routers.posts import post_keyset
+from app.routers.skills import (
+    category_distribution, load_featured_skills, load_skill_categories, proficiency_levels, skill_keyset
+)
+from app.schemas import Portfolio
+from app.skill_stats import load_skill_stats
+
+router = APIRouter()
+
+portfolio_adapter = TypeAdapter(Portfolio)
+
+# Same page sizes the individual list endpoints default to
+PORTFOLIO_LIST_LIMIT = 100
+PORTFOLIO_FEATURED_LIMIT = 10
+
+async def _first_page(db: AsyncSession, model, keyset):
+    result = await db.execute(keyset.paginate(select(model)).limit(PORTFOLIO_LIST_LIMIT))
+    items, _ = keyset.page(result.all(), PORTFOLIO_LIST_LIMIT)
+    return items
+
+@router.get("/portfolio", response_model=Portfolio)
+async def read_portfolio(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Everything the landing page needs in one response: the first page of
+    posts, certificates and skills, skill categories, featured skills and
+    the skill statistics. All of it is read from one snapshot and cached
+    as a single body until a write touches posts, certificates or skills,
+    or post view counts are written.
+    """
+    await begin_read_snapshot(db)
+    cached = await response_cache.lookup(request, db, "posts", POST_VIEWS, "certificates", "skills")
+    if cached.response is not None:
+        return cached.response
+    
+    skill_stats = await load_skill_stats(db)
+    portfolio = {
+        "posts": await _first_page(db, Post, post_keyset),
+        "certificates": await _first_page(db, Certificate, certificate_keyset),
+        "skills": await _first_page(db, Skill, skill_keyset),
+        "skill_categories": await load_skill_categories(db),
+        "featured_skills": await load_featured_skills(db, PORTFOLIO_FEATURED_LIMIT),
+        "category_distribution": category_distribution(skill_stats),
+        "proficiency_levels": proficiency_levels(skill_stats),
+        "skill_stats": skill_stats,
+    }
+    return await cached.store(portfolio, portfolio_adapter)
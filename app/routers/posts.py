@@ -1,53 +1,226 @@
-import os
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from sqlalchemy.orm import Session
-import shutil
+from typing import List, Optional, Union
+from fastapi import APIRouter, BackgroundTasks, Body, Depends, HTTPException, Query, Request, Response, status, UploadFile, File, Form
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.bulk import BULK_MAX_ITEMS, DUPLICATE_ITEM, BulkReport, bulk_delete, load_by
+from app.cache import response_cache
+from app.conditional import POST_VIEWS, check_item
+from app.database import IS_SQLITE, get_db
 from app.deps import get_current_active_user
-from app.models import User, Post
-from app.schemas import Post as PostSchema, PostCreate, PostUpdate
+from app.fields import field_rows, load_fields, select_fields
+from app.images import process_upload
+from app.pagination import Keyset, cursor_headers
+from app.resumable import receive_upload, upload_sessions
+from app.models import User, Post, Tag
+from app.schemas import (
+    BulkResult, Post as PostSchema, PostCreate, PostFields, PostSearchHit, PostUpdate, PostUpsert, TagCount,
+)
+from app.search import build_match_query, fallback_statement, render_snippet, search_statement
+from app.storage import IMAGE_TYPES
+from app.tags import tag_filter
+from app.view_counts import view_counter
 
 router = APIRouter()
 
-@router.get("/posts", response_model=List[PostSchema])
+post_list_adapter = TypeAdapter(List[PostSchema])
+post_keyset = Keyset(Post.created_at, Post.id, descending=True)
+popular_post_keyset = Keyset(Post.popularity, Post.id, descending=True)
+search_hit_list_adapter = TypeAdapter(List[PostSearchHit])
+tag_count_list_adapter = TypeAdapter(List[TagCount])
+
+# What a listing page shows: everything but the full content
+POST_FIELDS = list(PostSchema.model_fields)
+POST_SUMMARY_FIELDS = [name for name in POST_FIELDS if name != "content"]
+
+@router.get("/posts", response_model=List[Union[PostSchema, PostFields]])
 async def read_posts(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     category: Optional[str] = None,
-    db: Session = Depends(get_db)
+    tag: Optional[List[str]] = Query(None),
+    tag_mode: str = Query("any", pattern="^(any|all)$"),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    view: str = Query("full", pattern="^(full|summary)$"),
+    sort: str = Query("recent", pattern="^(recent|popular)$"),
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(Post)
+    """
+    Posts, newest first, or with ``sort=popular`` by views with recent ones
+    counting most. ``view=summary`` leaves out ``content`` (use ``excerpt``);
+    ``fields=title,category,...`` returns just those fields plus ``id``.
+    Either way only the returned columns are read.
+    """
+    # Pass the X-Next-Cursor of the previous page as ?cursor= for stable, O(1)
+    # paging; skip/limit offsets keep working for existing clients
+    names = select_fields(fields, POST_FIELDS, POST_SUMMARY_FIELDS if view == "summary" else None)
+    # Batched view count writes move the validators of every page that shows
+    # the counts or is ordered by them
+    shows_views = names is None or "view_count" in names
+    namespaces = ("posts", POST_VIEWS) if shows_views or sort == "popular" else ("posts",)
+    cached = await response_cache.lookup(request, db, *namespaces)
+    if cached.response is not None:
+        return cached.response
+    
+    query = load_fields(select(Post), Post, names)
     if category:
-        query = query.filter(Post.category == category)
-    posts = query.order_by(Post.created_at.desc()).offset(skip).limit(limit).all()
-    return posts
+        query = query.where(Post.category == category)
+    # ?tag=a&tag=b matches posts with either tag; add tag_mode=all for both
+    tags_condition = tag_filter(tag or [], match_all=tag_mode == "all")
+    if tags_condition is not None:
+        query = query.where(tags_condition)
+    if cursor is None:
+        query = query.offset(skip)
+    keyset = popular_post_keyset if sort == "popular" else post_keyset
+    result = await db.execute(keyset.paginate(query, cursor).limit(limit))
+    posts, next_cursor = keyset.page(result.all(), limit)
+    if names is not None:
+        return await cached.store(field_rows(posts, names), headers=cursor_headers(next_cursor))
+    return await cached.store(posts, post_list_adapter, headers=cursor_headers(next_cursor))
+
+@router.get("/posts/tags", response_model=List[TagCount])
+async def read_post_tags(request: Request, db: AsyncSession = Depends(get_db)):
+    """Every tag in use with the number of posts carrying it, most used first"""
+    cached = await response_cache.lookup(request, db, "posts")
+    if cached.response is not None:
+        return cached.response
+    
+    result = await db.execute(
+        select(Tag.name, Tag.post_count.label("count"))
+        .where(Tag.post_count > 0)
+        .order_by(Tag.post_count.desc(), Tag.name)
+    )
+    return await cached.store(result.mappings().all(), tag_count_list_adapter)
+
+@router.get("/posts/search", response_model=List[PostSearchHit])
+async def search_posts(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=50),
+    db: AsyncSession = Depends(get_db)
+):
+    """Full-text search over post titles, content and tags, best match first"""
+    cached = await response_cache.lookup(request, db, "posts", POST_VIEWS)
+    if cached.response is not None:
+        return cached.response
+    
+    hits = []
+    match = build_match_query(q)
+    if match is not None and IS_SQLITE:
+        result = await db.execute(search_statement(match, limit, skip))
+        hits = [
+            {"post": post, "score": round(-rank, 4), "snippet": render_snippet(snippet)}
+            for post, rank, snippet in result.all()
+        ]
+    elif match is not None:
+        posts = await db.scalars(fallback_statement(q, limit, skip))
+        hits = [{"post": post, "score": 0.0} for post in posts.all()]
+    return await cached.store(hits, search_hit_list_adapter)
+
+def apply_post_update(db_post: Post, update_data: dict):
+    if "image_url" in update_data and update_data["image_url"] != db_post.image_url:
+        # Variants belong to the old image
+        db_post.variants = None
+    for field, value in update_data.items():
+        setattr(db_post, field, value)
+
+# Bulk writes, declared before /posts/{post_id}, which would otherwise claim "bulk"
+
+@router.post("/posts/bulk", response_model=BulkResult)
+async def bulk_create_posts(
+    items: List[PostCreate] = Body(..., min_length=1, max_length=BULK_MAX_ITEMS),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Create many posts in one transaction (Admin only); images are given as
+    ``image_url`` of files already uploaded"""
+    report = BulkReport(len(items))
+    for index, item in enumerate(items):
+        db_post = Post(**item.model_dump())
+        db.add(db_post)
+        report.created(index, db_post)
+    return await report.commit(db, "posts")
+
+@router.put("/posts/bulk", response_model=BulkResult)
+async def bulk_upsert_posts(
+    items: List[PostUpsert] = Body(..., min_length=1, max_length=BULK_MAX_ITEMS),
+    atomic: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Update the posts named by ``id`` and create those without one, in one
+    transaction (Admin only). Unknown ids are reported and skipped, or fail
+    the whole batch with ``atomic=true``.
+    """
+    existing = await load_by(db, Post.id, (item.id for item in items))
+    report = BulkReport(len(items))
+    seen = set()
+    for index, item in enumerate(items):
+        if item.id is None:
+            db_post = Post(**item.model_dump(exclude={"id"}))
+            db.add(db_post)
+            report.created(index, db_post)
+        elif item.id not in existing:
+            report.failed(index, "Post not found", item.id)
+        elif item.id in seen:
+            report.failed(index, DUPLICATE_ITEM, item.id)
+        else:
+            seen.add(item.id)
+            apply_post_update(existing[item.id], item.model_dump(exclude={"id"}, exclude_unset=True))
+            report.updated(index, existing[item.id])
+    return await report.commit(db, "posts", atomic)
+
+@router.post("/posts/bulk/delete", response_model=BulkResult)
+async def bulk_delete_posts(
+    ids: List[int] = Body(..., min_length=1, max_length=BULK_MAX_ITEMS),
+    atomic: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Delete posts by id in one transaction (Admin only); image files go
+    with their last reference, after the commit"""
+    return await bulk_delete(db, Post, ids, "posts", atomic)
 
 @router.get("/posts/{post_id}", response_model=PostSchema)
-async def read_post(post_id: int, db: Session = Depends(get_db)):
-    post = db.query(Post).filter(Post.id == post_id).first()
+async def read_post(
+    post_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db)
+):
+    post = await db.get(Post, post_id)
     if post is None:
         raise HTTPException(status_code=404, detail="Post not found")
+    # Buffered in memory and written in batches, so reads stay reads
+    view_counter.record(post_id)
+    not_modified = check_item(request, response, post)
+    if not_modified is not None:
+        return not_modified
     return post
 
 @router.post("/posts", response_model=PostSchema)
 async def create_post(
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     content: str = Form(...),
     tags: Optional[str] = Form(None),
     category: Optional[str] = Form(None),
     image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db),
+    upload_id: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
+    # Save the image (sent inline or through an upload session) under its
+    # content hash; identical uploads share one file
     image_url = None
-    if image:
-        # Save uploaded image
-        file_location = f"app/uploads/posts/{image.filename}"
-        with open(file_location, "wb+") as file_object:
-            shutil.copyfileobj(image.file, file_object)
-        image_url = f"/static/posts/{image.filename}"
+    stored = await receive_upload("posts", IMAGE_TYPES, image, upload_id, db)
+    if stored:
+        file_location, image_url = stored
     
     db_post = Post(
         title=title,
@@ -57,45 +230,47 @@ async def create_post(
         image_url=image_url
     )
     db.add(db_post)
-    db.commit()
-    db.refresh(db_post)
+    await db.commit()
+    if upload_id:
+        # Only now that the post is committed is the upload session done with
+        await upload_sessions.complete(upload_id)
+    await db.refresh(db_post)
+    await response_cache.invalidate("posts")
+    if stored:
+        # Thumbnails are built in a worker process after the response is sent
+        background_tasks.add_task(process_upload, Post, db_post.id, file_location, image_url, "posts")
     return db_post
 
 @router.put("/posts/{post_id}", response_model=PostSchema)
 async def update_post(
     post_id: int,
     post_update: PostUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    db_post = db.query(Post).filter(Post.id == post_id).first()
+    db_post = await db.get(Post, post_id)
     if db_post is None:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    update_data = post_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_post, field, value)
+    apply_post_update(db_post, post_update.model_dump(exclude_unset=True))
     
-    db.commit()
-    db.refresh(db_post)
+    await db.commit()
+    await db.refresh(db_post)
+    await response_cache.invalidate("posts")
     return db_post
 
 @router.delete("/posts/{post_id}")
 async def delete_post(
     post_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    db_post = db.query(Post).filter(Post.id == post_id).first()
+    db_post = await db.get(Post, post_id)
     if db_post is None:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    # Delete associated image file if exists
-    if db_post.image_url:
-        image_path = f"app{db_post.image_url}"
-        if os.path.exists(image_path):
-            os.remove(image_path)
-    
-    db.delete(db_post)
-    db.commit()
+    # The image file is removed with its last reference, after the commit
+    await db.delete(db_post)
+    await db.commit()
+    await response_cache.invalidate("posts")
     return {"message": "Post deleted successfully"}
\ No newline at end of file
@@ -1,68 +1,257 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func  # Import func from sqlalchemy
+from typing import List, Optional, Union
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, Response, status, Query
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 
+from app.bulk import BULK_MAX_ITEMS, DUPLICATE_ITEM, BulkReport, bulk_delete, load_by
+from app.cache import response_cache
+from app.conditional import check_item
 from app.database import get_db
 from app.deps import get_current_active_user
+from app.fields import field_rows, load_fields, select_fields
+from app.pagination import Keyset, cursor_headers
 from app.models import User, Skill
-from app.schemas import Skill as SkillSchema, SkillCreate, SkillUpdate
+from app.schemas import (
+    BulkResult, Skill as SkillSchema, SkillCreate, SkillFields, SkillOrder, SkillReorder, SkillStats, SkillUpdate,
+)
+from app.skill_order import reorder_skills
+from app.skill_stats import load_skill_stats
 
 router = APIRouter()
 
-@router.get("/skills", response_model=List[SkillSchema])
+skill_list_adapter = TypeAdapter(List[SkillSchema])
+SKILL_FIELDS = list(SkillSchema.model_fields)
+skill_keyset = Keyset(Skill.order, Skill.name, Skill.id)
+
+# Queries shared with the /portfolio bootstrap endpoint
+
+async def load_skill_categories(db: AsyncSession):
+    categories = await db.scalars(select(Skill.category).distinct())
+    return [cat for cat in categories.all() if cat]
+
+async def load_featured_skills(db: AsyncSession, limit: int = 10):
+    skills = await db.scalars(select(Skill).where(
+        Skill.is_featured == True
+    ).order_by(
+        Skill.order.asc()
+    ).limit(limit))
+    return skills.all()
+
+# Both read the skill_stats summary rows instead of aggregating over skills
+
+def category_distribution(stats):
+    return [
+        {"category": category["category"], "count": category["total_skills"]}
+        for category in stats["categories"]
+    ]
+
+def proficiency_levels(stats):
+    return {
+        "average_proficiency": stats["average_proficiency"],
+        "max_proficiency": stats["max_proficiency"] or 0,
+        "min_proficiency": stats["min_proficiency"] if stats["min_proficiency"] is not None else 100,
+        "total_skills": stats["rated_skills"]
+    }
+
+@router.get("/skills", response_model=List[Union[SkillSchema, SkillFields]])
 async def read_skills(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
     category: Optional[str] = None,
     featured: Optional[bool] = None,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
 ):
     """
-    Get all skills with optional filtering
+    Get all skills with optional filtering; ``fields=name,proficiency,...``
+    returns just those fields plus ``id``
     """
-    query = db.query(Skill)
+    names = select_fields(fields, SKILL_FIELDS)
+    cached = await response_cache.lookup(request, db, "skills")
+    if cached.response is not None:
+        return cached.response
+    
+    query = load_fields(select(Skill), Skill, names)
     
     # Apply filters
     if category:
-        query = query.filter(Skill.category == category)
+        query = query.where(Skill.category == category)
     
     if featured is not None:
-        query = query.filter(Skill.is_featured == featured)
+        query = query.where(Skill.is_featured == featured)
     
-    # Apply sorting and pagination
-    skills = query.order_by(Skill.order.asc(), Skill.name.asc()).offset(skip).limit(limit).all()
-    return skills
+    # Apply sorting and pagination (cursor takes precedence over skip)
+    if cursor is None:
+        query = query.offset(skip)
+    result = await db.execute(skill_keyset.paginate(query, cursor).limit(limit))
+    skills, next_cursor = skill_keyset.page(result.all(), limit)
+    if names is not None:
+        return await cached.store(field_rows(skills, names), headers=cursor_headers(next_cursor))
+    return await cached.store(skills, skill_list_adapter, headers=cursor_headers(next_cursor))
 
 @router.get("/skills/categories", response_model=List[str])
-async def read_skill_categories(db: Session = Depends(get_db)):
+async def read_skill_categories(request: Request, db: AsyncSession = Depends(get_db)):
     """
     Get distinct skill categories
     """
-    categories = db.query(Skill.category).distinct().all()
-    return [cat[0] for cat in categories if cat[0]]
+    cached = await response_cache.lookup(request, db, "skills")
+    if cached.response is not None:
+        return cached.response
+    
+    return await cached.store(await load_skill_categories(db))
+
+@router.get("/skills/featured", response_model=List[SkillSchema])
+async def get_featured_skills(
+    request: Request,
+    limit: int = Query(10, ge=1, le=20),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get featured skills for portfolio showcase"""
+    # Declared before /skills/{skill_id}, which would otherwise claim "featured"
+    cached = await response_cache.lookup(request, db, "skills")
+    if cached.response is not None:
+        return cached.response
+    
+    return await cached.store(await load_featured_skills(db, limit), skill_list_adapter)
+
+@router.get("/skills/stats", response_model=SkillStats)
+async def get_skill_stats(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Skill totals, average/min/max proficiency and a proficiency histogram,
+    overall and per category
+    """
+    cached = await response_cache.lookup(request, db, "skills")
+    if cached.response is not None:
+        return cached.response
+    
+    return await cached.store(await load_skill_stats(db))
+
+# Bulk writes, declared before /skills/{skill_id}, which would otherwise claim
+# "bulk". Names are checked with one query for the whole batch.
+
+@router.post("/skills/bulk", response_model=BulkResult)
+async def bulk_create_skills(
+    items: List[SkillCreate] = Body(..., min_length=1, max_length=BULK_MAX_ITEMS),
+    atomic: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Create many skills in one transaction (Admin only). Names already in the
+    table, and repeats of a name earlier in the batch, are reported and
+    skipped, or fail the whole batch with ``atomic=true``.
+    """
+    existing = set(await load_by(db, Skill.name, (item.name for item in items)))
+    report = BulkReport(len(items))
+    seen = set()
+    for index, item in enumerate(items):
+        if item.name in seen:
+            report.failed(index, DUPLICATE_ITEM)
+            continue
+        seen.add(item.name)
+        if item.name in existing:
+            report.failed(index, "Skill with this name already exists")
+            continue
+        db_skill = Skill(**item.model_dump())
+        db.add(db_skill)
+        report.created(index, db_skill)
+    return await report.commit(db, "skills", atomic)
+
+@router.put("/skills/bulk", response_model=BulkResult)
+async def bulk_upsert_skills(
+    items: List[SkillCreate] = Body(..., min_length=1, max_length=BULK_MAX_ITEMS),
+    atomic: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Create skills by name, or update the fields sent for names that exist
+    (Admin only), in one transaction
+    """
+    existing = await load_by(db, Skill.name, (item.name for item in items))
+    report = BulkReport(len(items))
+    seen = set()
+    for index, item in enumerate(items):
+        if item.name in seen:
+            report.failed(index, DUPLICATE_ITEM)
+            continue
+        seen.add(item.name)
+        db_skill = existing.get(item.name)
+        if db_skill is None:
+            db_skill = Skill(**item.model_dump())
+            db.add(db_skill)
+            report.created(index, db_skill)
+        else:
+            for field, value in item.model_dump(exclude_unset=True).items():
+                setattr(db_skill, field, value)
+            report.updated(index, db_skill)
+    return await report.commit(db, "skills", atomic)
+
+@router.post("/skills/bulk/delete", response_model=BulkResult)
+async def bulk_delete_skills(
+    ids: List[int] = Body(..., min_length=1, max_length=BULK_MAX_ITEMS),
+    atomic: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Delete skills by id in one transaction (Admin only)"""
+    return await bulk_delete(db, Skill, ids, "skills", atomic)
+
+@router.put("/skills/order", response_model=List[SkillOrder])
+async def reorder_skill_list(
+    reorder: SkillReorder,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Reorder skills in one transaction (Admin only). Send ``ids`` in their new
+    order (every skill, or some of them to reorder those among the positions
+    they hold), or ``moves`` such as ``{"id": 5, "after": 2}``. Only skills
+    whose order key has to change are written. Returns every skill's id and
+    order key in the new display order.
+    """
+    if (reorder.ids is None) == (reorder.moves is None):
+        raise HTTPException(status_code=400, detail="Send either ids or moves")
+    
+    order = await db.run_sync(
+        lambda session: reorder_skills(session.connection(), reorder.ids, reorder.moves)
+    )
+    await db.commit()
+    await response_cache.invalidate("skills")
+    return [{"id": skill_id, "order": key} for skill_id, key in order]
 
 @router.get("/skills/{skill_id}", response_model=SkillSchema)
-async def read_skill(skill_id: int, db: Session = Depends(get_db)):
+async def read_skill(
+    skill_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db)
+):
     """
     Get a specific skill by ID
     """
-    skill = db.query(Skill).filter(Skill.id == skill_id).first()
+    skill = await db.get(Skill, skill_id)
     if skill is None:
         raise HTTPException(status_code=404, detail="Skill not found")
+    not_modified = check_item(request, response, skill)
+    if not_modified is not None:
+        return not_modified
     return skill
 
 @router.post("/skills", response_model=SkillSchema)
 async def create_skill(
     skill_data: SkillCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Create a new skill (Admin only)
     """
     # Check if skill with same name already exists
-    existing_skill = db.query(Skill).filter(Skill.name == skill_data.name).first()
+    existing_skill = await db.scalar(select(Skill).where(Skill.name == skill_data.name))
     if existing_skill:
         raise HTTPException(
             status_code=400,
@@ -71,30 +260,31 @@ async def create_skill(
     
     db_skill = Skill(**skill_data.model_dump())
     db.add(db_skill)
-    db.commit()
-    db.refresh(db_skill)
+    await db.commit()
+    await db.refresh(db_skill)
+    await response_cache.invalidate("skills")
     return db_skill
 
 @router.put("/skills/{skill_id}", response_model=SkillSchema)
 async def update_skill(
     skill_id: int,
     skill_update: SkillUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Update a skill (Admin only)
     """
-    db_skill = db.query(Skill).filter(Skill.id == skill_id).first()
+    db_skill = await db.get(Skill, skill_id)
     if db_skill is None:
         raise HTTPException(status_code=404, detail="Skill not found")
     
     # Check name uniqueness if name is being updated
     if skill_update.name and skill_update.name != db_skill.name:
-        existing_skill = db.query(Skill).filter(
+        existing_skill = await db.scalar(select(Skill).where(
             Skill.name == skill_update.name,
             Skill.id != skill_id
-        ).first()
+        ))
         if existing_skill:
             raise HTTPException(
                 status_code=400,
@@ -106,72 +296,47 @@ async def update_skill(
     for field, value in update_data.items():
         setattr(db_skill, field, value)
     
-    db.commit()
-    db.refresh(db_skill)
+    await db.commit()
+    await db.refresh(db_skill)
+    await response_cache.invalidate("skills")
     return db_skill
 
 @router.delete("/skills/{skill_id}")
 async def delete_skill(
     skill_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Delete a skill (Admin only)
     """
-    db_skill = db.query(Skill).filter(Skill.id == skill_id).first()
+    db_skill = await db.get(Skill, skill_id)
     if db_skill is None:
         raise HTTPException(status_code=404, detail="Skill not found")
     
-    db.delete(db_skill)
-    db.commit()
+    await db.delete(db_skill)
+    await db.commit()
+    await response_cache.invalidate("skills")
     return {"message": "Skill deleted successfully"}
 
 @router.get("/skills/stats/category-distribution")
-async def get_category_distribution(db: Session = Depends(get_db)):
+async def get_category_distribution(request: Request, db: AsyncSession = Depends(get_db)):
     """
     Get skill distribution by category
     """
-    result = db.query(
-        Skill.category,
-        func.count(Skill.id).label('count')  # Use func from sqlalchemy
-    ).group_by(Skill.category).all()
+    cached = await response_cache.lookup(request, db, "skills")
+    if cached.response is not None:
+        return cached.response
     
-    distribution = [
-        {"category": category, "count": count}
-        for category, count in result
-        if category  # Exclude null categories
-    ]
-    return distribution
+    return await cached.store(category_distribution(await load_skill_stats(db)))
 
 @router.get("/skills/stats/proficiency-levels")
-async def get_proficiency_levels(db: Session = Depends(get_db)):
+async def get_proficiency_levels(request: Request, db: AsyncSession = Depends(get_db)):
     """
     Get skill proficiency statistics
     """
-    stats = db.query(
-        func.avg(Skill.proficiency).label('average'),
-        func.max(Skill.proficiency).label('max'),
-        func.min(Skill.proficiency).label('min'),
-        func.count(Skill.id).label('total')
-    ).filter(Skill.proficiency.isnot(None)).first()
+    cached = await response_cache.lookup(request, db, "skills")
+    if cached.response is not None:
+        return cached.response
     
-    return {
-        "average_proficiency": round(stats.average or 0, 2),
-        "max_proficiency": stats.max or 0,
-        "min_proficiency": stats.min or 100,
-        "total_skills": stats.total or 0
-    }
-
-@router.get("/skills/featured", response_model=List[SkillSchema])
-async def get_featured_skills(
-    limit: int = Query(10, ge=1, le=20),
-    db: Session = Depends(get_db)
-):
-    """Get featured skills for portfolio showcase"""
-    skills = db.query(Skill).filter(
-        Skill.is_featured == True
-    ).order_by(
-        Skill.order.asc()
-    ).limit(limit).all()
-    return skills
\ No newline at end of file
+    return await cached.store(proficiency_levels(await load_skill_stats(db)))
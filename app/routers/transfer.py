@@ -0,0 +1,70 @@
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_db
+from app.deps import get_current_active_user
+from app.models import User
+from app.schemas import ImportResult
+from app.transfer import (
+    archive_chunks, csv_chunks, csv_rows, import_rows, ndjson_chunks, ndjson_rows, select_tables
+)
+
+router = APIRouter()
+
+def attachment(filename: str) -> dict:
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+@router.get("/export")
+async def export_data(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    table: Optional[List[str]] = Query(None),
+    include_uploads: bool = False,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Stream posts, certificates and skills (or the tables given with
+    ``table=``) as NDJSON, or one table as CSV (Admin only).
+    ``include_uploads=true`` sends a zip of the NDJSON plus the uploaded files.
+    """
+    tables = select_tables(table)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    if format == "csv":
+        if len(tables) != 1 or include_uploads:
+            raise HTTPException(status_code=400, detail="CSV exports take exactly one table and no uploads")
+        return StreamingResponse(
+            csv_chunks(tables[0]), media_type="text/csv",
+            headers=attachment(f"{tables[0]}-{stamp}.csv"),
+        )
+    if include_uploads:
+        return StreamingResponse(
+            archive_chunks(tables), media_type="application/zip",
+            headers=attachment(f"portfolio-{stamp}.zip"),
+        )
+    return StreamingResponse(
+        ndjson_chunks(tables), media_type="application/x-ndjson",
+        headers=attachment(f"portfolio-{stamp}.ndjson"),
+    )
+
+@router.post("/import", response_model=ImportResult)
+async def import_data(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    table: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Import an export sent as the raw request body (Admin only), committed in
+    batches as it arrives. CSV bodies need ``table=``.
+    """
+    if format == "csv":
+        if table is None:
+            raise HTTPException(status_code=400, detail="CSV imports need a table")
+        rows = csv_rows(request.stream(), select_tables([table])[0])
+    else:
+        rows = ndjson_rows(request.stream())
+    return await import_rows(db, rows)
@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Depends, Query, Request, status
+
+from app.deps import get_current_active_user
+from app.models import User
+from app.resumable import upload_sessions
+from app.schemas import UploadSession, UploadSessionCreate
+
+router = APIRouter()
+
+@router.post("/uploads", response_model=UploadSession, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    session: UploadSessionCreate,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Start a resumable upload of ``size`` bytes"""
+    return await upload_sessions.create(session.size, session.filename)
+
+@router.get("/uploads/{upload_id}", response_model=UploadSession)
+async def read_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Session status; after an interrupted chunk, resume from ``offset``"""
+    return await upload_sessions.get(upload_id)
+
+@router.put("/uploads/{upload_id}", response_model=UploadSession)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Append the raw request body at ``offset``"""
+    return await upload_sessions.append(upload_id, offset, request.stream())
+
+@router.post("/uploads/{upload_id}/finalize", response_model=UploadSession)
+async def finalize_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Check the complete file; its id can then be passed as ``upload_id``
+    when creating a post or creating/updating a certificate"""
+    return await upload_sessions.finalize(upload_id)
+
+@router.delete("/uploads/{upload_id}")
+async def delete_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    await upload_sessions.discard(upload_id)
+    return {"message": "Upload session deleted successfully"}
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, ConfigDict, Field  # Add Field import here
+from pydantic import BaseModel, ConfigDict, Field, field_validator  # Add Field import here
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 # Auth
 class Token(BaseModel):
@@ -9,6 +9,7 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: Optional[str] = None
+    expires_at: Optional[datetime] = None
 
 class LoginRequest(BaseModel):
     username: str
@@ -28,6 +29,27 @@ class User(UserBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+# Image variants, generated in the background after an upload
+class ImageVariant(BaseModel):
+    name: str  # thumbnail, medium or full
+    format: str  # webp or avif
+    width: int
+    height: int
+    url: str
+
+# Resumable uploads
+class UploadSessionCreate(BaseModel):
+    size: int = Field(..., gt=0)  # Total bytes that will be sent
+    filename: Optional[str] = None
+
+class UploadSession(BaseModel):
+    id: str
+    size: int
+    offset: int  # Bytes received so far; the next chunk starts here
+    filename: Optional[str] = None
+    finalized: bool
+    expires_at: datetime
+
 # Post
 class PostBase(BaseModel):
     title: str
@@ -46,13 +68,44 @@ class PostUpdate(BaseModel):
     category: Optional[str] = None
     image_url: Optional[str] = None
 
+class PostUpsert(PostCreate):
+    id: Optional[int] = None  # Replace this post; without one a post is created
+
 class Post(PostBase):
     id: int
+    excerpt: Optional[str] = None  # Plain-text start of content, for previews
+    view_count: int = 0  # Updated in batches, so it can trail recent views slightly
+    variants: Optional[List[ImageVariant]] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
     
     model_config = ConfigDict(from_attributes=True)
 
+# A post as ?fields= and ?view=summary list it: id and only the fields asked for
+class PostFields(BaseModel):
+    id: int
+    title: Optional[str] = None
+    content: Optional[str] = None
+    tags: Optional[str] = None
+    category: Optional[str] = None
+    image_url: Optional[str] = None
+    excerpt: Optional[str] = None
+    view_count: Optional[int] = None
+    variants: Optional[List[ImageVariant]] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class TagCount(BaseModel):
+    name: str
+    count: int
+
+class PostSearchHit(BaseModel):
+    post: Post
+    score: float  # Higher is more relevant
+    snippet: Optional[str] = None  # HTML-escaped excerpt with <mark> around matches
+    
+    model_config = ConfigDict(from_attributes=True)
+
 # Certificate
 class CertificateBase(BaseModel):
     title: str
@@ -62,13 +115,30 @@ class CertificateBase(BaseModel):
 class CertificateCreate(CertificateBase):
     pass
 
+class CertificateImport(CertificateBase):
+    image_url: str  # A file already in the store; bulk writes take no uploads
+
+class CertificateUpsert(CertificateImport):
+    id: Optional[int] = None  # Replace this certificate; without one it is created
+
 class Certificate(CertificateBase):
     id: int
     image_url: str
+    variants: Optional[List[ImageVariant]] = None
     created_at: datetime
     
     model_config = ConfigDict(from_attributes=True)
 
+# A certificate as ?fields= lists it
+class CertificateFields(BaseModel):
+    id: int
+    title: Optional[str] = None
+    issuer: Optional[str] = None
+    date: Optional[str] = None
+    image_url: Optional[str] = None
+    variants: Optional[List[ImageVariant]] = None
+    created_at: Optional[datetime] = None
+
 class CertificateUpdate(BaseModel):
     title: Optional[str] = None
     issuer: Optional[str] = None
@@ -81,7 +151,7 @@ class SkillBase(BaseModel):
     proficiency: Optional[int] = Field(None, ge=0, le=100)
     icon_url: Optional[str] = None
     color: Optional[str] = None
-    order: Optional[int] = 0
+    order: int = 0  # Part of the pagination keyset, so never null
     is_featured: Optional[bool] = False
 
 class SkillCreate(SkillBase):
@@ -95,10 +165,127 @@ class SkillUpdate(BaseModel):
     color: Optional[str] = None
     order: Optional[int] = None
     is_featured: Optional[bool] = None
+    
+    @field_validator("order")
+    @classmethod
+    def order_not_null(cls, value):
+        # Omit order to leave it unchanged; null would drop the skill out of cursor pages
+        if value is None:
+            raise ValueError("order can't be null")
+        return value
+
+class SkillMove(BaseModel):
+    id: int
+    after: Optional[int] = None  # Skill to place it right after; None moves it to the front
+
+class SkillReorder(BaseModel):
+    ids: Optional[List[int]] = Field(None, max_length=1000)  # Skills in their new order
+    moves: Optional[List[SkillMove]] = Field(None, max_length=1000)  # Applied one after another
+
+class SkillOrder(BaseModel):
+    id: int
+    order: int
 
 class Skill(SkillBase):
     id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
     
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+# A skill as ?fields= lists it
+class SkillFields(BaseModel):
+    id: int
+    name: Optional[str] = None
+    category: Optional[str] = None
+    proficiency: Optional[int] = None
+    icon_url: Optional[str] = None
+    color: Optional[str] = None
+    order: Optional[int] = None
+    is_featured: Optional[bool] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+# Skill statistics
+class CategoryCount(BaseModel):
+    category: str
+    count: int
+
+class ProficiencyLevels(BaseModel):
+    average_proficiency: float
+    max_proficiency: int
+    min_proficiency: int
+    total_skills: int
+
+class HistogramBucket(BaseModel):
+    range: str  # Inclusive proficiency range, e.g. "80-100"
+    count: int
+
+class SkillStatsSummary(BaseModel):
+    total_skills: int
+    rated_skills: int  # Skills with a proficiency; the figures below cover these
+    average_proficiency: float
+    min_proficiency: Optional[int] = None
+    max_proficiency: Optional[int] = None
+    histogram: List[HistogramBucket]
+
+class CategorySkillStats(SkillStatsSummary):
+    category: str
+
+class SkillStats(SkillStatsSummary):
+    categories: List[CategorySkillStats]
+
+# Bulk writes: one result per item, in request order
+class BulkItemResult(BaseModel):
+    index: int  # Position in the request
+    status: str  # created, updated, deleted or error
+    id: Optional[int] = None
+    detail: Optional[str] = None  # Why the item was skipped
+
+class BulkResult(BaseModel):
+    results: List[BulkItemResult]
+    created: int
+    updated: int
+    deleted: int
+    failed: int
+
+# Export/import: rows as /api/export writes them. Ids and timestamps given on
+# import are kept; without an id a row is created.
+class PostRecord(PostBase):
+    id: Optional[int] = None
+    excerpt: Optional[str] = None
+    variants: Optional[List[ImageVariant]] = None
+    view_count: int = 0
+    popularity: float = 0.0
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class CertificateRecord(CertificateImport):
+    id: Optional[int] = None
+    variants: Optional[List[ImageVariant]] = None
+    created_at: Optional[datetime] = None
+
+class SkillRecord(SkillBase):
+    id: Optional[int] = None  # Without one, a skill of the same name is updated
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class ImportCounts(BaseModel):
+    created: int = 0
+    updated: int = 0
+
+class ImportResult(BaseModel):
+    tables: Dict[str, ImportCounts]
+    rows: int
+    batches: int  # Transactions committed
+
+# Everything the landing page shows, in one response
+class Portfolio(BaseModel):
+    posts: List[Post]
+    certificates: List[Certificate]
+    skills: List[Skill]
+    skill_categories: List[str]
+    featured_skills: List[Skill]
+    category_distribution: List[CategoryCount]
+    proficiency_levels: ProficiencyLevels
+    skill_stats: SkillStats
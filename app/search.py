@@ -0,0 +1,115 @@
+import html
+import re
+import sys
+
+from sqlalchemy import column, func, literal_column, or_, select, table, text
+
+from app.models import Post
+
+# External-content FTS5 index over posts: the text lives only in ``posts`` and
+# the triggers below keep the index in step with every insert/update/delete
+SEARCH_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+        title, content, tags,
+        content='posts', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_fts_ai AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_fts(rowid, title, content, tags)
+        VALUES (new.id, new.title, new.content, new.tags);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_fts_ad AFTER DELETE ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, content, tags)
+        VALUES ('delete', old.id, old.title, old.content, old.tags);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_fts_au AFTER UPDATE OF title, content, tags ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, content, tags)
+        VALUES ('delete', old.id, old.title, old.content, old.tags);
+        INSERT INTO posts_fts(rowid, title, content, tags)
+        VALUES (new.id, new.title, new.content, new.tags);
+    END
+    """,
+]
+
+# bm25 column weights: a hit in the title outranks one in the tags or body
+TITLE_WEIGHT, CONTENT_WEIGHT, TAGS_WEIGHT = 10.0, 1.0, 5.0
+
+# Snippet markers are control characters, swapped for <mark> only after the
+# surrounding post text has been HTML-escaped
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+posts_fts = table("posts_fts", column("rowid"))
+_fts = literal_column("posts_fts")
+
+
+def ensure_search_index(connection):
+    """Create the index and its triggers; the first time, index existing posts"""
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posts_fts'")
+    ).first()
+    for statement in SEARCH_INDEX_DDL:
+        connection.execute(text(statement))
+    if not exists:
+        rebuild_search_index(connection)
+
+
+def rebuild_search_index(connection):
+    connection.execute(text("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')"))
+
+
+def build_match_query(q: str):
+    """Turn free text into a safe FTS5 query: every word must match, and the
+    last one may be a prefix so results update while typing"""
+    terms = re.findall(r"\w+", q)
+    if not terms:
+        return None
+    quoted = ['"%s"' % term for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def render_snippet(snippet):
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def search_statement(match: str, limit: int, offset: int):
+    rank = func.bm25(_fts, TITLE_WEIGHT, CONTENT_WEIGHT, TAGS_WEIGHT)
+    snippet = func.snippet(_fts, -1, _MARK_START, _MARK_END, "…", 16)
+    return (
+        select(Post, rank.label("rank"), snippet.label("snippet"))
+        .join(posts_fts, posts_fts.c.rowid == Post.id)
+        .where(_fts.op("MATCH")(match))
+        .order_by(rank, Post.id.desc())
+        .limit(limit)
+        .offset(offset)
+    )
+
+
+def fallback_statement(q: str, limit: int, offset: int):
+    """Unranked LIKE search for databases without FTS5"""
+    query = select(Post)
+    for term in re.findall(r"\w+", q):
+        pattern = f"%{term}%"
+        query = query.where(or_(
+            Post.title.ilike(pattern), Post.content.ilike(pattern), Post.tags.ilike(pattern)
+        ))
+    return query.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit).offset(offset)
+
+
+if __name__ == "__main__":
+    from app.database import engine
+
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python -m app.search rebuild")
+    with engine.begin() as connection:
+        ensure_search_index(connection)
+        rebuild_search_index(connection)
+    print("✓ Search index rebuilt")
@@ -0,0 +1,138 @@
+"""Display order of skills, kept as integer keys with gaps between them.
+
+A reorder works out the complete new sequence, keeps the keys of the longest
+run of skills that are already in ascending key order, and gives only the
+others new keys in the gaps between their neighbours. Moving one skill
+rewrites one row; keys start ``ORDER_KEY_GAP`` apart, so there is room for
+many moves into the same gap. Only when a gap is used up is every skill
+renumbered, in one statement.
+"""
+import os
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, select, update
+
+from app.conditional import bump_table_version
+from app.models import Skill
+
+ORDER_KEY_GAP = int(os.getenv("SKILL_ORDER_KEY_GAP", 1024))
+
+
+def reorder_subset(sequence: Sequence[int], ids: Sequence[int]) -> List[int]:
+    """``sequence`` with the skills in ``ids`` put in that order, in the
+    positions they already hold; ``ids`` may be every skill or a few of them"""
+    listed = set(ids)
+    placed = iter(ids)
+    return [next(placed) if skill_id in listed else skill_id for skill_id in sequence]
+
+
+def apply_moves(sequence: Sequence[int], moves) -> List[int]:
+    """``sequence`` after each move in turn: the skill goes right after
+    ``move.after``, or to the front when ``after`` is None"""
+    sequence = list(sequence)
+    for move in moves:
+        if move.after == move.id:
+            raise HTTPException(status_code=400, detail=f"Skill {move.id} can't be moved after itself")
+        sequence.remove(move.id)
+        sequence.insert(0 if move.after is None else sequence.index(move.after) + 1, move.id)
+    return sequence
+
+
+def _increasing_run(keys: Sequence[Optional[int]]) -> set:
+    """Positions of a longest strictly increasing subsequence of ``keys``,
+    leaving out missing keys"""
+    tails, tail_positions, previous = [], [], [None] * len(keys)
+    for position, key in enumerate(keys):
+        if key is None:
+            continue
+        length = bisect_left(tails, key)
+        if length == len(tails):
+            tails.append(key)
+            tail_positions.append(position)
+        else:
+            tails[length] = key
+            tail_positions[length] = position
+        previous[position] = tail_positions[length - 1] if length else None
+    run = set()
+    position = tail_positions[-1] if tail_positions else None
+    while position is not None:
+        run.add(position)
+        position = previous[position]
+    return run
+
+
+def assign_order_keys(keys: Dict[int, Optional[int]], target: Sequence[int]) -> Dict[int, int]:
+    """New keys, by skill id, that put ``target`` in ascending key order;
+    skills whose key can stay are left out"""
+    current = [keys[skill_id] for skill_id in target]
+    kept = _increasing_run(current)
+    changes = {}
+    position = 0
+    while position < len(target):
+        if position in kept:
+            position += 1
+            continue
+        end = position
+        while end < len(target) and end not in kept:
+            end += 1
+        low = current[position - 1] if position > 0 else None
+        high = current[end] if end < len(target) else None
+        count = end - position
+        if low is None and high is None:
+            new_keys = [ORDER_KEY_GAP * (offset + 1) for offset in range(count)]
+        elif low is None:
+            new_keys = [high - ORDER_KEY_GAP * (count - offset) for offset in range(count)]
+        elif high is None:
+            new_keys = [low + ORDER_KEY_GAP * (offset + 1) for offset in range(count)]
+        elif high - low > count:
+            step = (high - low) // (count + 1)
+            new_keys = [low + step * (offset + 1) for offset in range(count)]
+        else:
+            # No room left between the neighbours: spread everything out again
+            return {
+                skill_id: ORDER_KEY_GAP * (offset + 1)
+                for offset, skill_id in enumerate(target)
+                if keys[skill_id] != ORDER_KEY_GAP * (offset + 1)
+            }
+        for offset, key in enumerate(new_keys):
+            current[position + offset] = key
+            changes[target[position + offset]] = key
+        position = end
+    return changes
+
+
+def reorder_skills(connection, ids: Optional[Sequence[int]] = None, moves=None):
+    """Apply a reorder in the caller's transaction; returns the skills as
+    ``(id, order)`` in their new display order"""
+    # Taking the write lock first means no other writer can change the keys
+    # between reading and rewriting them
+    bump_table_version(connection, "skills")
+    rows = connection.execute(
+        select(Skill.id, Skill.order).order_by(Skill.order, Skill.name, Skill.id)
+    ).all()
+    keys = dict(rows)
+    requested = list(ids or []) + [move.id for move in moves or []] + [
+        move.after for move in moves or [] if move.after is not None
+    ]
+    missing = sorted(set(requested) - keys.keys())
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Skills not found: {', '.join(map(str, missing))}")
+    if ids is not None and len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Each skill may appear only once")
+
+    sequence = [skill_id for skill_id, _ in rows]
+    if ids is not None:
+        sequence = reorder_subset(sequence, ids)
+    if moves:
+        sequence = apply_moves(sequence, moves)
+    changes = assign_order_keys(keys, sequence)
+    if changes:
+        skills = Skill.__table__
+        connection.execute(
+            update(skills).where(skills.c.id == bindparam("skill_id")).values(order=bindparam("new_order")),
+            [{"skill_id": skill_id, "new_order": key} for skill_id, key in changes.items()],
+        )
+    keys.update(changes)
+    return [(skill_id, keys[skill_id]) for skill_id in sequence]
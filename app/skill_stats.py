@@ -0,0 +1,165 @@
+"""Skill statistics kept in ``skill_stats``, one row per category.
+
+Every skill write adjusts the counts, sum and histogram of the categories it
+leaves and enters, so reading the statistics means reading a handful of rows
+however many skills there are. Only removing a category's current minimum or
+maximum needs a query, and that one is limited to the category.
+"""
+import sys
+from collections import defaultdict
+
+from sqlalchemy import delete, event, func, insert, inspect, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models import Skill, SkillStat
+
+# Inclusive proficiency ranges of the histogram buckets
+PROFICIENCY_BUCKETS = ((0, 19), (20, 39), (40, 59), (60, 79), (80, 100))
+
+
+def _bucket(proficiency: int) -> int:
+    for position, (low, high) in enumerate(PROFICIENCY_BUCKETS):
+        if proficiency <= high:
+            return position
+    return len(PROFICIENCY_BUCKETS) - 1
+
+
+def _in_category(category: str):
+    if category:
+        return Skill.category == category
+    return or_(Skill.category.is_(None), Skill.category == "")
+
+
+def apply_skill_changes(connection, category: str, changes):
+    """Fold ``(proficiency, +1/-1)`` changes into the row for ``category``"""
+    row = connection.execute(select(SkillStat.__table__).where(SkillStat.category == category)).mappings().first()
+    stats = dict(row) if row else {
+        "category": category, "skill_count": 0, "rated_count": 0, "proficiency_sum": 0,
+        "min_proficiency": None, "max_proficiency": None,
+    }
+    histogram = list(stats.get("histogram") or [0] * len(PROFICIENCY_BUCKETS))
+    lost_extreme = False
+    for proficiency, sign in changes:
+        stats["skill_count"] += sign
+        if proficiency is None:
+            continue
+        stats["rated_count"] += sign
+        stats["proficiency_sum"] += sign * proficiency
+        histogram[_bucket(proficiency)] += sign
+        if sign > 0:
+            stats["min_proficiency"] = min(stats["min_proficiency"] if stats["min_proficiency"] is not None else proficiency, proficiency)
+            stats["max_proficiency"] = max(stats["max_proficiency"] if stats["max_proficiency"] is not None else proficiency, proficiency)
+        elif proficiency in (stats["min_proficiency"], stats["max_proficiency"]):
+            lost_extreme = True
+    stats["histogram"] = histogram
+
+    if stats["skill_count"] <= 0:
+        connection.execute(delete(SkillStat).where(SkillStat.category == category))
+        return
+    if lost_extreme:
+        # Runs after the flush, so the skills table already reflects the change
+        stats["min_proficiency"], stats["max_proficiency"] = connection.execute(
+            select(func.min(Skill.proficiency), func.max(Skill.proficiency)).where(_in_category(category))
+        ).one()
+    if row is None:
+        connection.execute(insert(SkillStat).values(**stats))
+    else:
+        connection.execute(update(SkillStat).where(SkillStat.category == category).values(**stats))
+
+
+def _committed(obj, attribute):
+    history = inspect(obj).attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, attribute)
+
+
+@event.listens_for(Session, "after_flush")
+def _update_skill_stats(session, flush_context):
+    changes = defaultdict(list)
+    for obj in session.new:
+        if isinstance(obj, Skill):
+            changes[obj.category or ""].append((obj.proficiency, 1))
+    for obj in session.deleted:
+        if isinstance(obj, Skill):
+            changes[_committed(obj, "category") or ""].append((_committed(obj, "proficiency"), -1))
+    for obj in session.dirty:
+        if not isinstance(obj, Skill):
+            continue
+        state = inspect(obj)
+        if state.attrs.category.history.has_changes() or state.attrs.proficiency.history.has_changes():
+            changes[_committed(obj, "category") or ""].append((_committed(obj, "proficiency"), -1))
+            changes[obj.category or ""].append((obj.proficiency, 1))
+    for category, category_changes in sorted(changes.items()):
+        apply_skill_changes(session.connection(), category, category_changes)
+
+
+def rebuild_skill_stats(connection):
+    connection.execute(delete(SkillStat))
+    changes = defaultdict(list)
+    rows = connection.execute(
+        select(Skill.category, Skill.proficiency, func.count()).group_by(Skill.category, Skill.proficiency)
+    ).all()
+    for category, proficiency, count in rows:
+        changes[category or ""].extend([(proficiency, 1)] * count)
+    for category, category_changes in sorted(changes.items()):
+        apply_skill_changes(connection, category, category_changes)
+
+
+def backfill_skill_stats(connection):
+    """Populate the table for databases created before it existed"""
+    if connection.execute(select(SkillStat.category).limit(1)).first() is not None:
+        return
+    rebuild_skill_stats(connection)
+
+
+def _histogram(counts):
+    return [
+        {"range": f"{low}-{high}", "count": count}
+        for (low, high), count in zip(PROFICIENCY_BUCKETS, counts)
+    ]
+
+
+def _summary(skill_count, rated_count, proficiency_sum, minimum, maximum, histogram):
+    return {
+        "total_skills": skill_count,
+        "rated_skills": rated_count,
+        "average_proficiency": round(proficiency_sum / rated_count, 2) if rated_count else 0,
+        "min_proficiency": minimum,
+        "max_proficiency": maximum,
+        "histogram": _histogram(histogram),
+    }
+
+
+async def load_skill_stats(db):
+    """Overall and per-category statistics, assembled from the summary rows"""
+    rows = (await db.scalars(select(SkillStat).order_by(SkillStat.category))).all()
+    minimums = [row.min_proficiency for row in rows if row.min_proficiency is not None]
+    maximums = [row.max_proficiency for row in rows if row.max_proficiency is not None]
+    overall = _summary(
+        sum(row.skill_count for row in rows),
+        sum(row.rated_count for row in rows),
+        sum(row.proficiency_sum for row in rows),
+        min(minimums) if minimums else None,
+        max(maximums) if maximums else None,
+        [sum(counts) for counts in zip(*[row.histogram for row in rows])] or [0] * len(PROFICIENCY_BUCKETS),
+    )
+    overall["categories"] = [
+        dict(category=row.category, **_summary(
+            row.skill_count, row.rated_count, row.proficiency_sum,
+            row.min_proficiency, row.max_proficiency, row.histogram,
+        ))
+        for row in rows
+        if row.category  # Skills without a category only count towards the totals
+    ]
+    return overall
+
+
+if __name__ == "__main__":
+    from app.database import engine
+
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python -m app.skill_stats rebuild")
+    with engine.begin() as connection:
+        rebuild_skill_stats(connection)
+    print("✓ Skill statistics rebuilt")
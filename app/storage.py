@@ -0,0 +1,388 @@
+"""Content-addressed storage for uploaded files.
+
+Multipart request bodies are capped while they arrive by
+``UploadLimitMiddleware``, before the form parser spools them to disk.
+Uploads are then type-checked by their magic bytes, size-limited per type and
+hashed while they are streamed to a temp file (writes run on the threadpool,
+so the event loop never blocks on disk), then renamed to
+``<kind>/<sha256><ext>`` under the upload root, so identical files are stored
+once and a crashed write never leaves a half-written file under a served name.
+
+``stored_files`` counts how many posts/certificates point at each file. The
+counts are kept by a flush listener that watches ``image_url``, so handlers
+only save the file and set the URL; a file is removed once the last row
+referencing it is committed away.
+
+A file saved for a session counts as in use until that session's transaction
+ends, and is only removed, under a per-path lock, once it is neither in use
+nor referenced by a committed row. So removing an orphan can't take a file
+that a concurrent upload of the same bytes is about to commit, and a file
+saved for a transaction that rolls back is removed with it. The listeners
+only note which paths to look at; the check and the removal run on the
+threadpool once the commit or rollback has returned (see
+``run_after_transaction``), never on the event loop.
+"""
+import glob
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, event, inspect, insert, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.database import engine, run_after_transaction
+from app.images import UPLOAD_ROOT, VARIANTS_DIRNAME
+from app.media import ENCODINGS
+from app.models import Certificate, Post, StoredFile
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_IMAGE_SIZE = int(os.getenv("UPLOAD_MAX_IMAGE_SIZE", 10 * 1024 * 1024))  # bytes
+UPLOAD_MAX_PDF_SIZE = int(os.getenv("UPLOAD_MAX_PDF_SIZE", 25 * 1024 * 1024))  # bytes
+
+# Accepted file types: stored extension and size limit, recognized by magic bytes
+UPLOAD_TYPES = {
+    "png": (".png", UPLOAD_MAX_IMAGE_SIZE),
+    "jpeg": (".jpg", UPLOAD_MAX_IMAGE_SIZE),
+    "gif": (".gif", UPLOAD_MAX_IMAGE_SIZE),
+    "webp": (".webp", UPLOAD_MAX_IMAGE_SIZE),
+    "pdf": (".pdf", UPLOAD_MAX_PDF_SIZE),
+}
+# Multipart bodies may exceed the largest file by this much for the other form
+# fields and the part headers
+UPLOAD_FORM_OVERHEAD = int(os.getenv("UPLOAD_FORM_OVERHEAD", 64 * 1024))  # bytes
+UPLOAD_MAX_REQUEST_SIZE = max(limit for _, limit in UPLOAD_TYPES.values()) + UPLOAD_FORM_OVERHEAD
+IMAGE_TYPES = ("png", "jpeg", "gif", "webp")
+DOCUMENT_TYPES = IMAGE_TYPES + ("pdf",)
+
+# Models whose image_url holds references to stored files
+REFERENCING_MODELS = (Post, Certificate)
+
+_STORED_URL = re.compile(r"^/static/(?P<path>[\w-]+/[0-9a-f]{64}(\.\w+)?)$")
+
+# Saving, releasing and removing a stored file happen under its path's lock;
+# paths share a fixed set of locks
+_PATH_LOCKS = [threading.Lock() for _ in range(64)]
+# Files saved for a session whose transaction hasn't ended yet, by path
+_in_use = Counter()
+
+
+def stored_path(url: Optional[str]) -> Optional[str]:
+    """Path relative to the upload root if ``url`` names a stored file.
+
+    Files uploaded before content addressing are not tracked and never removed."""
+    match = _STORED_URL.match(url or "")
+    return match.group("path") if match else None
+
+
+def sniff_type(head: bytes) -> Optional[str]:
+    """Name of the UPLOAD_TYPES entry whose signature starts ``head``"""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    return None
+
+
+def _too_large(file_type: str, limit: int):
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File too large. Maximum size for {file_type} files is {limit // (1024 * 1024)} MB",
+    )
+
+
+def _request_too_large(limit: int):
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Request too large. Maximum upload size is {limit // (1024 * 1024)} MB",
+    )
+
+
+class UploadLimitMiddleware:
+    """Reject multipart requests larger than ``max_size`` with 413, from the
+    ``Content-Length`` before any of the body is read, or, without one, as
+    soon as the bytes received pass the limit, so an oversized upload is
+    neither read to the end nor spooled to disk"""
+
+    def __init__(self, app: ASGIApp, max_size: int = UPLOAD_MAX_REQUEST_SIZE):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if not headers.get("content-type", "").startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+        content_length = headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.max_size:
+            error = _request_too_large(self.max_size)
+            response = JSONResponse({"detail": error.detail}, status_code=error.status_code)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    # Raised from inside the form parser; FastAPI answers it as is
+                    raise _request_too_large(self.max_size)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def check_type(head: bytes, allowed_types: Iterable[str], size: Optional[int] = None) -> Tuple[str, int]:
+    """Detected type of a file starting with ``head``, and its size limit.
+
+    Raises 400 for a type outside ``allowed_types`` and 413 if a known
+    ``size`` is already over the limit."""
+    file_type = sniff_type(head)
+    if file_type not in allowed_types:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type. Allowed types: {', '.join(allowed_types)}"
+        )
+    limit = UPLOAD_TYPES[file_type][1]
+    if size is not None and size > limit:
+        raise _too_large(file_type, limit)
+    return file_type, limit
+
+
+def _write_chunk(out, digest, chunk: bytes):
+    digest.update(chunk)
+    out.write(chunk)
+
+
+def _finish(out):
+    out.flush()
+    os.fsync(out.fileno())
+    out.close()
+
+
+def _path_lock(path: str) -> threading.Lock:
+    return _PATH_LOCKS[hash(path) % len(_PATH_LOCKS)]
+
+
+def _is_referenced(path: str) -> bool:
+    # Read through a connection of its own, so it sees what is committed now
+    with engine.connect() as connection:
+        return connection.scalar(select(StoredFile.path).where(StoredFile.path == path)) is not None
+
+
+def _publish(session, tmp_path: str, file_location: str, path: str):
+    """Rename a finished temp file to its stored name; with a session (whose
+    transaction has begun) the file stays in use until that transaction ends"""
+    with _path_lock(path):
+        # Same name means same bytes, so replacing an existing copy is harmless
+        os.replace(tmp_path, file_location)
+        if session is not None:
+            _in_use[path] += 1
+            session.info.setdefault("saved_uploads", []).append(path)
+
+
+async def _store(db, tmp_path: str, kind: str, name: str) -> Tuple[str, str]:
+    path = f"{kind}/{name}"
+    file_location = os.path.join(UPLOAD_ROOT, kind, name)
+    session = None
+    if db is not None:
+        # Starts the transaction whose end releases the file
+        await db.run_sync(lambda session: session.connection())
+        session = db.sync_session
+    await run_in_threadpool(_publish, session, tmp_path, file_location, path)
+    return file_location, f"/static/{path}"
+
+
+async def save_upload(
+    upload: UploadFile, kind: str, allowed_types: Iterable[str] = DOCUMENT_TYPES, db=None
+) -> Tuple[str, str]:
+    """Stream ``upload`` into the store; returns ``(file_location, url)``.
+
+    Raises 400 if its content is not one of ``allowed_types`` and 413 if it
+    is larger than that type's size limit. Pass the session that will
+    reference the file as ``db``: the file is kept while it is open and
+    removed after a rollback."""
+    head = await upload.read(UPLOAD_CHUNK_SIZE)
+    file_type, limit = check_type(head, allowed_types, upload.size)
+    suffix = UPLOAD_TYPES[file_type][0]
+
+    directory = os.path.join(UPLOAD_ROOT, kind)
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+    out = os.fdopen(fd, "wb")
+    try:
+        size = 0
+        chunk = head
+        while chunk:
+            size += len(chunk)
+            if size > limit:
+                raise _too_large(file_type, limit)
+            await run_in_threadpool(_write_chunk, out, digest, chunk)
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        await run_in_threadpool(_finish, out)
+        return await _store(db, tmp_path, kind, f"{digest.hexdigest()}{suffix}")
+    finally:
+        out.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _copy_to_temp(source_path: str, kind: str, allowed_types: Iterable[str]) -> Tuple[str, str]:
+    """Check ``source_path`` and copy it to a temp file in the store while
+    hashing it; returns the temp path and the stored name"""
+    with open(source_path, "rb") as source:
+        head = source.read(16)
+        file_type, _ = check_type(head, allowed_types, os.fstat(source.fileno()).st_size)
+        directory = os.path.join(UPLOAD_ROOT, kind)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+        out = os.fdopen(fd, "wb")
+        try:
+            chunk = head
+            while chunk:
+                _write_chunk(out, digest, chunk)
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+            _finish(out)
+        except BaseException:
+            out.close()
+            os.remove(tmp_path)
+            raise
+    return tmp_path, f"{digest.hexdigest()}{UPLOAD_TYPES[file_type][0]}"
+
+
+async def store_file(
+    source_path: str, kind: str, allowed_types: Iterable[str] = DOCUMENT_TYPES, db=None
+) -> Tuple[str, str]:
+    """Copy a complete file already on disk into the store, with the same
+    checks as ``save_upload``; returns ``(file_location, url)``. The source
+    is left in place."""
+    tmp_path, name = await run_in_threadpool(_copy_to_temp, source_path, kind, allowed_types)
+    try:
+        return await _store(db, tmp_path, kind, name)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def remove_stored_file(path: str):
+    """Delete a stored file, its precompressed siblings and every image
+    variant generated from it"""
+    file_location = os.path.join(UPLOAD_ROOT, path)
+    stem = Path(path).stem
+    variants = glob.glob(os.path.join(os.path.dirname(file_location), VARIANTS_DIRNAME, f"{stem}-*"))
+    siblings = [file_location + suffix for _, suffix in ENCODINGS]
+    for location in [file_location] + siblings + variants:
+        try:
+            os.remove(location)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Warning: Could not delete stored file: {str(e)}")
+
+
+def _remove_if_unused(path: str):
+    """Remove a stored file unless a session still has it in use or a
+    committed row references it"""
+    with _path_lock(path):
+        if _in_use[path] or _is_referenced(path):
+            return
+        remove_stored_file(path)
+
+
+def _remove_orphans(paths):
+    for path in paths:
+        # A concurrent upload may have saved or committed the same file since
+        _remove_if_unused(path)
+
+
+def _release(paths):
+    for path in paths:
+        with _path_lock(path):
+            _in_use[path] -= 1
+            if not _in_use[path]:
+                del _in_use[path]
+        # Committed rows keep it; after a rollback nothing may
+        _remove_if_unused(path)
+
+
+def _reference_changes(session):
+    changes = Counter()
+    for obj in session.new:
+        if isinstance(obj, REFERENCING_MODELS):
+            changes[stored_path(obj.image_url)] += 1
+    for obj in session.deleted:
+        if isinstance(obj, REFERENCING_MODELS):
+            changes[stored_path(obj.image_url)] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, REFERENCING_MODELS):
+            history = inspect(obj).attrs.image_url.history
+            for url in history.added:
+                changes[stored_path(url)] += 1
+            for url in history.deleted:
+                changes[stored_path(url)] -= 1
+    changes.pop(None, None)
+    return {path: delta for path, delta in changes.items() if delta}
+
+
+@event.listens_for(Session, "before_flush")
+def _count_references_on_flush(session, flush_context, instances):
+    connection = None
+    for path, delta in sorted(_reference_changes(session).items()):
+        connection = connection or session.connection()
+        result = connection.execute(
+            update(StoredFile).where(StoredFile.path == path).values(ref_count=StoredFile.ref_count + delta)
+        )
+        if result.rowcount == 0 and delta > 0:
+            location = os.path.join(UPLOAD_ROOT, path)
+            size = os.path.getsize(location) if os.path.exists(location) else None
+            connection.execute(insert(StoredFile).values(path=path, ref_count=delta, size=size))
+        elif delta < 0:
+            orphaned = connection.execute(
+                delete(StoredFile).where(StoredFile.path == path, StoredFile.ref_count <= 0)
+            )
+            if orphaned.rowcount:
+                session.info.setdefault("orphaned_uploads", set()).add(path)
+
+
+@event.listens_for(Session, "after_commit")
+def _remove_orphaned_uploads(session):
+    orphaned = session.info.pop("orphaned_uploads", None)
+    if orphaned:
+        run_after_transaction(session, _remove_orphans, sorted(orphaned))
+
+
+@event.listens_for(Session, "after_rollback")
+def _keep_orphaned_uploads(session):
+    session.info.pop("orphaned_uploads", None)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _release_saved_uploads(session, transaction):
+    if transaction.parent is not None:
+        return
+    saved = session.info.pop("saved_uploads", None)
+    if saved:
+        run_after_transaction(session, _release, saved)
@@ -0,0 +1,114 @@
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import bindparam, delete, event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from app.models import Post, PostTag, Tag
+
+
+def parse_tags(tags: Optional[str]) -> Set[str]:
+    """Split the comma-separated ``Post.tags`` string into normalized names"""
+    if not tags:
+        return set()
+    return {name.strip().lower() for name in tags.split(",") if name.strip()}
+
+
+def _tag_ids(connection, names: Iterable[str], create: bool = False):
+    names = set(names)
+    if not names:
+        return {}
+    found = dict(connection.execute(select(Tag.name, Tag.id).where(Tag.name.in_(names))).all())
+    missing = names - found.keys()
+    if create and missing:
+        connection.execute(insert(Tag), [{"name": name, "post_count": 0} for name in sorted(missing)])
+        found.update(connection.execute(select(Tag.name, Tag.id).where(Tag.name.in_(missing))).all())
+    return found
+
+
+def sync_post_tags(connection, names_by_post: Dict[int, Set[str]]):
+    """Make post_tags for each post match its set of names and adjust tag
+    counts, in a fixed number of statements however many posts there are"""
+    if not names_by_post:
+        return
+    current = defaultdict(dict)
+    rows = connection.execute(
+        select(PostTag.post_id, Tag.name, Tag.id)
+        .join(Tag, Tag.id == PostTag.tag_id)
+        .where(PostTag.post_id.in_(list(names_by_post)))
+    ).all()
+    for post_id, name, tag_id in rows:
+        current[post_id][name] = tag_id
+
+    removed, added = [], []
+    deltas = Counter()
+    for post_id, names in names_by_post.items():
+        for name in current[post_id].keys() - names:
+            removed.append({"link_post_id": post_id, "link_tag_id": current[post_id][name]})
+            deltas[current[post_id][name]] -= 1
+    wanted = set().union(*(names - current[post_id].keys() for post_id, names in names_by_post.items()))
+    tag_ids = _tag_ids(connection, wanted, create=True)
+    for post_id, names in names_by_post.items():
+        for name in names - current[post_id].keys():
+            added.append({"post_id": post_id, "tag_id": tag_ids[name]})
+            deltas[tag_ids[name]] += 1
+
+    if removed:
+        connection.execute(
+            delete(PostTag).where(
+                PostTag.post_id == bindparam("link_post_id"), PostTag.tag_id == bindparam("link_tag_id")
+            ),
+            removed,
+        )
+    if added:
+        connection.execute(insert(PostTag), added)
+    changed = [{"count_tag_id": tag_id, "delta": delta} for tag_id, delta in sorted(deltas.items()) if delta]
+    if changed:
+        connection.execute(
+            update(Tag).where(Tag.id == bindparam("count_tag_id")).values(post_count=Tag.post_count + bindparam("delta")),
+            changed,
+        )
+
+
+@event.listens_for(Session, "before_flush")
+def _unlink_deleted_posts(session, flush_context, instances):
+    # Runs before the DELETE so the links (and counts) are still there to undo
+    deleted = {obj.id: set() for obj in session.deleted if isinstance(obj, Post)}
+    if deleted:
+        sync_post_tags(session.connection(), deleted)
+
+
+@event.listens_for(Session, "after_flush")
+def _link_written_posts(session, flush_context):
+    # After the INSERT, so new posts have their id
+    written = {obj.id: parse_tags(obj.tags) for obj in session.new if isinstance(obj, Post)}
+    for obj in session.dirty:
+        if isinstance(obj, Post) and inspect(obj).attrs.tags.history.has_changes():
+            written[obj.id] = parse_tags(obj.tags)
+    if written:
+        sync_post_tags(session.connection(), written)
+
+
+def backfill_post_tags(connection, batch_size: int = 500):
+    """One-off migration from the tags string column; a no-op once tags exist"""
+    if connection.execute(select(Tag.id).limit(1)).first() is not None:
+        return
+    rows = connection.execute(select(Post.id, Post.tags).where(Post.tags.isnot(None))).all()
+    for start in range(0, len(rows), batch_size):
+        sync_post_tags(connection, {post_id: parse_tags(tags) for post_id, tags in rows[start:start + batch_size]})
+
+
+def tag_filter(names: Iterable[str], match_all: bool = False):
+    """Condition on Post.id for posts carrying any (or all) of ``names``, or
+    None when no name is left after normalizing (``?tag=`` filters nothing)"""
+    names = {name.strip().lower() for name in names if name.strip()}
+    if not names:
+        return None
+    post_ids = (
+        select(PostTag.post_id)
+        .join(Tag, Tag.id == PostTag.tag_id)
+        .where(Tag.name.in_(names))
+    )
+    if match_all:
+        post_ids = post_ids.group_by(PostTag.post_id).having(func.count() == len(names))
+    return Post.id.in_(post_ids)
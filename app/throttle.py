@@ -0,0 +1,108 @@
+import asyncio
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+from app.cache import TTLCache
+
+LOGIN_MAX_ATTEMPTS_PER_USER = int(os.getenv("LOGIN_MAX_ATTEMPTS_PER_USER", 5))
+LOGIN_MAX_ATTEMPTS_PER_IP = int(os.getenv("LOGIN_MAX_ATTEMPTS_PER_IP", 20))
+LOGIN_ATTEMPT_WINDOW = int(os.getenv("LOGIN_ATTEMPT_WINDOW", 300))  # seconds
+LOGIN_MAX_CONCURRENT = int(os.getenv("LOGIN_MAX_CONCURRENT", 4))
+LOGIN_QUEUE_TIMEOUT = float(os.getenv("LOGIN_QUEUE_TIMEOUT", 5))  # seconds
+
+
+class LoginThrottle:
+    """Sliding-window failure limits per username and per client IP, plus a cap
+    on how many password checks may be in flight at once. Attempts still
+    queued or being checked count against the limits as if they had failed."""
+
+    def __init__(self, max_per_user, max_per_ip, window, max_concurrent, queue_timeout, max_keys=10000):
+        self.max_per_user = max_per_user
+        self.max_per_ip = max_per_ip
+        self.window = window
+        self.queue_timeout = queue_timeout
+        self._failures = TTLCache(maxsize=max_keys, ttl=window)
+        self._pending = Counter()  # attempts between check and outcome, per key
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    def _recent(self, key, now):
+        return [t for t in self._failures.get(key, ()) if t > now - self.window]
+
+    def retry_after(self, username: str, ip: Optional[str]) -> Optional[int]:
+        """Seconds until another attempt is allowed, or None if it is allowed now"""
+        now = time.monotonic()
+        waits = []
+        for key, limit in ((("user", username), self.max_per_user), (("ip", ip), self.max_per_ip)):
+            recent = self._recent(key, now)
+            if len(recent) >= limit:
+                waits.append(recent[-limit] + self.window - now)
+            elif len(recent) + self._pending[key] >= limit:
+                # Held back by attempts in flight, which settle within seconds
+                waits.append(0)
+        if not waits:
+            return None
+        return max(1, int(max(waits)) + 1)
+
+    def check(self, username: str, ip: Optional[str]):
+        retry_after = self.retry_after(username, ip)
+        if retry_after is not None:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, try again later",
+                headers={"Retry-After": str(retry_after)},
+            )
+
+    @contextmanager
+    def attempt(self, username: str, ip: Optional[str]):
+        """Check the limits and count the attempt as pending until the block
+        exits, so a burst of guesses can't all pass the check while they wait
+        for a slot; call record_failure inside the block"""
+        self.check(username, ip)
+        keys = (("user", username), ("ip", ip))
+        for key in keys:
+            self._pending[key] += 1
+        try:
+            yield
+        finally:
+            for key in keys:
+                self._pending[key] -= 1
+                if not self._pending[key]:
+                    del self._pending[key]
+
+    def record_failure(self, username: str, ip: Optional[str]):
+        now = time.monotonic()
+        for key in (("user", username), ("ip", ip)):
+            self._failures.set(key, self._recent(key, now) + [now])
+
+    def reset(self, username: str):
+        self._failures.pop(("user", username))
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the concurrent password-check slots; 503 if none frees up"""
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Login service busy, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+
+login_throttle = LoginThrottle(
+    max_per_user=LOGIN_MAX_ATTEMPTS_PER_USER,
+    max_per_ip=LOGIN_MAX_ATTEMPTS_PER_IP,
+    window=LOGIN_ATTEMPT_WINDOW,
+    max_concurrent=LOGIN_MAX_CONCURRENT,
+    queue_timeout=LOGIN_QUEUE_TIMEOUT,
+)
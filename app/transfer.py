@@ -0,0 +1,333 @@
+"""Streaming export and import of posts, certificates and skills.
+
+Exports read each table through a cursor that fetches ``EXPORT_BATCH_SIZE``
+rows at a time (``yield_per``) and write every batch to the response before
+fetching the next, so memory stays flat however large the tables are. All
+tables are read from one snapshot. The generators are blocking and run on the
+threadpool, one step at a time, against the synchronous engine.
+
+NDJSON exports hold one ``{"table": ..., "row": {...}}`` object per line and
+can cover several tables; CSV covers one table with a header row. With the
+uploads included, the NDJSON and the uploaded files (image variants too, as
+rows refer to them) go out together as a zip archive, written as it streams.
+Precompressed copies are left out; they are optional.
+
+Imports parse the request body as it arrives and commit every
+``IMPORT_BATCH_SIZE`` rows through the ORM, so tags, excerpts, stored file
+references, skill statistics and table versions follow as for any write.
+Rows with an id are updated if it exists and created with that id if not.
+"""
+import csv
+import io
+import json
+import os
+import zipfile
+from collections import defaultdict
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, Iterator, List, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import JSON, select, text
+
+from app.cache import response_cache
+from app.database import IS_SQLITE, engine
+from app.images import UPLOAD_ROOT
+from app.media import ENCODINGS
+from app.models import Certificate, Post, Skill
+from app.schemas import CertificateRecord, PostRecord, SkillRecord
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 500))  # rows per cursor fetch
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 500))  # rows per committed transaction
+IMPORT_MAX_LINE_SIZE = int(os.getenv("IMPORT_MAX_LINE_SIZE", 16 * 1024 * 1024))  # bytes per row
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+# Exportable tables, in export order: model and the schema rows are checked against on import
+TRANSFER_TABLES = {
+    "posts": (Post, PostRecord),
+    "certificates": (Certificate, CertificateRecord),
+    "skills": (Skill, SkillRecord),
+}
+
+
+def select_tables(names) -> List[str]:
+    if not names:
+        return list(TRANSFER_TABLES)
+    unknown = [name for name in names if name not in TRANSFER_TABLES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tables: {', '.join(unknown)}")
+    return [name for name in TRANSFER_TABLES if name in names]
+
+
+# Export
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot export {type(value).__name__}")
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+
+def _table_batches(connection, table_name: str) -> Iterator[Sequence]:
+    table = TRANSFER_TABLES[table_name][0].__table__
+    result = connection.execution_options(yield_per=EXPORT_BATCH_SIZE).execute(
+        select(table).order_by(table.c.id)
+    )
+    yield from result.mappings().partitions()
+
+
+def _snapshot_connection():
+    connection = engine.connect()
+    # As begin_read_snapshot: every table is read from the same committed state
+    if IS_SQLITE:
+        connection.execute(text("BEGIN"))
+    else:
+        connection.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ"))
+    return connection
+
+
+def ndjson_chunks(tables: Sequence[str]) -> Iterator[bytes]:
+    with _snapshot_connection() as connection:
+        for table_name in tables:
+            for rows in _table_batches(connection, table_name):
+                yield "".join(
+                    json.dumps({"table": table_name, "row": dict(row)}, default=_json_default) + "\n"
+                    for row in rows
+                ).encode()
+
+
+def csv_chunks(table_name: str) -> Iterator[bytes]:
+    columns = [column.name for column in TRANSFER_TABLES[table_name][0].__table__.columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    with _snapshot_connection() as connection:
+        for rows in _table_batches(connection, table_name):
+            writer.writerows([_csv_value(row[column]) for column in columns] for row in rows)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        # Header of an empty table
+        yield buffer.getvalue().encode()
+
+
+class _StreamBuffer:
+    """Write-only file for zipfile; without tell() it writes a streamable
+    archive, and what it has written so far is handed out with take()"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def upload_files() -> Iterator[Tuple[str, str]]:
+    """``(path, name in the archive)`` of every file in the upload root except
+    temp files and precompressed siblings"""
+    derived = tuple(suffix for _, suffix in ENCODINGS)
+    for directory, dirnames, filenames in os.walk(UPLOAD_ROOT):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.startswith(".") or name.endswith(derived):
+                continue
+            path = os.path.join(directory, name)
+            yield path, "uploads/" + os.path.relpath(path, UPLOAD_ROOT).replace(os.sep, "/")
+
+
+def archive_chunks(tables: Sequence[str]) -> Iterator[bytes]:
+    """A zip of ``data.ndjson`` and the upload root under ``uploads/``"""
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open("data.ndjson", "w", force_zip64=True) as member:
+            for chunk in ndjson_chunks(tables):
+                member.write(chunk)
+                data = buffer.take()
+                if data:
+                    yield data
+        for path, name in upload_files():
+            info = zipfile.ZipInfo.from_file(path, name)
+            # Images and PDFs are compressed already
+            info.compress_type = zipfile.ZIP_STORED
+            with open(path, "rb") as source, archive.open(info, "w") as member:
+                while chunk := source.read(ARCHIVE_CHUNK_SIZE):
+                    member.write(chunk)
+                    data = buffer.take()
+                    if data:
+                        yield data
+    # The central directory, written on close
+    yield buffer.take()
+
+
+# Import
+
+async def _lines(stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        if len(buffer) > IMPORT_MAX_LINE_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Rows are limited to {IMPORT_MAX_LINE_SIZE} bytes",
+            )
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+async def ndjson_rows(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[str, str, dict]]:
+    """``(position, table, row)`` for each line of an NDJSON export"""
+    number = 0
+    async for line in _lines(stream):
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Line {number}: invalid JSON")
+        if not isinstance(item, dict) or not isinstance(item.get("row"), dict):
+            raise HTTPException(status_code=400, detail=f'Line {number}: expected {{"table": ..., "row": {{...}}}}')
+        if item.get("table") not in TRANSFER_TABLES:
+            raise HTTPException(status_code=400, detail=f"Line {number}: unknown table {item.get('table')!r}")
+        yield f"Line {number}", item["table"], item["row"]
+
+
+async def csv_rows(stream: AsyncIterator[bytes], table_name: str) -> AsyncIterator[Tuple[str, str, dict]]:
+    """``(position, table, row)`` for each row of a CSV with a header row.
+    Empty cells count as missing and JSON columns hold JSON text, as the
+    export writes them."""
+    json_columns = {
+        column.name for column in TRANSFER_TABLES[table_name][0].__table__.columns
+        if isinstance(column.type, JSON)
+    }
+    header, pending, number = None, "", 0
+    async for line in _lines(stream):
+        pending += line.decode("utf-8") + "\n"
+        # A quoted value can span lines; the row is complete once the quotes pair up
+        if pending.count('"') % 2:
+            if len(pending) > IMPORT_MAX_LINE_SIZE:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Rows are limited to {IMPORT_MAX_LINE_SIZE} bytes",
+                )
+            continue
+        values = next(csv.reader(io.StringIO(pending)), [])
+        pending = ""
+        if not values:
+            continue
+        if header is None:
+            header = values
+            continue
+        number += 1
+        row = {name: value for name, value in zip(header, values) if value != ""}
+        for name in json_columns.intersection(row):
+            try:
+                row[name] = json.loads(row[name])
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Row {number}: invalid JSON in {name}")
+        yield f"Row {number}", table_name, row
+
+
+def _write_records(session, table_name: str, records: List, counts: Dict[str, int]):
+    model = TRANSFER_TABLES[table_name][0]
+    ids = [record.id for record in records if record.id is not None]
+    by_id = {row.id: row for row in session.scalars(select(model).where(model.id.in_(ids)))} if ids else {}
+    # Skills without an id are matched by name, as in the bulk upsert
+    names = [record.name for record in records if model is Skill and record.id is None]
+    by_name = {row.name: row for row in session.scalars(select(Skill).where(Skill.name.in_(names)))} if names else {}
+    for record in records:
+        data = record.model_dump(exclude_unset=True)
+        existing = by_id.get(record.id) if record.id is not None else by_name.get(getattr(record, "name", None))
+        if existing is None:
+            instance = model(**data)
+            session.add(instance)
+            # A row repeated later in the batch updates this one
+            if record.id is not None:
+                by_id[record.id] = instance
+            elif model is Skill:
+                by_name[record.name] = instance
+            counts["created"] += 1
+            continue
+        data.pop("id", None)
+        if "image_url" in data and data["image_url"] != existing.image_url and "variants" not in data:
+            # Variants belong to the old image
+            existing.variants = None
+        for field, value in data.items():
+            setattr(existing, field, value)
+        counts["updated"] += 1
+
+
+def _write_batch(session, pending: Dict[str, List]) -> Dict[str, Dict[str, int]]:
+    counts = {}
+    for table_name, records in pending.items():
+        counts[table_name] = {"created": 0, "updated": 0}
+        _write_records(session, table_name, records, counts[table_name])
+    return counts
+
+
+async def import_rows(db, rows: AsyncIterator[Tuple[str, str, dict]]) -> dict:
+    """Validate and write ``(position, table, row)`` items, committing every
+    ``IMPORT_BATCH_SIZE`` rows. A bad row stops the import with 400; the
+    batches committed before it stay."""
+    totals = {}
+    pending = defaultdict(list)
+    pending_rows = imported = batches = 0
+    try:
+        async for position, table_name, row in rows:
+            try:
+                pending[table_name].append(TRANSFER_TABLES[table_name][1].model_validate(row))
+            except ValidationError as e:
+                problems = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{position}: invalid {table_name} row ({problems}); "
+                           f"{imported} rows in {batches} batches were imported before it",
+                )
+            pending_rows += 1
+            if pending_rows < IMPORT_BATCH_SIZE:
+                continue
+            await _commit_batch(db, pending, totals)
+            imported, batches, pending_rows = imported + pending_rows, batches + 1, 0
+        if pending_rows:
+            await _commit_batch(db, pending, totals)
+            imported, batches = imported + pending_rows, batches + 1
+    finally:
+        if totals:
+            await response_cache.invalidate(*totals)
+    return {"tables": totals, "rows": imported, "batches": batches}
+
+
+async def _commit_batch(db, pending: Dict[str, List], totals: Dict):
+    counts = await db.run_sync(_write_batch, dict(pending))
+    await db.commit()
+    # Written rows aren't needed any more; keep the identity map small
+    await db.run_sync(lambda session: session.expunge_all())
+    pending.clear()
+    for table_name, table_counts in counts.items():
+        table_totals = totals.setdefault(table_name, {"created": 0, "updated": 0})
+        for key, value in table_counts.items():
+            table_totals[key] += value
@@ -0,0 +1,144 @@
+"""Post view counts, buffered in memory and written in batches.
+
+An UPDATE per ``GET /posts/{id}`` would turn every read into a write queued
+behind SQLite's single writer. ``view_counter.record`` only bumps a counter
+in this process; a background task folds the pending counts into
+``posts.view_count`` every ``VIEW_FLUSH_INTERVAL`` seconds (sooner once
+``VIEW_BUFFER_MAX_POSTS`` posts have views pending) and once more at shutdown,
+in a single transaction. Counts pending in a worker that is killed without a
+shutdown are lost.
+
+The same pass maintains ``posts.popularity``, a view count decaying with a
+half-life of ``POPULARITY_HALF_LIFE_DAYS``. It uses forward decay: a view at
+time t weighs exp(λ(t - epoch)) and the column holds the log of the sum.
+Scaling every post's sum by the same exp(-λ(now - epoch)) gives its decayed
+count at ``now`` without changing the order, so only posts with new views are
+ever rewritten and ``?sort=popular`` is a plain read of an index.
+
+A flush bumps the ``post_views`` version instead of the ``posts`` one. Cached
+responses that show view counts or are ordered by them (post lists without a
+``fields=`` leaving ``view_count`` out, search results, the portfolio) are
+built and validated on both, so they change with the counts; the tag list and
+sparse lists without ``view_count`` stay cached across flushes.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict
+
+from sqlalchemy import bindparam, select, update
+
+from app.cache import response_cache
+from app.conditional import POST_VIEWS, bump_table_version
+from app.database import open_session
+from app.models import Post
+
+VIEW_FLUSH_INTERVAL = float(os.getenv("VIEW_FLUSH_INTERVAL", 30))  # seconds
+VIEW_BUFFER_MAX_POSTS = int(os.getenv("VIEW_BUFFER_MAX_POSTS", 1000))
+POPULARITY_HALF_LIFE_DAYS = float(os.getenv("POPULARITY_HALF_LIFE_DAYS", 7))
+
+POPULARITY_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+_DECAY = math.log(2) / (POPULARITY_HALF_LIFE_DAYS * 86400)  # per second
+
+
+def popularity_score(current: float, previous_views: int, views: int, at: float) -> float:
+    """``current`` with ``views`` more views at unix time ``at``"""
+    added = math.log(views) + _DECAY * (at - POPULARITY_EPOCH)
+    if not previous_views:
+        # The column holds 0.0 until the first view
+        return added
+    high, low = max(current, added), min(current, added)
+    return high + math.log1p(math.exp(low - high))
+
+
+def apply_views(connection, counts: Dict[int, int], at: float):
+    """Add ``{post_id: views}`` to the view counts and popularity scores"""
+    posts = Post.__table__
+    by_id = posts.c.id == bindparam("post_id")
+    # The increments go first so the transaction holds the write lock before
+    # reading the scores it is about to replace. The explicit updated_at keeps
+    # the column's onupdate from treating a view as an edit.
+    connection.execute(
+        update(posts).where(by_id).values(
+            view_count=posts.c.view_count + bindparam("views"), updated_at=posts.c.updated_at
+        ),
+        [{"post_id": post_id, "views": views} for post_id, views in counts.items()],
+    )
+    rows = connection.execute(
+        select(posts.c.id, posts.c.view_count, posts.c.popularity).where(posts.c.id.in_(list(counts)))
+    ).all()
+    if rows:
+        connection.execute(
+            update(posts).where(by_id).values(popularity=bindparam("score"), updated_at=posts.c.updated_at),
+            [
+                {"post_id": post_id, "score": popularity_score(score, view_count - counts[post_id], counts[post_id], at)}
+                for post_id, view_count, score in rows
+            ],
+        )
+    # Only the popular ordering depends on the counts; the posts version (and
+    # with it every other cached post response) stays as it is
+    bump_table_version(connection, POST_VIEWS)
+
+
+class ViewCounter:
+    def __init__(self, interval: float, max_posts: int):
+        self.interval = interval
+        self.max_posts = max_posts
+        self._pending = Counter()
+        self._wakeup = None
+        self._task = None
+        self._stopping = False
+
+    def record(self, post_id: int):
+        self._pending[post_id] += 1
+        if len(self._pending) >= self.max_posts and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Write the pending counts; returns how many views were written.
+        On failure the counts stay pending for the next attempt."""
+        if not self._pending:
+            return 0
+        counts, self._pending = self._pending, Counter()
+        at = time.time()
+        try:
+            async with open_session() as db:
+                await db.run_sync(lambda session: apply_views(session.connection(), counts, at))
+                await db.commit()
+        except Exception as e:
+            self._pending.update(counts)
+            print(f"✗ Error flushing view counts: {e}")
+            return 0
+        await response_cache.invalidate(POST_VIEWS)
+        return sum(counts.values())
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task after a last flush"""
+        if self._task is None:
+            await self.flush()
+            return
+        # Not cancelled: a flush in progress has to finish or restore its counts
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+
+view_counter = ViewCounter(VIEW_FLUSH_INTERVAL, VIEW_BUFFER_MAX_POSTS)
@@ -0,0 +1,124 @@
+"""Serialization time and bytes on the wire for one ``GET /api/posts`` page.
+
+    python -m benchmarks.serialization [--posts 100] [--repeat 200]
+
+"before" is FastAPI's stock path for a ``response_model`` endpoint returning
+ORM rows: validate, convert to JSON-compatible data, ``json.dumps`` through
+``JSONResponse``, sent uncompressed. "after" is what the app does now: the
+same conversion rendered by ``FastJSONResponse`` (item reads and writes),
+the ``TypeAdapter.dump_json`` path used for cached list pages, and the
+compressed sizes and compression time ``CompressionMiddleware`` adds.
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from fastapi.utils import create_response_field
+from pydantic import TypeAdapter
+from starlette.responses import JSONResponse
+
+from app.compression import compress
+from app.media import BROTLI_AVAILABLE
+from app.models import Post
+from app.responses import ORJSON_AVAILABLE, FastJSONResponse
+from app.schemas import Post as PostSchema
+
+WORDS = (
+    "fastapi sqlite python async cache index query latency throughput deploy "
+    "portfolio react design pattern testing docker schema migration token"
+).split()
+
+
+def make_posts(count: int, seed: int = 1) -> List[Post]:
+    rng = random.Random(seed)
+    now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    posts = []
+    for i in range(count):
+        digest = "%064x" % rng.getrandbits(256)
+        paragraphs = [" ".join(rng.choices(WORDS, k=rng.randint(40, 90))) for _ in range(rng.randint(3, 8))]
+        posts.append(Post(
+            id=i + 1,
+            title=" ".join(rng.choices(WORDS, k=6)).title(),
+            content="\n\n".join(paragraphs),
+            tags=",".join(rng.sample(WORDS, 3)),
+            category=rng.choice(["Tutorial", "Notes", "Project", None]),
+            image_url=f"/static/posts/{digest}.jpg",
+            variants=[
+                {"name": name, "format": "webp", "width": width, "height": width * 2 // 3,
+                 "url": f"/static/posts/variants/{digest}-{name}.webp"}
+                for name, width in (("thumbnail", 320), ("medium", 960), ("full", 1920))
+            ],
+            # Transient objects don't get column defaults
+            view_count=0,
+            popularity=0.0,
+            created_at=now - timedelta(hours=i),
+            updated_at=None,
+        ))
+    return posts
+
+
+def timed(func, repeat: int):
+    """Median and p95 milliseconds of ``func()``, plus its last result"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    posts = make_posts(args.posts)
+    # The response field FastAPI builds for response_model=List[PostSchema]
+    field = create_response_field(name="Response_read_posts", type_=List[PostSchema], mode="serialization")
+    adapter = TypeAdapter(List[PostSchema])
+
+    def fastapi_content():
+        # What fastapi.routing.serialize_response does for a coroutine endpoint
+        value, _ = field.validate(posts, {}, loc=("response",))
+        return field.serialize(value)
+
+    def stock():
+        return JSONResponse(fastapi_content()).body
+
+    def fast_response():
+        return FastJSONResponse(fastapi_content()).body
+
+    def cached_page():
+        return adapter.dump_json(adapter.validate_python(posts, from_attributes=True))
+
+    print(f"{args.posts} posts, {args.repeat} runs each, orjson {'on' if ORJSON_AVAILABLE else 'off'}")
+    print(f"{'serialization':<40}{'median ms':>10}{'p95 ms':>10}{'bytes':>10}")
+    rows = [
+        ("before: validate + json.dumps", stock),
+        ("after: validate + FastJSONResponse", fast_response),
+        ("after: TypeAdapter.dump_json (lists)", cached_page),
+    ]
+    body = None
+    for label, func in rows:
+        median, p95, body = timed(func, args.repeat)
+        print(f"{label:<40}{median:>10.2f}{p95:>10.2f}{len(body):>10}")
+
+    print()
+    print(f"{'bytes on the wire':<40}{'median ms':>10}{'p95 ms':>10}{'bytes':>10}")
+    print(f"{'before: identity':<40}{'-':>10}{'-':>10}{len(body):>10}")
+    for encoding in ("gzip", "br"):
+        if encoding == "br" and not BROTLI_AVAILABLE:
+            print(f"{'after: br':<40}{'brotli not installed':>30}")
+            continue
+        median, p95, compressed = timed(lambda: compress(body, encoding), args.repeat)
+        label = f"after: {encoding} ({len(compressed) / len(body):.0%})"
+        print(f"{label:<40}{median:>10.2f}{p95:>10.2f}{len(compressed):>10}")
+
+
+if __name__ == "__main__":
+    main()
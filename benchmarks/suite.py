@@ -0,0 +1,439 @@
+"""End-to-end benchmarks: the ASGI app driven in-process, no server or network.
+
+    python -m benchmarks.suite --posts 1000 [--requests 500] [--concurrency 8]
+    python -m benchmarks.suite --posts 100000 --save-baseline
+    python -m benchmarks.suite --posts 1000000 --check
+    python -m benchmarks.suite --posts 10000 --content-size 50000 --tags-per-post 20
+
+A database with ``--posts`` posts (tags, excerpts and the search index
+included) is seeded once and kept in ``benchmarks/.data``; ``--reseed``
+rebuilds it. Posts get a few short paragraphs and 1-3 of 40 tags unless
+``--content-size`` (characters of content per post) or ``--tags-per-post``
+ask for more; the excerpt, search index and tag upkeep on every write and the
+search and tag filter reads grow with those, not with the post count. Each
+run works on a copy inside a scratch directory, which also becomes the
+working directory, so uploads, upload sessions and the key file stay out of
+the tree.
+
+Scenarios, each run with ``--concurrency`` requests in flight:
+
+    list_first_page  GET /api/posts, answered from the response cache
+    list_deep_pages  GET /api/posts?cursor=... at random depths
+    list_summary     GET /api/posts?view=summary&cursor=... at random depths
+    list_by_tag      GET /api/posts?tag=... for random tags
+    search           GET /api/posts/search?q=... for random words
+    item             GET /api/posts/{id} for random ids
+    login            POST /api/auth/login
+    write            POST /api/posts, then PUT it, with content and tags sized
+                     like the seeded posts
+    upload           POST /api/posts with a 64 KB PNG
+
+A request counts as done at its last body byte; background work the app
+schedules after that (image variants) runs on but isn't timed, as under a
+real server. The list_by_tag and search requests carry a throwaway ``n``
+parameter so each one misses the response cache and runs its query. Results are requests per second and p50/p95/p99 latency.
+``--save-baseline`` stores them in ``benchmarks/baseline.json`` per post
+count and dataset shape; later runs print the change against it, and with
+``--check`` exit with status 1 when throughput drops or p95 rises by more
+than ``--tolerance`` percent.
+
+Requests are built with httpx (a FastAPI test dependency).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, "benchmarks", ".data")
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+SEED_BATCH = 5000
+TAG_VOCABULARY = 40  # distinct tags, or 4 times --tags-per-post if that is more
+
+# Scenarios bound by password hashing or disk writes get a fraction of --requests
+SLOW_SCENARIOS = {"login": 10, "write": 5, "upload": 10}
+
+
+def percentile(ordered, fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    position = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[position]
+
+
+def png_bytes(rng: random.Random, size: int = 128) -> bytes:
+    """A valid PNG of random (incompressible) pixels, about 64 KB at 128x128 RGBA"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    rows = b"".join(b"\x00" + rng.randbytes(size * 4) for _ in range(size))
+    header = struct.pack(">IIBBBBB", size, size, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+def tag_names(tags_per_post=None):
+    return [f"topic-{n}" for n in range(max(TAG_VOCABULARY, 4 * (tags_per_post or 0)))]
+
+
+def make_content(rng: random.Random, content_size=None) -> str:
+    """2-4 short paragraphs of random words, or paragraphs adding up to about
+    ``content_size`` characters"""
+    from benchmarks.serialization import WORDS
+
+    if content_size is None:
+        return "\n\n".join(" ".join(rng.choices(WORDS, k=rng.randint(20, 60))) for _ in range(rng.randint(2, 4)))
+    paragraphs, size = [], 0
+    while size < content_size:
+        paragraph = " ".join(rng.choices(WORDS, k=rng.randint(40, 120)))
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:content_size]
+
+
+def pick_tags(rng: random.Random, names, tags_per_post=None):
+    return rng.sample(names, tags_per_post or rng.randint(1, 3))
+
+
+def dataset_name(post_count: int, content_size=None, tags_per_post=None) -> str:
+    """Key of a seeded database and its baselines"""
+    name = f"posts-{post_count}"
+    if content_size is not None:
+        name += f"-content-{content_size}"
+    if tags_per_post is not None:
+        name += f"-tags-{tags_per_post}"
+    return name
+
+
+def seed_posts(engine, count: int, content_size=None, tags_per_post=None, seed: int = 1):
+    """Insert ``count`` posts with tags and excerpts in batches. Core inserts skip
+    the ORM flush listeners, so the tag tables are filled here as well; the
+    search index is kept by its triggers."""
+    from sqlalchemy import insert, update
+
+    from app.excerpts import make_excerpt
+    from app.models import Post, PostTag, Tag
+    from benchmarks.serialization import WORDS
+
+    rng = random.Random(seed)
+    newest = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    names = tag_names(tags_per_post)
+    tag_ids_by_name = {name: tag_id for tag_id, name in enumerate(names, 1)}
+    tag_counts = dict.fromkeys(tag_ids_by_name.values(), 0)
+    # Keep the batches to about 50 MB of content
+    batch_size = max(100, min(SEED_BATCH, 50_000_000 // (content_size or 1)))
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        connection.execute(insert(Tag), [
+            {"id": tag_id, "name": name, "post_count": 0} for name, tag_id in tag_ids_by_name.items()
+        ])
+        for first in range(1, count + 1, batch_size):
+            posts, links = [], []
+            for post_id in range(first, min(first + batch_size, count + 1)):
+                content = make_content(rng, content_size)
+                tag_ids = [tag_ids_by_name[name] for name in pick_tags(rng, names, tags_per_post)]
+                posts.append({
+                    "id": post_id,
+                    "title": " ".join(rng.choices(WORDS, k=6)).title(),
+                    "content": content,
+                    "excerpt": make_excerpt(content),
+                    "tags": ",".join(names[tag_id - 1] for tag_id in tag_ids),
+                    "category": rng.choice(["Tutorial", "Notes", "Project", None]),
+                    "created_at": newest - timedelta(minutes=count - post_id),
+                })
+                links.extend({"post_id": post_id, "tag_id": tag_id} for tag_id in tag_ids)
+                for tag_id in tag_ids:
+                    tag_counts[tag_id] += 1
+            connection.execute(insert(Post.__table__), posts)
+            connection.execute(insert(PostTag), links)
+            print(f"\r  seeded {posts[-1]['id']}/{count} posts", end="", flush=True)
+        for tag_id, post_count in tag_counts.items():
+            connection.execute(update(Tag).where(Tag.id == tag_id).values(post_count=post_count))
+    print(f"\r✓ Seeded {count} posts in {time.perf_counter() - started:.1f}s")
+
+
+class InProcessClient:
+    """Sends httpx-built requests straight to an ASGI app"""
+
+    def __init__(self, app):
+        self.app = app
+        self.pending = set()
+
+    async def send(self, request: httpx.Request):
+        """Returns (status, body, seconds until the last body byte)"""
+        body = request.read()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": request.method,
+            "scheme": "http",
+            "server": ("bench", 80),
+            "client": ("127.0.0.1", 50000),
+            "root_path": "",
+            "path": request.url.path,
+            "raw_path": request.url.raw_path.split(b"?")[0],
+            "query_string": request.url.query,
+            "headers": [(key.lower(), value) for key, value in request.headers.raw],
+        }
+        received = False
+        response_done = asyncio.Event()
+        status, chunks = None, []
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await response_done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    response_done.set()
+
+        start = time.perf_counter()
+        task = asyncio.create_task(self.app(scope, receive, send))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+        finished, _ = await asyncio.wait(
+            [task, asyncio.create_task(response_done.wait())], return_when=asyncio.FIRST_COMPLETED
+        )
+        elapsed = time.perf_counter() - start
+        if task in finished and task.exception() is not None:
+            raise task.exception()
+        return status, b"".join(chunks), elapsed
+
+    async def drain(self):
+        if self.pending:
+            await asyncio.gather(*self.pending, return_exceptions=True)
+
+
+async def run_scenario(client, make_request, total: int, concurrency: int):
+    latencies, failures = [], 0
+    queue = iter(range(total))
+
+    async def worker():
+        nonlocal failures
+        for index in queue:
+            status, _, elapsed = await client.send(await make_request(index))
+            latencies.append(elapsed)
+            if status >= 400:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": total,
+        "failures": failures,
+        "rps": total / wall,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p95": percentile(latencies, 0.95) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def run_benchmarks(app, post_count: int, requests: int, concurrency: int, only,
+                         content_size=None, tags_per_post=None):
+    from sqlalchemy import select
+
+    from app.database import open_session
+    from app.models import Post
+    from app.pagination import encode_cursor
+    from app.routers.posts import post_keyset
+    from benchmarks.serialization import WORDS
+
+    rng = random.Random(7)
+    client = InProcessClient(app)
+    await app.router.startup()
+    try:
+        async with open_session() as db:
+            # Cursors pointing at random depths, as the posts list emits them
+            ids = [rng.randint(1, post_count) for _ in range(200)]
+            rows = await db.execute(select(*post_keyset.cursor_columns()).where(Post.id.in_(ids)))
+            cursors = [encode_cursor(row) for row in rows.all()]
+
+        async def token():
+            request = httpx.Request("POST", "http://bench/api/auth/login", data={"username": "admin", "password": "admin123"})
+            status, body, _ = await client.send(request)
+            return json.loads(body)["access_token"]
+
+        auth = {"Authorization": f"Bearer {await token()}"}
+        upload_rng = random.Random(11)
+        names = tag_names(tags_per_post)
+
+        async def list_first_page(i):
+            return httpx.Request("GET", "http://bench/api/posts")
+
+        async def list_deep_pages(i):
+            return httpx.Request("GET", "http://bench/api/posts", params={"cursor": rng.choice(cursors)})
+
+        async def list_summary(i):
+            return httpx.Request("GET", "http://bench/api/posts", params={"cursor": rng.choice(cursors), "view": "summary"})
+
+        async def list_by_tag(i):
+            return httpx.Request("GET", "http://bench/api/posts", params={"tag": rng.choice(names), "n": i})
+
+        async def search(i):
+            return httpx.Request("GET", "http://bench/api/posts/search", params={"q": rng.choice(WORDS), "n": i})
+
+        async def item(i):
+            return httpx.Request("GET", f"http://bench/api/posts/{rng.randint(1, post_count)}")
+
+        async def login(i):
+            return httpx.Request("POST", "http://bench/api/auth/login", data={"username": "admin", "password": "admin123"})
+
+        async def write(i):
+            if i % 2 == 0:
+                return httpx.Request("POST", "http://bench/api/posts", headers=auth,
+                                     data={"title": f"Bench {i}", "content": make_content(rng, content_size),
+                                           "tags": ",".join(pick_tags(rng, names, tags_per_post))})
+            return httpx.Request("PUT", f"http://bench/api/posts/{rng.randint(1, post_count)}", headers=auth,
+                                 json={"content": make_content(rng, content_size),
+                                       "tags": ",".join(pick_tags(rng, names, tags_per_post))})
+
+        async def upload(i):
+            return httpx.Request("POST", "http://bench/api/posts", headers=auth,
+                                 data={"title": f"Upload {i}", "content": "Benchmark upload"},
+                                 files={"image": (f"bench-{i}.png", png_bytes(upload_rng), "image/png")})
+
+        scenarios = [list_first_page, list_deep_pages, list_summary, list_by_tag, search, item, login, write, upload]
+        results = {}
+        for scenario in scenarios:
+            name = scenario.__name__
+            if only and name not in only:
+                continue
+            total = max(requests // SLOW_SCENARIOS.get(name, 1), concurrency)
+            results[name] = await run_scenario(client, scenario, total, concurrency)
+            print(f"  {name} done")
+        await client.drain()
+        return results
+    finally:
+        await app.router.shutdown()
+
+
+def compare(result, baseline, tolerance: float):
+    """Change against the baseline as text, and whether it is a regression"""
+    if not baseline:
+        return "", False
+    rps_change = (result["rps"] - baseline["rps"]) / baseline["rps"] * 100
+    p95_change = (result["p95"] - baseline["p95"]) / baseline["p95"] * 100 if baseline["p95"] else 0.0
+    regressed = rps_change < -tolerance or p95_change > tolerance
+    text = f"{rps_change:+6.1f}% req/s {p95_change:+6.1f}% p95"
+    return text + ("  REGRESSION" if regressed else ""), regressed
+
+
+def report(dataset, concurrency, results, baselines, tolerance):
+    print()
+    print(f"{dataset} concurrency={concurrency}")
+    print(f"{'scenario':<18}{'requests':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  vs baseline")
+    regressions = []
+    for name, result in results.items():
+        change, regressed = compare(result, baselines.get(name), tolerance)
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:<18}{result['requests']:>9}{result['failures']:>8}{result['rps']:>10.1f}"
+            f"{result['p50']:>9.2f}{result['p95']:>9.2f}{result['p99']:>9.2f}  {change}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=1000, help="posts in the database (e.g. 1000, 100000, 1000000)")
+    parser.add_argument("--content-size", type=int, help="characters of content per post (default: a few short paragraphs)")
+    parser.add_argument("--tags-per-post", type=int, help="tags on every post (default: 1-3)")
+    parser.add_argument("--requests", type=int, default=500, help="requests per read scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenario", action="append", help="run only these scenarios")
+    parser.add_argument("--reseed", action="store_true", help="rebuild the seeded database")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="exit 1 on a regression against the baseline")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="percent")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args()
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    dataset = dataset_name(args.posts, args.content_size, args.tags_per_post)
+    seeded_path = os.path.join(DATA_DIR, f"{dataset}.db")
+    workdir = tempfile.mkdtemp(prefix="portfolio-bench-")
+    database_path = os.path.join(workdir, "bench.db")
+    needs_seed = args.reseed or not os.path.exists(seeded_path)
+    if not needs_seed:
+        shutil.copyfile(seeded_path, database_path)
+
+    # Everything the app resolves relative to the working directory lands in
+    # the scratch directory; the engines are created on import, so the
+    # environment has to be set first
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_path}"
+    # Writes queued behind each other would otherwise flood the output with
+    # lock waits reported as slow queries
+    os.environ.setdefault("SLOW_QUERY_THRESHOLD_MS", "1000")
+    sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+    try:
+        from app.database import engine
+        from app.main import app
+
+        if needs_seed:
+            seed_posts(engine, args.posts, args.content_size, args.tags_per_post)
+            with engine.connect() as connection:
+                connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+            shutil.copyfile(database_path, seeded_path)
+
+        results = asyncio.run(run_benchmarks(
+            app, args.posts, args.requests, args.concurrency, args.scenario, args.content_size, args.tags_per_post
+        ))
+    finally:
+        os.chdir(ROOT)
+        if args.keep:
+            print(f"Scratch directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    stored = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as fh:
+            stored = json.load(fh)
+    # Baselines of the default dataset stay keyed by the bare post count
+    key = str(args.posts) if dataset == f"posts-{args.posts}" else dataset
+    baselines = stored.get(key, {}).get("scenarios", {})
+    regressions = report(dataset, args.concurrency, results, baselines, args.tolerance)
+
+    if args.save_baseline:
+        stored[key] = {
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "concurrency": args.concurrency,
+            "scenarios": results,
+        }
+        with open(BASELINE_PATH, "w") as fh:
+            json.dump(stored, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+        print(f"✓ Baseline for {dataset} saved to {os.path.relpath(BASELINE_PATH, ROOT)}")
+    if regressions:
+        print(f"✗ Regressions against the baseline: {', '.join(regressions)}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
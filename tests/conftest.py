@@ -0,0 +1,29 @@
+import os
+import tempfile
+
+import pytest
+
+# The app reads its settings and creates its files on import, relative to the
+# working directory: give the whole test run a scratch directory of its own
+_workdir = tempfile.mkdtemp(prefix="portfolio-tests-")
+os.chdir(_workdir)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'portfolio.db')}"
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("VIEW_FLUSH_INTERVAL", "3600")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    response = client.post("/api/auth/login", data={"username": "admin", "password": "admin123"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
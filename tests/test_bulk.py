@@ -0,0 +1,25 @@
+def test_bulk_skills_report_repeated_names_as_duplicates(client, auth_headers):
+    response = client.post("/api/skills/bulk", json=[{"name": "Bulk Existing"}], headers=auth_headers)
+    assert response.status_code == 200, response.text
+
+    items = [{"name": name} for name in ("Bulk New", "Bulk New", "Bulk Existing", "Bulk Existing", "Bulk Other")]
+    response = client.post("/api/skills/bulk", json=items, headers=auth_headers)
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["created", "error", "error", "error", "created"]
+    assert results[1]["detail"] == "Appears more than once in the batch"
+    assert results[2]["detail"] == "Skill with this name already exists"
+    assert results[3]["detail"] == "Appears more than once in the batch"
+
+    names = [skill["name"] for skill in client.get("/api/skills", params={"limit": 100}).json()]
+    assert names.count("Bulk New") == 1
+    assert "Bulk Other" in names
+
+
+def test_atomic_bulk_skills_refuse_a_batch_with_repeated_names(client, auth_headers):
+    items = [{"name": "Bulk Atomic"}, {"name": "Bulk Atomic"}]
+    response = client.post("/api/skills/bulk", params={"atomic": "true"}, json=items, headers=auth_headers)
+    assert response.status_code == 409
+    assert response.json()["detail"]["results"][0]["detail"] == "Appears more than once in the batch"
+    names = [skill["name"] for skill in client.get("/api/skills", params={"limit": 100}).json()]
+    assert "Bulk Atomic" not in names
@@ -0,0 +1,27 @@
+import pytest
+
+
+@pytest.mark.parametrize("path, partial", [
+    ("/api/posts", "PostFields"),
+    ("/api/certificates", "CertificateFields"),
+    ("/api/skills", "SkillFields"),
+])
+def test_list_schemas_allow_partial_rows(client, path, partial):
+    spec = client.get("/openapi.json").json()
+    response = spec["paths"][path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+    refs = {option["$ref"].rsplit("/", 1)[-1] for option in response["items"]["anyOf"]}
+    assert partial in refs
+    assert spec["components"]["schemas"][partial]["required"] == ["id"]
+
+
+def test_sparse_and_summary_rows_match_the_partial_schema(client, auth_headers):
+    from app.schemas import PostFields
+
+    post = client.post("/api/posts", data={"title": "Sparse", "content": "Body"}, headers=auth_headers).json()
+    rows = client.get("/api/posts", params={"fields": "title"}).json()
+    assert all(set(row) == {"id", "title"} for row in rows)
+    summary = client.get("/api/posts", params={"view": "summary"}).json()
+    assert all("content" not in row for row in summary)
+    for row in rows + summary:
+        PostFields.model_validate(row)
+    client.delete(f"/api/posts/{post['id']}", headers=auth_headers)
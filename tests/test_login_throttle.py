@@ -0,0 +1,28 @@
+import asyncio
+
+import httpx
+
+from app.main import app
+from app.throttle import LOGIN_MAX_ATTEMPTS_PER_USER
+
+
+def test_concurrent_guesses_count_against_the_limit(client):
+    attempts = LOGIN_MAX_ATTEMPTS_PER_USER + 7
+
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            responses = await asyncio.gather(*(
+                http.post("/api/auth/login", data={"username": "burst-target", "password": f"guess-{n}"})
+                for n in range(attempts)
+            ))
+        return [response.status_code for response in responses]
+
+    statuses = client.portal.call(burst)
+    # Only as many password checks as the limit allows; the rest are refused up front
+    assert statuses.count(401) == LOGIN_MAX_ATTEMPTS_PER_USER
+    assert statuses.count(429) == attempts - LOGIN_MAX_ATTEMPTS_PER_USER
+
+    response = client.post("/api/auth/login", data={"username": "burst-target", "password": "another"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 1
@@ -0,0 +1,82 @@
+from sqlalchemy import create_engine, text
+
+from app.migrations import backfill_skill_order
+from app.pagination import NEXT_CURSOR_HEADER, encode_cursor
+
+
+def _walk(client, path, limit):
+    """Every item of ``path``, following the cursors page by page"""
+    items, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = client.get(path, params=params)
+        assert response.status_code == 200, response.text
+        items.extend(response.json())
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return items
+
+
+def test_skill_order_rejects_null(client, auth_headers):
+    created = client.post("/api/skills", json={"name": "Null order"}, headers=auth_headers).json()
+    response = client.put(f"/api/skills/{created['id']}", json={"order": None}, headers=auth_headers)
+    assert response.status_code == 422
+    assert client.get(f"/api/skills/{created['id']}").json()["order"] == 0
+    client.delete(f"/api/skills/{created['id']}", headers=auth_headers)
+
+
+def test_skill_cursor_pages_cover_every_skill(client, auth_headers):
+    ids = []
+    for number in range(15):
+        response = client.post(
+            "/api/skills",
+            json={"name": f"Paged {number:02d}", "order": number % 3},
+            headers=auth_headers,
+        )
+        ids.append(response.json()["id"])
+    # Updates that leave order out keep it; a null order is refused, as it
+    # would drop every skill after this one out of the cursor pages
+    client.put(f"/api/skills/{ids[0]}", json={"proficiency": 10}, headers=auth_headers)
+    client.put(f"/api/skills/{ids[7]}", json={"order": None}, headers=auth_headers)
+
+    everything = client.get("/api/skills", params={"limit": 100}).json()
+    for limit in (1, 4):
+        paged = _walk(client, "/api/skills", limit=limit)
+        assert [skill["id"] for skill in paged] == [skill["id"] for skill in everything]
+    assert set(ids) <= {skill["id"] for skill in everything}
+
+    for skill_id in ids:
+        client.delete(f"/api/skills/{skill_id}", headers=auth_headers)
+
+
+def test_backfill_skill_order():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        # skills as created before order was NOT NULL
+        connection.execute(text(
+            'CREATE TABLE skills (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, "order" INTEGER, updated_at DATETIME)'
+        ))
+        connection.execute(text('INSERT INTO skills (name, "order") VALUES (\'A\', NULL), (\'B\', 3)'))
+        backfill_skill_order(connection)
+        rows = connection.execute(text('SELECT name, "order", updated_at FROM skills ORDER BY name')).all()
+    assert rows == [("A", 0, None), ("B", 3, None)]
+
+
+def test_tampered_cursor_is_rejected(client):
+    for path, values in [
+        ("/api/skills", [{"a": 1}, "Python", 1]),
+        ("/api/skills", [1, 2, 3]),
+        ("/api/skills", [True, "Python", 1]),
+        ("/api/skills", [1, "Python", 2**70]),
+        ("/api/skills", [None, "Python", 1]),
+        ("/api/posts", ["not a date", 1]),
+        ("/api/posts", [[1], 1]),
+        ("/api/certificates", ["2024-01-01T00:00:00", "1"]),
+    ]:
+        response = client.get(path, params={"cursor": encode_cursor(values)})
+        assert response.status_code == 400, (path, values, response.text)
+        assert response.json()["detail"] == "Invalid cursor"
+
+    # A cursor the API handed out still works
+    first = client.get("/api/skills", params={"limit": 1})
+    assert client.get("/api/skills", params={"cursor": first.headers[NEXT_CURSOR_HEADER]}).status_code == 200
@@ -0,0 +1,41 @@
+from app.database import open_session
+from app.models import Certificate
+from app.resumable import upload_sessions
+from app.storage import DOCUMENT_TYPES
+
+PDF = b"%PDF-1.4\n" + b"0" * 4096
+
+
+def _finalized_session(client, auth_headers) -> str:
+    session = client.post("/api/uploads", json={"size": len(PDF), "filename": "scan.pdf"}, headers=auth_headers).json()
+    for offset, chunk in ((0, PDF[:2048]), (2048, PDF[2048:])):
+        response = client.put(
+            f"/api/uploads/{session['id']}", params={"offset": offset}, content=chunk, headers=auth_headers
+        )
+        assert response.status_code == 200, response.text
+    assert client.post(f"/api/uploads/{session['id']}/finalize", headers=auth_headers).json()["finalized"]
+    return session["id"]
+
+
+def test_claimed_upload_survives_a_failed_commit(client, auth_headers):
+    upload_id = _finalized_session(client, auth_headers)
+
+    async def claim_and_roll_back():
+        async with open_session() as db:
+            _, url = await upload_sessions.claim(upload_id, "certificates", DOCUMENT_TYPES, db)
+            db.add(Certificate(title="Lost", issuer="Nobody", date="2024", image_url=url))
+            await db.flush()
+            await db.rollback()
+
+    client.portal.call(claim_and_roll_back)
+    assert client.get(f"/api/uploads/{upload_id}", headers=auth_headers).status_code == 200
+
+    response = client.post(
+        "/api/certificates",
+        data={"title": "Scan", "issuer": "Issuer", "date": "2024", "upload_id": upload_id},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200, response.text
+    assert client.get(response.json()["image_url"]).content == PDF
+    assert client.get(f"/api/uploads/{upload_id}", headers=auth_headers).status_code == 404
+    client.delete(f"/api/certificates/{response.json()['id']}", headers=auth_headers)
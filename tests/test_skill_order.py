@@ -0,0 +1,86 @@
+from app.skill_order import ORDER_KEY_GAP, assign_order_keys
+
+
+def _apply(keys, target):
+    changes = assign_order_keys(keys, target)
+    new_keys = {**keys, **changes}
+    ordered = [new_keys[skill_id] for skill_id in target]
+    assert ordered == sorted(set(ordered)), "keys must be strictly ascending in the target order"
+    return changes
+
+
+def test_move_to_front_rewrites_one_key():
+    keys = {1: 1024, 2: 2048, 3: 3072}
+    assert _apply(keys, [3, 1, 2]) == {3: 1024 - ORDER_KEY_GAP}
+
+
+def test_move_to_end_rewrites_one_key():
+    keys = {1: 1024, 2: 2048, 3: 3072}
+    assert _apply(keys, [2, 3, 1]) == {1: 3072 + ORDER_KEY_GAP}
+
+
+def test_move_into_a_gap_takes_its_middle():
+    keys = {1: 1024, 2: 2048, 3: 3072}
+    assert _apply(keys, [1, 3, 2]) == {3: 1536}
+
+
+def test_move_between_adjacent_keys_renumbers():
+    keys = {1: ORDER_KEY_GAP, 2: ORDER_KEY_GAP + 1, 3: 5000}
+    # Skill 1 already has its renumbered key, so it is left out
+    assert _apply(keys, [1, 3, 2]) == {3: 2 * ORDER_KEY_GAP, 2: 3 * ORDER_KEY_GAP}
+
+
+def test_unchanged_order_writes_nothing():
+    keys = {1: 5, 2: 9, 3: 400}
+    assert _apply(keys, [1, 2, 3]) == {}
+
+
+def _create_skills(client, auth_headers, names):
+    ids = []
+    for name in names:
+        response = client.post("/api/skills", json={"name": name}, headers=auth_headers)
+        assert response.status_code == 200, response.text
+        ids.append(response.json()["id"])
+    return ids
+
+
+def _orders(client, ids):
+    return [client.get(f"/api/skills/{skill_id}").json()["order"] for skill_id in ids]
+
+
+def _positions(order, ids):
+    sequence = [row["id"] for row in order]
+    return [sequence.index(skill_id) for skill_id in ids]
+
+
+def test_reorder_endpoint_moves_skills(client, auth_headers):
+    a, b, c = _create_skills(client, auth_headers, ["Order A", "Order B", "Order C"])
+    response = client.put("/api/skills/order", json={"ids": [a, b, c]}, headers=auth_headers)
+    assert response.status_code == 200, response.text
+
+    response = client.put("/api/skills/order", json={"moves": [{"id": c, "after": None}]}, headers=auth_headers)
+    assert response.status_code == 200, response.text
+    order = response.json()
+    assert order[0]["id"] == c
+    positions = _positions(order, [c, a, b])
+    assert positions == sorted(positions)
+
+    response = client.put("/api/skills/order", json={"moves": [{"id": c, "after": b}]}, headers=auth_headers)
+    assert response.status_code == 200, response.text
+    positions = _positions(response.json(), [a, b, c])
+    assert positions == sorted(positions)
+    assert _orders(client, [a, b, c]) == sorted(_orders(client, [a, b, c]))
+
+
+def test_reorder_endpoint_rejects_unknown_and_repeated_ids(client, auth_headers):
+    a, b = _create_skills(client, auth_headers, ["Order D", "Order E"])
+    before = _orders(client, [a, b])
+
+    response = client.put("/api/skills/order", json={"ids": [b, a, 999999]}, headers=auth_headers)
+    assert response.status_code == 404
+    response = client.put("/api/skills/order", json={"moves": [{"id": b, "after": 999999}]}, headers=auth_headers)
+    assert response.status_code == 404
+    response = client.put("/api/skills/order", json={"ids": [b, a, b]}, headers=auth_headers)
+    assert response.status_code == 400
+    # Nothing of a refused reorder is written
+    assert _orders(client, [a, b]) == before
@@ -0,0 +1,84 @@
+from app.skill_stats import PROFICIENCY_BUCKETS
+
+
+def _summary(skills):
+    rated = [skill["proficiency"] for skill in skills if skill["proficiency"] is not None]
+    histogram = [0] * len(PROFICIENCY_BUCKETS)
+    for proficiency in rated:
+        histogram[next(i for i, (_, high) in enumerate(PROFICIENCY_BUCKETS) if proficiency <= high)] += 1
+    return {
+        "total_skills": len(skills),
+        "rated_skills": len(rated),
+        "average_proficiency": round(sum(rated) / len(rated), 2) if rated else 0,
+        "min_proficiency": min(rated) if rated else None,
+        "max_proficiency": max(rated) if rated else None,
+        "histogram": [
+            {"range": f"{low}-{high}", "count": count} for (low, high), count in zip(PROFICIENCY_BUCKETS, histogram)
+        ],
+    }
+
+
+def _recomputed(client):
+    """The statistics worked out from scratch over every skill"""
+    skills = client.get("/api/skills", params={"limit": 100}).json()
+    assert len(skills) < 100
+    stats = _summary(skills)
+    categories = sorted({skill["category"] for skill in skills if skill["category"]})
+    stats["categories"] = [
+        {"category": category, **_summary([skill for skill in skills if skill["category"] == category])}
+        for category in categories
+    ]
+    return stats
+
+
+def _assert_stats_match(client):
+    assert client.get("/api/skills/stats").json() == _recomputed(client)
+
+
+def test_skill_stats_follow_every_write(client, auth_headers):
+    def create(name, category, proficiency):
+        response = client.post(
+            "/api/skills", json={"name": name, "category": category, "proficiency": proficiency}, headers=auth_headers
+        )
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+
+    def update(skill_id, **fields):
+        response = client.put(f"/api/skills/{skill_id}", json=fields, headers=auth_headers)
+        assert response.status_code == 200, response.text
+
+    _assert_stats_match(client)
+    low = create("Stats low", "Stats A", 5)
+    high = create("Stats high", "Stats A", 99)
+    unrated = create("Stats unrated", "Stats B", None)
+    uncategorized = create("Stats uncategorized", None, 50)
+    _assert_stats_match(client)
+
+    # Category change, moving the maximum out of its category
+    update(high, category="Stats B")
+    _assert_stats_match(client)
+    # Proficiency cleared, on the category's only rated skill
+    update(low, proficiency=None)
+    _assert_stats_match(client)
+    # Both at once, and a rating given to an unrated skill
+    update(high, category="Stats A", proficiency=42)
+    update(unrated, proficiency=0)
+    _assert_stats_match(client)
+    # Fields the statistics don't depend on
+    update(uncategorized, color="#000000")
+    _assert_stats_match(client)
+
+    # Deleting a category's minimum, then the last skill of a category
+    client.delete(f"/api/skills/{unrated}", headers=auth_headers)
+    _assert_stats_match(client)
+    bulk = client.post(
+        "/api/skills/bulk",
+        json=[{"name": f"Stats bulk {n}", "category": "Stats C", "proficiency": n * 30} for n in range(4)],
+        headers=auth_headers,
+    ).json()
+    _assert_stats_match(client)
+    ids = [low, high, uncategorized] + [result["id"] for result in bulk["results"]]
+    client.post("/api/skills/bulk/delete", json=ids, headers=auth_headers)
+    _assert_stats_match(client)
+    assert all(category["category"] not in ("Stats A", "Stats B", "Stats C")
+               for category in client.get("/api/skills/stats").json()["categories"])
@@ -0,0 +1,97 @@
+import io
+import os
+
+from fastapi import UploadFile
+from PIL import Image
+
+from app.database import open_session
+from app.models import Post
+from app.storage import IMAGE_TYPES, save_upload
+
+
+def _png(color) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _upload(data: bytes) -> UploadFile:
+    return UploadFile(io.BytesIO(data), size=len(data), filename="image.png")
+
+
+def test_upload_is_removed_when_its_transaction_rolls_back(client):
+    async def scenario():
+        async with open_session() as db:
+            file_location, url = await save_upload(_upload(_png("red")), "posts", IMAGE_TYPES, db)
+            assert os.path.exists(file_location)
+            db.add(Post(title="Rolled back", content="Body", image_url=url))
+            await db.flush()
+            await db.rollback()
+        return file_location
+
+    assert not os.path.exists(client.portal.call(scenario))
+
+
+def test_orphan_removal_keeps_a_file_another_upload_is_committing(client):
+    data = _png("blue")
+
+    async def scenario():
+        async with open_session() as db:
+            _, url = await save_upload(_upload(data), "posts", IMAGE_TYPES, db)
+            first = Post(title="First", content="Body", image_url=url)
+            db.add(first)
+            await db.commit()
+            first_id = first.id
+
+        async with open_session() as uploading:
+            # The same bytes arrive again and are saved, but not committed yet...
+            file_location, url = await save_upload(_upload(data), "posts", IMAGE_TYPES, uploading)
+            # ...while the only committed reference goes away
+            async with open_session() as deleting:
+                await deleting.delete(await deleting.get(Post, first_id))
+                await deleting.commit()
+            assert os.path.exists(file_location)
+
+            second = Post(title="Second", content="Body", image_url=url)
+            uploading.add(second)
+            await uploading.commit()
+            second_id = second.id
+        assert os.path.exists(file_location)
+
+        async with open_session() as db:
+            await db.delete(await db.get(Post, second_id))
+            await db.commit()
+        return file_location
+
+    assert not os.path.exists(client.portal.call(scenario))
+
+
+def test_orphan_check_and_removal_stay_off_the_event_loop(client, monkeypatch):
+    import threading
+
+    from app import storage
+
+    threads = []
+    is_referenced = storage._is_referenced
+
+    def recording_is_referenced(path):
+        threads.append(threading.get_ident())
+        return is_referenced(path)
+
+    monkeypatch.setattr(storage, "_is_referenced", recording_is_referenced)
+
+    async def scenario():
+        loop_thread = threading.get_ident()
+        async with open_session() as db:
+            file_location, url = await save_upload(_upload(_png("green")), "posts", IMAGE_TYPES, db)
+            post = Post(title="Short-lived", content="Body", image_url=url)
+            db.add(post)
+            await db.commit()
+            await db.delete(post)
+            await db.commit()
+            # Done by the time commit returns
+            assert not os.path.exists(file_location)
+        return loop_thread
+
+    loop_thread = client.portal.call(scenario)
+    assert threads and loop_thread not in threads
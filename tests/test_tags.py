@@ -0,0 +1,19 @@
+def test_blank_tag_filter_is_ignored(client, auth_headers):
+    created = [
+        client.post(
+            "/api/posts",
+            data={"title": f"Tagged {number}", "content": "Body", "tags": tags},
+            headers=auth_headers,
+        ).json()["id"]
+        for number, tags in enumerate(["python, fastapi", "rust"])
+    ]
+    everything = [post["id"] for post in client.get("/api/posts").json()]
+    assert set(created) <= set(everything)
+
+    for params in ({"tag": ""}, {"tag": " "}, {"tag": ["", " "], "tag_mode": "all"}):
+        assert [post["id"] for post in client.get("/api/posts", params=params).json()] == everything
+
+    assert [post["id"] for post in client.get("/api/posts", params={"tag": " Python "}).json()] == [created[0]]
+
+    for post_id in created:
+        client.delete(f"/api/posts/{post_id}", headers=auth_headers)
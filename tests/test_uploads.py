@@ -0,0 +1,76 @@
+import asyncio
+from typing import Optional
+
+from fastapi import FastAPI, File, UploadFile
+
+from app.storage import UploadLimitMiddleware
+
+BOUNDARY = "limit-test"
+
+
+def _app(max_size: int):
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(image: Optional[UploadFile] = File(None)):
+        return {"size": len(await image.read())}
+
+    return UploadLimitMiddleware(app, max_size=max_size)
+
+
+def _call(app, chunks, content_length: Optional[int] = None):
+    """Drive ``app`` with a multipart body sent in ``chunks``; returns the
+    response status and how many chunks were read"""
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/upload", "raw_path": b"/upload", "query_string": b"",
+        "root_path": "", "headers": headers, "server": ("test", 80), "client": ("test", 1),
+    }
+    read = 0
+    sent = []
+
+    async def receive():
+        nonlocal read
+        if read < len(chunks):
+            read += 1
+            return {"type": "http.request", "body": chunks[read - 1], "more_body": read < len(chunks)}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return next(m["status"] for m in sent if m["type"] == "http.response.start"), read
+
+
+def _multipart(size: int):
+    head = (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"a.bin\"\r\n"
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    body = head + b"x" * size + f"\r\n--{BOUNDARY}--\r\n".encode()
+    return [body[start:start + 1024] for start in range(0, len(body), 1024)]
+
+
+def test_upload_within_limit_passes():
+    chunks = _multipart(4000)
+    status, read = _call(_app(max_size=8192), chunks)
+    assert status == 200
+    assert read == len(chunks)
+
+
+def test_content_length_over_limit_is_refused_before_reading():
+    chunks = _multipart(20000)
+    status, read = _call(_app(max_size=8192), chunks, content_length=sum(map(len, chunks)))
+    assert status == 413
+    assert read == 0
+
+
+def test_streamed_body_over_limit_stops_at_the_limit():
+    chunks = _multipart(100000)
+    status, read = _call(_app(max_size=8192), chunks)
+    assert status == 413
+    assert read <= 9
@@ -0,0 +1,35 @@
+from app.view_counts import view_counter
+
+
+def test_view_flush_refreshes_responses_that_show_the_counts(client, auth_headers):
+    post = client.post("/api/posts", data={"title": "Viewed", "content": "Body"}, headers=auth_headers).json()
+    recent = client.get("/api/posts")
+    summary = client.get("/api/posts", params={"view": "summary"})
+    popular = client.get("/api/posts", params={"sort": "popular"})
+    portfolio = client.get("/api/portfolio")
+    titles = client.get("/api/posts", params={"fields": "title"})
+    tags = client.get("/api/posts/tags")
+
+    assert client.get(f"/api/posts/{post['id']}").status_code == 200
+    assert client.portal.call(view_counter.flush) == 1
+
+    for params, before in (({}, recent), ({"view": "summary"}, summary), ({"sort": "popular"}, popular)):
+        refreshed = client.get("/api/posts", params=params, headers={"If-None-Match": before.headers["etag"]})
+        assert refreshed.status_code == 200
+        assert refreshed.headers["etag"] != before.headers["etag"]
+        viewed = next(row for row in refreshed.json() if row["id"] == post["id"])
+        assert viewed["view_count"] == 1
+    assert client.get("/api/posts", params={"sort": "popular"}).json()[0]["id"] == post["id"]
+
+    refreshed = client.get("/api/portfolio", headers={"If-None-Match": portfolio.headers["etag"]})
+    assert refreshed.status_code == 200
+    assert next(row for row in refreshed.json()["posts"] if row["id"] == post["id"])["view_count"] == 1
+
+    # Responses without the counts keep their validators and cache entries
+    response = client.get("/api/posts", params={"fields": "title"}, headers={"If-None-Match": titles.headers["etag"]})
+    assert response.status_code == 304
+    assert client.get("/api/posts/tags", headers={"If-None-Match": tags.headers["etag"]}).status_code == 304
+    assert client.get("/api/posts", params={"fields": "title"}).headers["x-cache"] == "HIT"
+    assert client.get(f"/api/posts/{post['id']}").json()["view_count"] == 1
+
+    client.delete(f"/api/posts/{post['id']}", headers=auth_headers)